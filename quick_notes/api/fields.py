@@ -0,0 +1,138 @@
+import re
+from typing import Dict, Optional
+from urllib.parse import quote
+
+from django.urls import NoReverseMatch, get_resolver, get_script_prefix, get_urlconf, reverse as django_reverse
+from django.utils.http import RFC3986_SUBDELIMS
+from rest_framework import serializers
+from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
+
+
+# Stands in for the lookup value while a route is reversed into a template. Matches the `str` and `slug` converters.
+PLACEHOLDER = 'urltemplateplaceholder'
+# Characters `reverse()` leaves unquoted in URL arguments, the `pchar` of RFC 3986
+SAFE_CHARACTERS = RFC3986_SUBDELIMS + '/~:@'
+
+
+class URLTemplate:
+    '''
+    A URL of a route with a single argument, split around the argument.
+
+    `build` substitutes a value the way `reverse()` does: converted by the argument's converter, checked against
+    its pattern and quoted. It returns None for a value `reverse()` would not take.
+    '''
+    __slots__ = ('head', 'tail', 'converter', 'regex')
+
+    def __init__(self, head: str, tail: str, converter):
+        self.head = head
+        self.tail = tail
+        self.converter = converter
+        self.regex = re.compile(converter.regex)
+
+    def __repr__(self):
+        return f"URLTemplate: {self.head}<{self.converter.__class__.__name__}>{self.tail}"
+
+    def with_base_url(self, base_url: str) -> "URLTemplate":
+        '''Returns the template of the absolute URL under `base_url`, a scheme and host'''
+        return URLTemplate(base_url + self.head, self.tail, self.converter)
+
+    def build(self, value) -> Optional[str]:
+        try:
+            # Formatted into the route with `%s` by `reverse()`
+            text = str(self.converter.to_url(value))
+        except ValueError:
+            return None
+        if self.regex.fullmatch(text) is None:
+            return None
+        return self.head + quote(text, safe=SAFE_CHARACTERS) + self.tail
+
+
+# Templates of paths by route, URL conf and script prefix, None for routes that cannot be templated
+_url_templates: Dict[tuple, Optional[URLTemplate]] = {}
+
+
+def get_url_template(view_name: str, kwarg: str) -> Optional[URLTemplate]:
+    '''
+    Returns the template of the path of `view_name` with its `kwarg` argument, resolved once per process.
+
+    Returns None for routes with other arguments or patterns, which are left to `reverse()`.
+    '''
+    key = (view_name, kwarg, get_urlconf(), get_script_prefix())
+    if key in _url_templates:
+        return _url_templates[key]
+
+    template = None
+    possibilities = get_resolver(key[2]).reverse_dict.getlist(view_name)
+    if len(possibilities) == 1:
+        possibility, pattern, defaults, converters = possibilities[0]
+        if len(possibility) == 1 and possibility[0][1] == [kwarg] and not defaults and kwarg in converters:
+            try:
+                path = django_reverse(view_name, kwargs={kwarg: PLACEHOLDER})
+            except NoReverseMatch:
+                path = ''
+            # A path starting with the argument may be escaped by `reverse()`, so as not to be a scheme relative URL
+            if path.count(PLACEHOLDER) == 1 and not path.startswith('/' + PLACEHOLDER):
+                head, tail = path.split(PLACEHOLDER)
+                template = URLTemplate(head, tail, converters[kwarg])
+
+    _url_templates[key] = template
+    return template
+
+
+def get_request_url_template(view_name: str, kwarg: str, request) -> Optional[URLTemplate]:
+    '''
+    Returns the template of the absolute URL of `view_name` for the host of `request`, resolved once per request.
+
+    Returns None when the request changes URLs, through its versioning scheme or format override parameter.
+    '''
+    templates = request.__dict__.get('_url_templates', None)
+    if templates is None:
+        templates = request._url_templates = {}
+    key = (view_name, kwarg)
+    if key in templates:
+        return templates[key]
+
+    template = get_url_template(view_name, kwarg)
+    format_override = api_settings.URL_FORMAT_OVERRIDE
+    if getattr(request, 'versioning_scheme', None) is not None or (format_override and format_override in request.GET):
+        template = None
+    if template is not None:
+        # Absolute URLs are the request's scheme and host followed by the path, see `HttpRequest.build_absolute_uri`
+        template = template.with_base_url(request.build_absolute_uri('/')[:-1])
+    templates[key] = template
+    return template
+
+
+def reverse_templated(view_name: str, kwarg: str, value, request=None) -> str:
+    '''
+    Returns the URL of `view_name` with `kwarg` set to `value`, as `rest_framework.reverse.reverse` does.
+
+    The URL is filled in from a template of the route, resolved once per process, and of the request's host,
+    resolved once per request. Falls back to `reverse` for what templates do not cover.
+    '''
+    if request is None:
+        template = get_url_template(view_name, kwarg)
+    else:
+        template = get_request_url_template(view_name, kwarg, request)
+    if template is not None:
+        url = template.build(value)
+        if url is not None:
+            return url
+    return reverse(view_name, kwargs={kwarg: value}, request=request)
+
+
+class TemplatedHyperlinkedIdentityField(serializers.HyperlinkedIdentityField):
+    '''
+    `HyperlinkedIdentityField` building its URLs from a template of its route instead of reversing it for each object.
+
+    URLs are those of `reverse()`. URLs with a format suffix are reversed.
+    '''
+
+    def get_url(self, obj, view_name, request, format):
+        if format is not None:
+            return super().get_url(obj, view_name, request, format)
+        # Unsaved objects will not yet have a valid URL
+        if hasattr(obj, 'pk') and obj.pk in (None, ''):
+            return None
+        return reverse_templated(view_name, self.lookup_url_kwarg, getattr(obj, self.lookup_field), request)
@@ -1,7 +1,11 @@
+from typing import FrozenSet, Optional, Tuple
+
 from django.db import models
 from rest_framework import serializers, exceptions
 from django.contrib.auth import get_user_model
 
+from .trigrams import get_similarity_threshold
+
 User = get_user_model()
 
 
@@ -26,6 +30,40 @@ class UserQuerySetMixin():
         return qs.filter(owner=self.request.user)
 
 
+class SparseFieldsMixin():
+    '''
+    Trims serialized objects to the fields named by `?fields=`, less the fields named by `?exclude=`.
+
+    Both take a comma separated list of field names. The names are passed to serializers in the `sparse_fields` context,
+    see `api.serializers.SparseFieldsetMixin`, which rejects unknown names. `is_field_requested` tells views
+    whether a field is serialized, so that they skip the queries behind the others.
+    '''
+
+    def get_sparse_fields(self) -> Optional[Tuple[Optional[FrozenSet[str]], FrozenSet[str]]]:
+        '''Returns the `(fields, exclude)` names requested, `fields` being None when all are, or None when no field is left out'''
+        if not hasattr(self, '_sparse_fields'):
+            fields, exclude = (self.request.GET.get(param, None) for param in ('fields', 'exclude'))
+            if fields is None and exclude is None:
+                self._sparse_fields = None
+            else:
+                fields = None if fields is None else frozenset(filter(None, (name.strip() for name in fields.split(','))))
+                exclude = frozenset(filter(None, (name.strip() for name in (exclude or '').split(','))))
+                self._sparse_fields = (fields, exclude)
+        return self._sparse_fields
+
+    def is_field_requested(self, name: str) -> bool:
+        sparse_fields = self.get_sparse_fields()
+        if sparse_fields is None:
+            return True
+        fields, exclude = sparse_fields
+        return (fields is None or name in fields) and name not in exclude
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['sparse_fields'] = self.get_sparse_fields()
+        return context
+
+
 class AllowOwnerOnlyMixin():
     '''
         Allows only the `User` that owns the object to access the object.
@@ -75,3 +113,34 @@ class AllowUserOnlyMixin():
 
 
 
+class FuzzySearchMixin():
+    '''
+    Searches a queryset with its `search` method, or with its `fuzzy_search` method to tolerate misspellings.
+
+    - `?fuzzy=` takes `auto`, the default, to only search fuzzily when the plain search finds nothing,
+    `true` to always search fuzzily, or `false` to never do.
+    - `?threshold=` takes the lowest trigram similarity, from 0 to 1, of the words matched by a fuzzy search.
+
+    `fuzzy_threshold` is set to the threshold used when the search was fuzzy, and to None otherwise.
+    '''
+    fuzzy_choices = ('auto', 'true', 'false')
+    fuzzy_threshold = None
+
+    def search(self, qs: models.QuerySet, query: str, **kwargs) -> models.QuerySet:
+        fuzzy = self.request.GET.get('fuzzy', 'auto').lower()
+        if fuzzy not in self.fuzzy_choices:
+            raise exceptions.ValidationError(f"Invalid `fuzzy` value: {fuzzy}")
+
+        threshold = self.request.GET.get('threshold', None)
+        try:
+            threshold = get_similarity_threshold(float(threshold) if threshold is not None else None)
+        except ValueError:
+            raise exceptions.ValidationError(f"Invalid `threshold` value: {threshold}")
+
+        if fuzzy != 'true':
+            results = qs.search(query, **kwargs)
+            if fuzzy == 'false' or results.exists():
+                return results
+
+        self.fuzzy_threshold = threshold
+        return qs.fuzzy_search(query, threshold=threshold, **kwargs)
@@ -0,0 +1,189 @@
+import base64
+import binascii
+import datetime
+import decimal
+import json
+from typing import List, Optional, Tuple
+
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured, ValidationError
+from django.db import models
+from rest_framework import exceptions, pagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor_value(value):
+    '''JSON value of a field value, exact for datetimes, unlike `DjangoJSONEncoder` which drops their microseconds'''
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+class KeysetPagination(pagination.BasePagination):
+    '''
+    Paginates by the values of the last row of a page instead of an offset, so every page is read from an index seek.
+
+    Follows the ordering of the queryset, or of its model, with the primary key added as a tiebreaker.
+    Ordering fields must be fields of the model. Nullable fields order their nulls as the lowest values.
+
+    `?cursor=` takes the opaque cursors of the `next` and `previous` links, and `?limit=` the page size.
+    Pages are not counted.
+    '''
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    invalid_cursor_message = "Invalid cursor"
+
+    def get_page_size(self, request) -> int:
+        page_size = api_settings.PAGE_SIZE
+        if self.page_size_query_param in request.query_params:
+            try:
+                page_size = int(request.query_params[self.page_size_query_param])
+            except ValueError:
+                raise exceptions.ValidationError(f"Invalid `{self.page_size_query_param}` value")
+            if page_size < 1:
+                raise exceptions.ValidationError(f"`{self.page_size_query_param}` should be at least 1")
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, queryset: models.QuerySet) -> List[Tuple[models.Field, bool]]:
+        '''Returns the `(field, descending)` pairs the queryset is ordered by, ending with the primary key'''
+        opts = queryset.model._meta
+        names = queryset.query.order_by or (opts.ordering if queryset.query.default_ordering else ())
+        ordering = []
+        for name in names:
+            if not isinstance(name, str):
+                raise ImproperlyConfigured(f"{self.__class__.__name__} only follows orderings by field names, not {name!r}")
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            try:
+                field = opts.pk if name == 'pk' else opts.get_field(name)
+            except FieldDoesNotExist:
+                raise ImproperlyConfigured(f"{self.__class__.__name__} only follows orderings by fields of {opts.label}, not {name!r}")
+            if field not in [existing for existing, _ in ordering]:
+                ordering.append((field, descending))
+            if field.primary_key:
+                break
+        else:
+            ordering.append((opts.pk, False))
+        return ordering
+
+    def get_order_by(self, ordering, reverse: bool) -> list:
+        order_by = []
+        for field, descending in ordering:
+            descending = descending != reverse
+            if field.null:
+                # Nulls are the lowest values on every database
+                expression = models.F(field.attname)
+                order_by.append(expression.desc(nulls_last=True) if descending else expression.asc(nulls_first=True))
+            else:
+                order_by.append(f"{'-' if descending else ''}{field.attname}")
+        return order_by
+
+    def get_keyset_filter(self, ordering, values: list, reverse: bool) -> models.Q:
+        '''Returns the filter of the rows after `values` in the ordering, or before them when `reverse` is set'''
+        keyset = models.Q(pk__in=[])
+        equal = models.Q()
+        for (field, descending), value in zip(ordering, values):
+            name = field.attname
+            descending = descending != reverse
+            if value is None:
+                # Nulls come first in ascending order, and last in descending order
+                after = models.Q(**{f'{name}__isnull': False}) if not descending else None
+                same = models.Q(**{f'{name}__isnull': True})
+            else:
+                after = models.Q(**{f'{name}__{"lt" if descending else "gt"}': value})
+                if field.null and descending:
+                    after |= models.Q(**{f'{name}__isnull': True})
+                same = models.Q(**{name: value})
+            if after is not None:
+                keyset |= equal & after
+            equal &= same
+
+        # Implied by the filter, bounds the first field so that databases seek the index to the cursor
+        field, descending = ordering[0]
+        if values[0] is not None and not field.null:
+            keyset &= models.Q(**{f'{field.attname}__{"lte" if descending != reverse else "gte"}': values[0]})
+        return keyset
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor[1]
+
+        queryset = queryset.order_by(*self.get_order_by(self.ordering, reverse))
+        if cursor is not None:
+            queryset = queryset.filter(self.get_keyset_filter(self.ordering, cursor[0], reverse))
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        # A previous page was read backwards from the first row of a following page
+        has_next = has_more if not reverse else True
+        has_previous = cursor is not None if not reverse else has_more
+        self.next_position = self.get_position(rows[-1]) if rows and has_next else None
+        self.previous_position = self.get_position(rows[0]) if rows and has_previous else None
+        return rows
+
+    def get_position(self, row) -> list:
+        return [encode_cursor_value(getattr(row, field.attname)) for field, _ in self.ordering]
+
+    def decode_cursor(self, request) -> Optional[Tuple[list, bool]]:
+        '''Returns the position and direction of the request's cursor, or None on the first page'''
+        encoded = request.query_params.get(self.cursor_query_param, None)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            position, reverse = data['p'], bool(data.get('r', False))
+            if not isinstance(position, list) or len(position) != len(self.ordering):
+                raise ValueError
+            values = [
+                None if value is None else field.to_python(value)
+                for (field, _), value in zip(self.ordering, position)
+            ]
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError, binascii.Error, ValidationError):
+            raise exceptions.NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def encode_cursor(self, position: list, reverse: bool) -> str:
+        data = {'p': position}
+        if reverse:
+            data['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode('ascii')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self) -> Optional[str]:
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, reverse=False)
+
+    def get_previous_link(self) -> Optional[str]:
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,172 @@
+import inspect
+import operator
+from typing import Callable, Dict, List, Tuple
+
+from django.core.exceptions import FieldDoesNotExist, ObjectDoesNotExist
+from rest_framework import exceptions, fields as drf_fields, serializers
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+
+
+# Converters of field types whose `to_representation` only calls the converter on the attribute.
+# Subclasses are not included, as they may override it.
+FIELD_CONVERTERS: Dict[type, Callable] = {
+    drf_fields.CharField: str,
+    drf_fields.SlugField: str,
+    drf_fields.EmailField: str,
+    drf_fields.URLField: str,
+    drf_fields.IntegerField: int,
+}
+
+# Kinds of entries of a representation plan
+ATTRIBUTE = 'attribute'
+METHOD = 'method'
+GENERIC = 'generic'
+
+
+def get_source_getter(model, source_attrs: List[str]):
+    '''
+    Returns an `attrgetter` of `source_attrs` on instances of `model`, or None when DRF's `get_attribute` is needed.
+
+    That is when the source cannot be followed through the model's fields and relations,
+    or may be a method, which DRF calls.
+    '''
+    if not source_attrs or model is None:
+        return None
+    for index, attr in enumerate(source_attrs):
+        if model is None or inspect.isroutine(getattr(model, attr, None)):
+            return None
+        if index < len(source_attrs) - 1:
+            try:
+                model = model._meta.get_field(attr).related_model
+            except FieldDoesNotExist:
+                return None
+    return operator.attrgetter('.'.join(source_attrs))
+
+
+class CompiledRepresentationMixin():
+    '''
+    Serializes instances through a flattened plan of the serializer's readable fields, built once per serializer class.
+
+    The output is that of `Serializer.to_representation`. The plan reads model attributes directly
+    and converts them with the converter of their field type, calls the methods of `SerializerMethodField`s
+    directly, and runs the other fields through their `get_attribute` and `to_representation`.
+
+    Set `compiled_representation = False` to serialize through `Serializer.to_representation`.
+    '''
+    compiled_representation = True
+    # Plans by serializer class and readable field names, shared by all serializers
+    _representation_plans: Dict[tuple, Tuple[tuple, ...]] = {}
+
+    def get_representation_plan(self) -> Tuple[tuple, ...]:
+        '''Returns `(field name, kind, getter)` entries for the readable fields of the serializer'''
+        readable = [field for field in self.fields.values() if not field.write_only]
+        key = (self.__class__, tuple(field.field_name for field in readable))
+        plan = self._representation_plans.get(key, None)
+        if plan is not None:
+            return plan
+
+        model = getattr(getattr(self, 'Meta', None), 'model', None)
+        entries = []
+        for field in readable:
+            if isinstance(field, serializers.SerializerMethodField):
+                entries.append((field.field_name, METHOD, None))
+                continue
+
+            getter = None
+            if type(field).get_attribute is drf_fields.Field.get_attribute and field.source != '*':
+                getter = get_source_getter(model, field.source_attrs)
+            entries.append((field.field_name, ATTRIBUTE if getter is not None else GENERIC, getter))
+
+        plan = self._representation_plans[key] = tuple(entries)
+        return plan
+
+    def get_representation_writers(self) -> List[tuple]:
+        '''Binds the plan to the fields and methods of this serializer'''
+        writers = []
+        for name, kind, getter in self.get_representation_plan():
+            field = self.fields[name]
+            if kind == METHOD:
+                writers.append((name, kind, getattr(self, field.method_name), field))
+            elif kind == ATTRIBUTE:
+                converter = FIELD_CONVERTERS.get(type(field), field.to_representation)
+                if type(field) in (drf_fields.ReadOnlyField, drf_fields.JSONField) and not getattr(field, 'binary', False):
+                    converter = None
+                writers.append((name, kind, getter, converter, field))
+            else:
+                writers.append((name, kind, field))
+        return writers
+
+    def to_representation(self, instance):
+        if not self.compiled_representation:
+            return super().to_representation(instance)
+
+        writers = self.__dict__.get('_representation_writers', None)
+        if writers is None:
+            writers = self._representation_writers = self.get_representation_writers()
+
+        ret = {}
+        for writer in writers:
+            kind = writer[1]
+            if kind == METHOD:
+                ret[writer[0]] = writer[2](instance)
+                continue
+
+            if kind == ATTRIBUTE:
+                name, _, getter, converter, field = writer
+                try:
+                    attribute = getter(instance)
+                except (AttributeError, KeyError, ObjectDoesNotExist):
+                    # Handled as DRF does, which may skip the field or use its default
+                    try:
+                        attribute = field.get_attribute(instance)
+                    except SkipField:
+                        continue
+                    if attribute is not None and converter is not None:
+                        attribute = field.to_representation(attribute)
+                    ret[name] = attribute
+                    continue
+                if attribute is None or converter is None:
+                    ret[name] = attribute
+                else:
+                    ret[name] = converter(attribute)
+                continue
+
+            name, _, field = writer
+            try:
+                attribute = field.get_attribute(instance)
+            except SkipField:
+                continue
+            check_for_none = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+            ret[name] = None if check_for_none is None else field.to_representation(attribute)
+        return ret
+
+
+class SparseFieldsetMixin():
+    '''
+    Trims the fields of the serializer to those requested in the `sparse_fields` context, see `api.mixins.SparseFieldsMixin`.
+
+    The context holds the `(fields, exclude)` names requested, `fields` being None when all fields are.
+    Unrequested read only fields are removed, and other unrequested fields are still read from input but not written out.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        sparse_fields = self.context.get('sparse_fields', None)
+        if sparse_fields is not None:
+            self.trim_fields(*sparse_fields)
+
+    def trim_fields(self, fields, exclude):
+        readable = [name for name, field in self.fields.items() if not field.write_only]
+        for param, names in (('fields', fields), ('exclude', exclude)):
+            for name in names or ():
+                if name not in readable:
+                    raise exceptions.ValidationError(f"Invalid `{param}` value: {name}")
+
+        for name in readable:
+            if (fields is None or name in fields) and name not in exclude:
+                continue
+            if self.fields[name].read_only:
+                self.fields.pop(name)
+            else:
+                self.fields[name].write_only = True
@@ -1,3 +1,49 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, override_settings
+from django.urls import NoReverseMatch
+from rest_framework.request import Request
+from rest_framework.reverse import reverse
+from rest_framework.test import APIRequestFactory
 
-# Create your tests here.
+from .fields import reverse_templated
+
+
+class ReverseTemplatedTestCase(SimpleTestCase):
+    routes = [
+        ('note-detail', 'slug'),
+        ('note-update', 'slug'),
+        ('note-delete', 'slug'),
+        ('account-detail', 'username'),
+        ('account-update', 'username'),
+    ]
+    values = ['plain', 'with space', 'fifty%', '100%25', 'a/b', 'trailing/', 'zoë', 'ユーザー', 'emoji 🙂', '@user.name+x-y_z', '']
+
+    def assert_same_url(self, view_name: str, kwarg: str, value, request):
+        try:
+            expected = reverse(view_name, kwargs={kwarg: value}, request=request)
+        except NoReverseMatch:
+            with self.assertRaises(NoReverseMatch):
+                reverse_templated(view_name, kwarg, value, request)
+        else:
+            self.assertEqual(reverse_templated(view_name, kwarg, value, request), expected)
+
+    def test_matches_reverse_without_request(self):
+        for view_name, kwarg in self.routes:
+            for value in self.values:
+                with self.subTest(view_name=view_name, value=value):
+                    self.assert_same_url(view_name, kwarg, value, None)
+
+    @override_settings(ALLOWED_HOSTS=['notes.example.com'])
+    def test_matches_reverse_with_request(self):
+        # Templates are kept on the request, so later values are filled in from the template of the first
+        request = Request(APIRequestFactory().get('/api/notes/', HTTP_HOST='notes.example.com:8000'))
+        for view_name, kwarg in self.routes:
+            for value in self.values:
+                with self.subTest(view_name=view_name, value=value):
+                    self.assert_same_url(view_name, kwarg, value, request)
+        self.assertTrue(all(template is not None for template in request._url_templates.values()))
+
+    def test_matches_reverse_with_secure_request(self):
+        request = Request(APIRequestFactory().get('/api/notes/', secure=True))
+        for value in self.values:
+            with self.subTest(value=value):
+                self.assert_same_url('account-detail', 'username', value, request)
@@ -0,0 +1,68 @@
+import math
+import re
+import unicodedata
+from typing import Dict, List, Sequence
+
+from django.conf import settings
+from django.db import models
+from django.db.models.functions import Cast
+
+
+WORD_PATTERN = re.compile(r"\w+")
+DEFAULT_SIMILARITY_THRESHOLD = 0.3
+
+
+def split_words(text: str) -> List[str]:
+    '''Splits `text` into lowercase words'''
+    return WORD_PATTERN.findall(unicodedata.normalize('NFKC', text).casefold())
+
+
+def get_trigrams(word: str) -> frozenset:
+    '''
+    Returns the trigrams of `word`, padded as in PostgreSQL's pg_trgm.
+
+    Words are padded with two spaces before and one after, so "cat" has the trigrams
+    "  c", " ca", "cat" and "at ".
+    '''
+    padded = f"  {word} "
+    return frozenset(padded[index:index + 3] for index in range(len(padded) - 2))
+
+
+def similarity(first: str, second: str) -> float:
+    '''Returns the share of their trigrams that two words have in common, from 0 to 1'''
+    first, second = get_trigrams(first), get_trigrams(second)
+    return len(first & second) / len(first | second)
+
+
+def get_similarity_threshold(threshold: float = None) -> float:
+    '''Returns `threshold`, or `settings.TRIGRAM_SIMILARITY_THRESHOLD` if it is None'''
+    if threshold is None:
+        threshold = getattr(settings, 'TRIGRAM_SIMILARITY_THRESHOLD', DEFAULT_SIMILARITY_THRESHOLD)
+    if not 0 < threshold <= 1:
+        raise ValueError("A similarity threshold should be greater than 0 and at most 1")
+    return threshold
+
+
+def find_similar(postings: models.QuerySet, word: str, threshold: float, fields: Sequence[str], limit: int = None) -> List[Dict]:
+    '''
+    Returns the indexed words of `postings` similar to `word`, as dictionaries of `fields` and their `similarity`.
+    With a `limit`, only that many of the most similar words are returned.
+
+    `postings` is a queryset of a trigram index model, with `trigram` and `trigrams_count` fields and a row
+    for each trigram of an indexed word. `fields` identify an indexed word.
+    Only the rows of the trigrams of `word`, of words long enough and short enough to reach `threshold`, are read.
+    '''
+    trigrams = get_trigrams(word)
+    count = len(trigrams)
+    # Words with `count` and `other` trigrams are at most min(count, other) / max(count, other) similar
+    lowest, highest = math.ceil(count * threshold - 1e-9), math.floor(count / threshold + 1e-9)
+
+    shared = models.Count('pk')
+    similar = postings.filter(trigram__in=trigrams, trigrams_count__range=(lowest, highest)).order_by().values(
+        *fields, 'trigrams_count'
+    ).annotate(
+        similarity=Cast(shared, models.FloatField()) / (count + models.F('trigrams_count') - shared),
+    ).filter(similarity__gte=threshold)
+    if limit is not None:
+        similar = similar.order_by('-similarity', *fields)[:limit]
+    return list(similar)
@@ -1,8 +1,13 @@
 from django.contrib import admin
 
-from .models import Note
+from .models import Note, NoteRevision, NoteSearchTerm, NoteIndexJob, NoteCollectionVersion, NoteCollectionSize
 
 
 admin.site.register(Note)
+admin.site.register(NoteRevision)
+admin.site.register(NoteSearchTerm)
+admin.site.register(NoteIndexJob)
+admin.site.register(NoteCollectionVersion)
+admin.site.register(NoteCollectionSize)
 
 # Register your models here.
@@ -6,4 +6,9 @@ class NotesConfig(AppConfig):
     name = 'notes'
 
     def ready(self):
+        from django.db.models.signals import post_delete
+        from .signals import count_deleted_note, remove_deleted_note
+
+        post_delete.connect(remove_deleted_note, sender=self.get_model('Note'), dispatch_uid='notes.remove_deleted_note')
+        post_delete.connect(count_deleted_note, sender=self.get_model('Note'), dispatch_uid='notes.count_deleted_note')
         return super().ready()
@@ -0,0 +1,123 @@
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Hashable, Iterable, Optional
+
+from .conf import get_setting
+
+
+
+class CachedSearch:
+    '''The ordered note ids of a search's results, as of `version` of the owner's notes'''
+    __slots__ = ('version', 'ids', 'fuzzy_threshold')
+
+    def __init__(self, version: int, ids: Iterable[int], fuzzy_threshold: float = None):
+        self.version = version
+        # An array of 8-byte integers, rather than a list of int objects, keeps the size of an entry down
+        self.ids = array('q', ids)
+        self.fuzzy_threshold = fuzzy_threshold
+
+    @property
+    def size(self) -> int:
+        '''Cost of the entry towards `SEARCH_CACHE_MAX_IDS`, counting one for the entry itself'''
+        return len(self.ids) + 1
+
+
+class SearchResultCache:
+    '''
+    Least recently used cache of note search results, for paging through them without searching again.
+
+    Entries are kept under keys of the owner and the normalized search, along with the version of the owner's notes
+    they were computed at. An entry from an older version is a miss, so saving or deleting a note invalidates every
+    search of its owner. The total number of cached ids is bounded by `NOTES_CONFIG["SEARCH_CACHE_MAX_IDS"]`.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __repr__(self):
+        return f"SearchResultCache: {self.as_dict()}"
+
+    def get(self, key: Hashable, version: int) -> Optional[CachedSearch]:
+        '''Returns the entry of `key` if it was cached at `version`, and None otherwise'''
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None or entry.version != version:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key: Hashable, entry: CachedSearch):
+        '''Caches `entry` under `key`, evicting the least recently used entries to make room for it'''
+        max_size = get_setting("SEARCH_CACHE_MAX_IDS")
+        if entry.size > max_size:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while self._entries and self.size + entry.size > max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            self._entries[key] = entry
+            self.size += entry.size
+
+    def _remove(self, key: Hashable):
+        self.size -= self._entries.pop(key).size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def reset(self):
+        '''Clears the cache and its counters'''
+        with self._lock:
+            self._entries.clear()
+            self.size = self.hits = self.misses = self.evictions = 0
+
+    def as_dict(self):
+        return {
+            "entries": len(self._entries),
+            "size": self.size,
+            "max_size": get_setting("SEARCH_CACHE_MAX_IDS"),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+search_cache = SearchResultCache()
+
+
+class CachedSearchResults:
+    '''
+    The notes of a cached search, fetched by id a page at a time.
+
+    Pagination classes read its length and slice it like a queryset. Only the notes of a slice are queried,
+    and they are returned in the cached order.
+    '''
+
+    def __init__(self, ids: array, queryset):
+        self.ids = ids
+        self.queryset = queryset
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0] if index >= 0 else self[len(self) + index]
+        ids = self.ids[index]
+        notes = self.queryset.in_bulk(list(ids))
+        return [notes[pk] for pk in ids if pk in notes]
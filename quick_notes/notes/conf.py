@@ -0,0 +1,35 @@
+from django.conf import settings
+
+
+DEFAULTS = {
+    # A full snapshot is stored every `REVISION_SNAPSHOT_INTERVAL` revisions, with deltas in between
+    "REVISION_SNAPSHOT_INTERVAL": 20,
+    # Limits enforced by `notes.parsers.NoteJSONParser` while it parses a note payload
+    "CONTENT_MAX_BYTES": 5 * 1024 * 1024,
+    "CONTENT_MAX_ITEMS": 10000,
+    "CONTENT_MAX_DEPTH": 8,
+    # Dotted path of the `notes.search.SearchBackend` used by `Note.objects.search`
+    "SEARCH_BACKEND": "notes.search.IndexSearchBackend",
+    # Most terms a term of a fuzzy search is expanded to, keeping the most similar ones
+    "FUZZY_MAX_EXPANSIONS": 50,
+    # Whether saved notes are indexed for search by the `run_index_worker` command instead of while they are saved
+    "INDEX_IN_BACKGROUND": False,
+    # Seconds the index may fall behind before saved notes are indexed while they are saved again
+    "INDEX_QUEUE_MAX_LAG": 300,
+    # Runs of a failing index job before it is left for `run_index_worker --retry-failed`
+    "INDEX_JOB_MAX_ATTEMPTS": 5,
+    # Seconds a worker holds the jobs it claimed before other workers may claim them
+    "INDEX_JOB_LEASE": 60,
+    # Most note ids kept by the search result cache, across all its entries
+    "SEARCH_CACHE_MAX_IDS": 1_000_000,
+    # Most results of a search that is cached, larger results are searched again for every page
+    "SEARCH_CACHE_MAX_RESULTS": 10_000,
+}
+
+
+def get_setting(name: str):
+    '''Returns the value of `name` in `settings.NOTES_CONFIG`, falling back to its default'''
+    config = getattr(settings, "NOTES_CONFIG", {})
+    if name in config:
+        return config[name]
+    return DEFAULTS[name]
@@ -1,9 +1,16 @@
 from django.db import models
 from django.core.exceptions import ValidationError
 import ast
+import base64
+import json
+import threading
+import zlib
 from django.utils.translation import gettext_lazy as _
 from django import forms
 
+from .items import TextItem, ListItem, ListBlock, build_items
+from .schema import content_types, validate_text_body, validate_list_item_body, validate_list_body
+
 
 def to_list(value: str):
     '''Converts stringed list to list'''
@@ -19,67 +26,68 @@ def to_list(value: str):
         raise ValidationError("`value` could not be Evaluated")
 
 
-def validate_text_body(value: str):
-    if not isinstance(value, str):
-        raise ValidationError("Invalid content item! The `body` of an item of type `text` should be a string")
+# Compressed content is stored as a JSON string starting with the codec header, so it stays valid JSON
+COMPRESSION_HEADER = '"zlib:'
+# Characters of content text stored as a note's preview, for list responses that leave the content out
+PREVIEW_LENGTH = 200
 
 
-def validate_list_item_body(value: dict):
-    if not isinstance(value, dict):
-        raise ValidationError("Invalid content item! The `body` of an item of type `list_item` should be a dictionary")
-    if 1 > len(value) or len(value) > 2:
-        raise ValidationError("Invalid content item! `list_item` may be containing invalid keys or is missing a key")
-    
-    checked = value.get('checked', None)
-    item_value = value.get('item_value',None)
-    if checked is not None:
-        if isinstance(checked, str):
-            checked = ast.literal_eval(checked)
-        if not isinstance(checked, bool):
-            raise ValidationError("Invalid content item! `list_item` key, 'checked', is not boolean")
-            
-    if not item_value:
-        raise ValidationError("Invalid content item! `list_item` key, 'item_value', is required")
-    if item_value and not isinstance(item_value, str):
-        raise ValidationError("Invalid content item! `list_item` key, 'item_value', should be a string")
-
-
-def validate_list_body(value: dict):
-    if not isinstance(value, dict):
-        raise ValidationError("Invalid content item! The `body` of an item of type `list` should be a dictionary")
-    if len(value) != 2:
-        raise ValidationError("Invalid content item! `list` has missing key(s)")
-    
-    title = value.get('title', None)
-    list_items = value.get('list_items', None)
-    if not title:
-        raise ValidationError("Invalid content item! `list` key, 'title', is required")
-    if not list_items:
-        raise ValidationError("Invalid content item! `list` key, 'list_items', is required")
-
-    if not isinstance(title, str):
-        raise ValidationError("Invalid content item! `list` key, 'title', is not a string")
-    if not isinstance(list_items, list):
-        raise ValidationError("Invalid content item! `list` key, 'list_items', is not a list")
-
-    for item in list_items:
-        if not isinstance(item, dict):
-            raise ValidationError("Invalid list item")
-
-        _type: str = item.get('type', None)
-        _body: dict = item.get('body', None)
-        
-        if not _body:
-            raise ValidationError("list item should have 'body' attribute")
-        if not _type:
-            raise ValidationError("list item should have 'type' attribute")
-        if not isinstance(_type, str):
-            raise ValidationError("list item 'type' attribute should be a string")
-        if not _type.lower() == "list_item":
-            raise ValidationError("list item 'type' attribute is invalid")
-
-        validate_list_item_body(_body)
+def is_compressed(value: str) -> bool:
+    return value.startswith(COMPRESSION_HEADER)
+
+
+def compress_note_content(value: str, threshold: int = 0) -> str:
+    '''
+    Compresses encoded note content whose UTF-8 size is above `threshold` bytes.
+
+    Returns `value` unchanged when it is below the threshold or compression does not make it smaller.
+    '''
+    data = value.encode('utf-8')
+    if len(data) <= threshold:
+        return value
+
+    compressed = COMPRESSION_HEADER + base64.b64encode(zlib.compress(data)).decode('ascii') + '"'
+    if len(compressed) >= len(data):
+        return value
+    return compressed
+
+
+def decompress_note_content(value: str) -> str:
+    '''Returns the encoded note content held by `value`, decompressing it if needed'''
+    if not is_compressed(value):
+        return value
+    try:
+        data = base64.b64decode(value[len(COMPRESSION_HEADER):-1])
+        return zlib.decompress(data).decode('utf-8')
+    except (ValueError, zlib.error):
+        raise ValidationError("Compressed `value` could not be decompressed")
+
+
+def decode_note_content(value: str):
+    '''
+    Decodes stored note content to a list.
     
+    Accepts compact JSON text, compressed JSON text and the legacy Python-repr encoding.
+    '''
+    if not isinstance(value, str):
+        raise ValueError(" Argument `value` should be a string")
+
+    value = decompress_note_content(value)
+    try:
+        value = json.loads(value)
+    except ValueError:
+        # Rows written before the JSON storage mode hold a Python repr
+        return to_list(value)
+
+    if not isinstance(value, list):
+        raise ValidationError("Decoded `value` is not a list")
+    return value
+
+
+def encode_note_content(content: list) -> str:
+    '''Encodes note content as compact JSON text'''
+    return json.dumps(content, separators=(',', ':'), ensure_ascii=False)
+
 
 def validate_note_content(content: list[dict] | str, allowed_types: list):
     '''Validates a `NoteContent` object's content and returns it.'''
@@ -87,37 +95,10 @@ def validate_note_content(content: list[dict] | str, allowed_types: list):
         raise ValidationError("Invalid content type: {}".format(type(content)))
 
     if isinstance(content, str):
-        if not isinstance(ast.literal_eval(content), (str, list)):
-            raise ValidationError("Invalid content type: {}".format(type(ast.literal_eval(content))))
-        else:
-            content = to_list(content)
-
-    for content_item in content:
-        if not isinstance(content_item, dict):
-            raise ValidationError("Invalid content item")
-
-        _type: str = content_item.get('type', None)
-        if not _type:
-            raise ValidationError("content item should have 'type' attribute")
-        if not isinstance(_type, str):
-            raise ValidationError("content item 'type' attribute should be a string")
-        
-        _body = content_item.get('body', None)
-        if not _body:
-            raise ValidationError("content item type `%s` should have 'body' attribute" % _type)
-
-        if _type and _type.lower() in allowed_types:
-            match _type.lower():
-                case "text":
-                    validate_text_body(_body)
-                
-                case "list_item":
-                    validate_list_item_body(_body)
-
-                case "list":
-                    validate_list_body(_body)
-    return content
-        
+        content = decode_note_content(content)
+    return content_types.compile(allowed_types)(content)
+
+
 INITIAL_CONTENT_FORMAT = [
     {
         "type": "text",
@@ -159,11 +140,26 @@ INITIAL_CONTENT_FORMAT = [
 
 
 class NoteContent:
-    '''Class used to create instances for storing the content of `Note` model objects'''
+    '''
+    Class used to create instances for storing the content of `Note` model objects
+
+    The content is held as typed items (see `notes.items`). `content` returns it in the wire format.
+
+    - Pass `validated=True` for content that has already gone through `validate_note_content`, to skip validating it again.
+    '''
     allowed_content_types = ['text', 'list', 'list_item']
 
-    def __init__(self, content: list):
-        self.content = validate_note_content(content=content, allowed_types=self.allowed_content_types)
+    def __init__(self, content: list, validated: bool = False):
+        if not validated:
+            content = validate_note_content(content=content, allowed_types=self.allowed_content_types)
+        self.content = content
+
+    @classmethod
+    def from_items(cls, items: list):
+        '''Builds a `NoteContent` from already validated typed items'''
+        content = cls([], validated=True)
+        content.items = items
+        return content
 
     def __repr__(self):
         return f"NoteContent: {self.__dict__()}"
@@ -181,22 +177,17 @@ class NoteContent:
     def __getitem__(self):
         return self.__dict__()
 
-
     def __iter__(self):
-        return self
+        yield from self.items
 
-    def next(self):
-        x = 0
-        if x < len(self.content):
-            x += 1
-            return self.content[x - 1]
-        else:
-            StopIteration
+    def __len__(self):
+        return len(self.items)
 
     def __setattr__(self, __name: str, __value):
         if __name == "content":
             if isinstance(__value, str):
                 __value = validate_note_content(content=__value, allowed_types=self.allowed_content_types)
+            __name, __value = "items", build_items(__value)
 
         if __name == "allowed_content_types":
             if not isinstance(__value, (list, tuple)):
@@ -204,88 +195,225 @@ class NoteContent:
 
         return super().__setattr__(__name, __value)
 
+    @property
+    def content(self) -> list:
+        return [item.to_dict() for item in self.items]
+
+    def iter_flat(self):
+        '''Yields every item, followed by the items nested in it'''
+        for item in self.items:
+            yield from item.iter_flat()
+
     @property
     def text_contents(self):
-        text_contents = []
-        for content in self.content:
-            if content.get('type').lower() == "text":
-                text_contents.append(content)
-        return text_contents
+        return [item.to_dict() for item in self.items if isinstance(item, TextItem)]
 
     @property
     def list_items(self):
-        list_items = []
-        for content in self.content:
-            if content.get('type').lower() == "list_item":
-                list_items.append(content)
-        return list_items
+        return [item.to_dict() for item in self.items if isinstance(item, ListItem)]
 
     @property
     def lists(self):
-        lists = []
-        for content in self.content:
-            if content.get('type').lower() == "list":
-                lists.append(content)
-        return lists
+        return [item.to_dict() for item in self.items if isinstance(item, ListBlock)]
 
     @property
     def texts_count(self) -> int:
-        return len(self.text_contents)
+        return self.details["no_of_text_content"]
 
     @property
     def list_items_count(self) -> int:
-        count = len(self.list_items) 
-        for list in self.lists:
-            count += len(list['body']['list_items'])
-        return count
+        return self.details["no_of_list_items"]
 
     @property
     def lists_count(self) -> int:
-        return len(self.lists)
+        return self.details["no_of_lists"]
 
     @property
-    def approximate_word_count(self) -> int:
-        count = 0
-        texts = self.text_contents
-        list_items = self.list_items
-        lists = self.lists
+    def unchecked_items_count(self) -> int:
+        return self.details["no_of_unchecked_items"]
 
-        for text in texts:
-            count += len((text.get('body')).split('\s'))
-        
-        for list_item in list_items:
-            count += len((list_item['body']['item_value']).split('\s'))
-
-        for list in lists:
-            count += len((list['body']['title']).split('\s'))
-            for item in list['body']['list_items']:
-                count += len((item['body']['item_value']).split('\s'))
-        return count
+    @property
+    def approximate_word_count(self) -> int:
+        return self.details["approximate_word_count"]
+
+    def get_preview(self, length: int = PREVIEW_LENGTH) -> str:
+        '''The text of the content in order, with its whitespace collapsed, cut to at most `length` characters'''
+        texts = []
+        size = 0
+        for item in self.iter_flat():
+            text = ' '.join(item.text.split())
+            if text:
+                texts.append(text)
+                size += len(text) + 1
+            if size > length:
+                break
+
+        preview = ' '.join(texts)
+        if len(preview) <= length:
+            return preview
+        return preview[:length - 1].rstrip() + '…'
 
     @property
     def details(self):
+        '''Content statistics, computed in a single pass over the content'''
+        texts_count = list_items_count = unchecked_items_count = lists_count = word_count = 0
+
+        for item in self.items:
+            item_class = item.__class__
+            if item_class is ListBlock:
+                lists_count += 1
+                list_items_count += len(item.items)
+                word_count += len(item.title.split())
+                for list_item in item.items:
+                    word_count += len(list_item.item_value.split())
+                    unchecked_items_count += not list_item.is_checked
+
+            elif item_class is ListItem:
+                list_items_count += 1
+                word_count += len(item.item_value.split())
+                unchecked_items_count += not item.is_checked
+
+            elif item_class is TextItem:
+                texts_count += 1
+                word_count += len(item.body.split())
+
         details = {
-            "no_of_text_content": self.texts_count,
-            "no_of_list_items": self.list_items_count,
-            "no_of_lists": self.lists_count,
-            "approximate_word_count": self.approximate_word_count,
+            "no_of_text_content": texts_count,
+            "no_of_list_items": list_items_count,
+            "no_of_lists": lists_count,
+            "no_of_unchecked_items": unchecked_items_count,
+            "approximate_word_count": word_count,
         }
         return details
 
 
+
+class ContentLoadStats:
+    '''Counts `LazyNoteContent` objects loaded from the database and how many of them were materialized'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.loaded = 0
+        self.materialized = 0
+
+    def __repr__(self):
+        return f"ContentLoadStats: {self.as_dict()}"
+
+    def record_load(self):
+        with self._lock:
+            self.loaded += 1
+
+    def record_materialization(self):
+        with self._lock:
+            self.materialized += 1
+
+    def reset(self):
+        with self._lock:
+            self.loaded = 0
+            self.materialized = 0
+
+    def as_dict(self):
+        return {
+            "loaded": self.loaded,
+            "materialized": self.materialized,
+        }
+
+
+content_load_stats = ContentLoadStats()
+
+
+class LazyNoteContent(NoteContent):
+    '''
+    `NoteContent` built from a raw database value. 
+    
+    The value is only decoded and validated the first time `content`,
+    or any property derived from it, is accessed.
+    '''
+    stats = content_load_stats
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.stats.record_load()
+
+    def __repr__(self):
+        if not self.is_materialized:
+            return "LazyNoteContent: <not materialized>"
+        return super().__repr__()
+
+    def __getattr__(self, __name: str):
+        # Only reached when the content has not been set on the instance yet
+        if __name == "items":
+            self.materialize()
+            return self.items
+        raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{__name}'")
+
+    @property
+    def is_materialized(self) -> bool:
+        try:
+            object.__getattribute__(self, "items")
+        except AttributeError:
+            return False
+        return True
+
+    @property
+    def raw_json(self) -> str | None:
+        '''
+        The stored content as JSON text, decompressed but not decoded.
+
+        None once the content has been materialized, as it may have changed since, or if it is stored in the legacy encoding.
+        '''
+        if self.is_materialized or not isinstance(self.raw, str):
+            return None
+        value = decompress_note_content(self.raw)
+        if value == '[]' or value.startswith('[{"'):
+            return value
+        return None
+
+    def materialize(self, validate: bool = True):
+        '''
+        Decodes and validates the raw value into the content items.
         
+        Pass `validate=False` to trust the stored value, e.g. when only a few items are about to be changed.
+        '''
+        value = self.raw
+        if isinstance(value, str):
+            value = decode_note_content(value)
+        if validate:
+            value = validate_note_content(content=value, allowed_types=self.allowed_content_types)
+        self.content = value
+        self.stats.record_materialization()
+
 
 
 class NoteContentField(models.TextField):
     '''
     Takes in an appropriate string or dict representation of the note content. 
     Saves the note content in the database as a string. 
+    Values read from the database are returned as `LazyNoteContent` objects.
+
+    - The `storage` argument sets how the content is encoded in the database.
+    `"repr"` stores the Python representation of the content while `"json"` stores
+    compact JSON, using the database's JSON column type where one exists.
+    - With `compress=True`, JSON content larger than `compress_threshold` bytes is stored zlib-compressed.
+    Smaller content is stored plain so that it stays cheap to read.
     
     Returns a `NoteContent` object.
     '''
     description = _("Field that stores a `NoteContent`")
+    STORAGE_REPR = "repr"
+    STORAGE_JSON = "json"
+    storage_modes = (STORAGE_REPR, STORAGE_JSON)
+    default_compress_threshold = 1024
+
+    def __init__(self, *args, storage: str = STORAGE_REPR, compress: bool = False, compress_threshold: int = default_compress_threshold, **kwargs):
+        if storage not in self.storage_modes:
+            raise ValueError("Invalid storage mode: {}".format(storage))
+        if compress and storage != self.STORAGE_JSON:
+            raise ValueError("Compression requires the `json` storage mode")
+        self.storage = storage
+        self.compress = compress
+        self.compress_threshold = compress_threshold
 
-    def __init__(self, *args, **kwargs):
         if not kwargs.get('default', None):
             kwargs.update({"default": INITIAL_CONTENT_FORMAT})
 
@@ -293,13 +421,27 @@ class NoteContentField(models.TextField):
             kwargs.update({"help_text": "Construct your note content using the default format provided in the field."})
         return super().__init__(*args, **kwargs)
 
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.storage != self.STORAGE_REPR:
+            kwargs['storage'] = self.storage
+        if self.compress:
+            kwargs['compress'] = self.compress
+        if self.compress_threshold != self.default_compress_threshold:
+            kwargs['compress_threshold'] = self.compress_threshold
+        return name, path, args, kwargs
+
     def db_type(self, connection) -> str:
+        if self.storage == self.STORAGE_JSON and connection.vendor != 'sqlite':
+            data_type = connection.data_types.get('JSONField', None)
+            if data_type:
+                return data_type % self.db_type_parameters(connection)
         return super().db_type(connection)
 
     def from_db_value(self, value, expression, connection) -> NoteContent:
         if value is None:
             return value
-        return NoteContent(value)
+        return LazyNoteContent(value)
 
     def to_python(self, value) -> NoteContent:
         if isinstance(value, NoteContent):
@@ -307,19 +449,39 @@ class NoteContentField(models.TextField):
 
         if value is None:
             return value
+        if isinstance(value, str):
+            value = decode_note_content(value)
         return NoteContent(value)
 
     def validate(self, value, model_instance):
+        # `NoteContent` objects hold content that was validated when they were built
+        if isinstance(value, NoteContent):
+            return
         try:
-            _ = NoteContent(value)
+            _ = self.to_python(value)
         except ValidationError:
             raise ValidationError("value provided is invalid")
 
+    def pre_save(self, model_instance, add):
+        # Keep the validated `NoteContent` on the instance so it is not validated again on later saves
+        value = self.to_python(getattr(model_instance, self.attname))
+        setattr(model_instance, self.attname, value)
+        return value
+
 
     def get_prep_value(self, value) -> str:
         if value is None:
             return value
-        return NoteContent(value).__str__()
+        content = self.to_python(value)
+        if self.storage == self.STORAGE_JSON:
+            return self.pack(encode_note_content(content.content))
+        return content.__str__()
+
+    def pack(self, value: str) -> str:
+        '''Returns JSON encoded content as it should be stored, compressed if the field compresses it'''
+        if self.compress:
+            return compress_note_content(value, self.compress_threshold)
+        return value
 
     def get_db_prep_value(self, value, connection, prepared=False) -> str:
         return super().get_db_prep_value(value, connection, prepared)
@@ -327,11 +489,28 @@ class NoteContentField(models.TextField):
 
     def value_to_string(self, obj) -> str:
         value = self.value_from_object(obj)
-        if isinstance(value, NoteContent):
-            return value.__str__()
         return self.get_prep_value(value)
 
 
     def formfield(self, **kwargs):
         kwargs.update({'form_class': forms.JSONField})
-        return super().formfield(**kwargs)
\ No newline at end of file
+        return super().formfield(**kwargs)
+
+
+class FTSTableField(models.TextField):
+    '''
+    The hidden column of an SQLite FTS5 table that is named after the table.
+
+    Full-text queries are matched against it with the `match` lookup, and it is the argument
+    that the auxiliary functions of FTS5, such as `bm25()` and `snippet()`, take.
+    '''
+
+
+@FTSTableField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', [*lhs_params, *rhs_params]
@@ -0,0 +1,208 @@
+from typing import Dict, Iterable, Iterator, List, Optional
+
+
+
+class ContentItem:
+    '''
+    Base class of the typed items held by a `NoteContent`.
+
+    Items round-trip losslessly to the wire format, `{"type": ..., "body": ...}`.
+    A `type` spelt differently from `type_name`, e.g. "Text", is kept in `raw_type`,
+    and keys of the item other than its type and body in `extra`.
+    '''
+    __slots__ = ('raw_type', 'extra')
+    type_name: str = None
+
+    def __init__(self, raw_type: str = None, extra: Dict = None):
+        self.raw_type = raw_type if raw_type != self.type_name else None
+        self.extra = extra or None
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}: {self.to_dict()}"
+
+    def __eq__(self, other):
+        if not isinstance(other, ContentItem):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    __hash__ = None
+
+    @property
+    def type(self) -> str:
+        return self.raw_type or self.type_name
+
+    @classmethod
+    def from_dict(cls, data: Dict):
+        raise NotImplementedError
+
+    def get_body(self):
+        raise NotImplementedError
+
+    def to_dict(self) -> Dict:
+        data = {"type": self.type, "body": self.get_body()}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def iter_flat(self) -> Iterator["ContentItem"]:
+        '''Yields the item and any items nested in it'''
+        yield self
+
+    @property
+    def text(self) -> str:
+        '''The item's own text, without that of nested items'''
+        return ""
+
+
+def get_extra(data: Dict, keys: Iterable[str]) -> Optional[Dict]:
+    '''Returns the entries of `data` whose keys are not in `keys`, or None when there are none'''
+    extra = {key: value for key, value in data.items() if key not in keys}
+    return extra or None
+
+
+# Keys of the wire format of an item
+ITEM_KEYS = ('type', 'body')
+
+
+class TextItem(ContentItem):
+    __slots__ = ('body',)
+    type_name = "text"
+
+    def __init__(self, body: str, raw_type: str = None, extra: Dict = None):
+        super().__init__(raw_type, extra)
+        self.body = body
+
+    @classmethod
+    def from_dict(cls, data: Dict):
+        return cls(data['body'], raw_type=data['type'], extra=get_extra(data, ITEM_KEYS))
+
+    def get_body(self):
+        return self.body
+
+    @property
+    def text(self):
+        return self.body
+
+
+class ListItem(ContentItem):
+    '''
+    A checklist item.
+
+    `checked` is None when the item was given without a "checked" key.
+    String booleans are kept as given; `is_checked` reads them as booleans.
+    Other keys of the body are kept in `body_extra`.
+    '''
+    __slots__ = ('item_value', 'checked', 'body_extra')
+    type_name = "list_item"
+    body_keys = ('checked', 'item_value')
+
+    def __init__(self, item_value: str, checked=None, raw_type: str = None, extra: Dict = None, body_extra: Dict = None):
+        super().__init__(raw_type, extra)
+        self.item_value = item_value
+        self.checked = checked
+        self.body_extra = body_extra or None
+
+    @classmethod
+    def from_dict(cls, data: Dict):
+        body = data['body']
+        return cls(
+            body['item_value'], checked=body.get('checked', None), raw_type=data['type'],
+            extra=get_extra(data, ITEM_KEYS), body_extra=get_extra(body, cls.body_keys),
+        )
+
+    @property
+    def is_checked(self) -> bool:
+        return self.checked is True or self.checked == 'True'
+
+    def get_body(self):
+        if self.checked is None:
+            body = {"item_value": self.item_value}
+        else:
+            body = {"checked": self.checked, "item_value": self.item_value}
+        if self.body_extra:
+            body.update(self.body_extra)
+        return body
+
+    @property
+    def text(self):
+        return self.item_value
+
+
+class ListBlock(ContentItem):
+    '''A titled list of `ListItem`s. Other keys of the body are kept in `body_extra`.'''
+    __slots__ = ('title', 'items', 'body_extra')
+    type_name = "list"
+    body_keys = ('title', 'list_items')
+
+    def __init__(self, title: str, items: List[ListItem], raw_type: str = None, extra: Dict = None, body_extra: Dict = None):
+        super().__init__(raw_type, extra)
+        self.title = title
+        self.items = items
+        self.body_extra = body_extra or None
+
+    @classmethod
+    def from_dict(cls, data: Dict):
+        body = data['body']
+        items = [ListItem.from_dict(item) for item in body['list_items']]
+        return cls(
+            body['title'], items, raw_type=data['type'],
+            extra=get_extra(data, ITEM_KEYS), body_extra=get_extra(body, cls.body_keys),
+        )
+
+    def get_body(self):
+        body = {
+            "title": self.title,
+            "list_items": [item.to_dict() for item in self.items],
+        }
+        if self.body_extra:
+            body.update(self.body_extra)
+        return body
+
+    def iter_flat(self):
+        yield self
+        yield from self.items
+
+    @property
+    def text(self):
+        return self.title
+
+
+class RawItem(ContentItem):
+    '''Item of a type that is not in `item_classes`. It is kept as given.'''
+    __slots__ = ('data',)
+
+    def __init__(self, data: Dict):
+        self.raw_type = None
+        self.extra = None
+        self.data = data
+
+    @property
+    def type(self) -> str:
+        return self.data['type']
+
+    @classmethod
+    def from_dict(cls, data: Dict):
+        return cls(data)
+
+    def get_body(self):
+        return self.data['body']
+
+    def to_dict(self):
+        return self.data
+
+
+item_classes = {
+    TextItem.type_name: TextItem,
+    ListItem.type_name: ListItem,
+    ListBlock.type_name: ListBlock,
+}
+
+
+def build_item(data: Dict) -> ContentItem:
+    '''Builds the typed item for a validated wire format content item'''
+    item_class = item_classes.get(data['type'].lower(), RawItem)
+    return item_class.from_dict(data)
+
+
+def build_items(content: List[Dict]) -> List[ContentItem]:
+    return [build_item(data) for data in content]
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from notes.models import Note
+
+
+class Command(BaseCommand):
+    help = "Computes and stores the content statistics and previews of existing notes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Number of notes updated per query")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fields = Note.content_derived_fields
+        last_pk = 0
+        updated = 0
+
+        while True:
+            notes = list(Note.objects.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+            if not notes:
+                break
+
+            for note in notes:
+                note.update_content_stats(force=True)
+            Note.objects.bulk_update(notes, fields)
+
+            updated += len(notes)
+            last_pk = notes[-1].pk
+
+        self.stdout.write(self.style.SUCCESS(f"Updated content statistics and previews of {updated} note(s)"))
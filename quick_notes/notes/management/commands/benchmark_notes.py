@@ -0,0 +1,372 @@
+import ast
+import datetime
+import math
+import random
+import timeit
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from notes.fields import LazyNoteContent, NoteContent, encode_note_content, compress_note_content
+from api.pagination import KeysetPagination
+from api.trigrams import get_similarity_threshold, get_trigrams
+from notes.models import Note, NoteCollectionSize, NoteTermTrigram
+from notes.renderers import RawJSONRenderer
+from notes.schema import content_types
+from notes.search import get_note_terms, get_search_backend
+from notes.serializers import NoteSerializer, StrippedNoteSerializer, NoteSummarySerializer
+
+
+SIZES = {
+    '1KB': 1024,
+    '100KB': 100 * 1024,
+    '1MB': 1024 * 1024,
+}
+
+
+def build_sample_content(size: int) -> list:
+    '''Builds note content, mixing text and checklists, whose JSON encoding is about `size` bytes'''
+    content = []
+    encoded_size = 2
+    index = 0
+
+    while encoded_size < size:
+        if index % 4 == 0:
+            item = {"type": "text", "body": f"Paragraph {index} of the sample note, written to pad the content out."}
+        else:
+            item = {
+                "type": "list",
+                "body": {
+                    "title": f"Checklist {index}",
+                    "list_items": [
+                        {"type": "list_item", "body": {"checked": bool(i % 2), "item_value": f"Item {i} of checklist {index}"}}
+                        for i in range(5)
+                    ],
+                },
+            }
+        content.append(item)
+        encoded_size += len(encode_note_content(item)) + 1
+        index += 1
+    return content
+
+
+def build_vocabulary(size: int, seed: int = 0) -> list:
+    '''Builds `size` distinct made up words'''
+    rng = random.Random(seed)
+    syllables = [consonant + vowel for consonant in 'bcdfghjklmnprstvz' for vowel in 'aeiou']
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def misspell(word: str) -> str:
+    '''Drops the second to last letter of `word`'''
+    return word[:-2] + word[-1]
+
+
+def validate_content_before_registry(content: list, allowed_types: list):
+    '''
+    Note content validation as it was before `notes.schema.ContentTypeRegistry`, the baseline of the validation benchmark.
+
+    Dispatches each item with a `match` on its type and reads string `checked` values with `ast.literal_eval`.
+    Error messages are left out, as only valid content is benchmarked.
+    '''
+    def validate_list_item_body(value: dict):
+        if not isinstance(value, dict) or 1 > len(value) or len(value) > 2:
+            raise ValidationError("Invalid list item")
+        checked = value.get('checked', None)
+        if checked is not None:
+            if isinstance(checked, str):
+                checked = ast.literal_eval(checked)
+            if not isinstance(checked, bool):
+                raise ValidationError("Invalid list item")
+        item_value = value.get('item_value', None)
+        if not item_value or not isinstance(item_value, str):
+            raise ValidationError("Invalid list item")
+
+    def validate_list_body(value: dict):
+        if not isinstance(value, dict) or len(value) != 2:
+            raise ValidationError("Invalid list")
+        title, list_items = value.get('title', None), value.get('list_items', None)
+        if not title or not list_items or not isinstance(title, str) or not isinstance(list_items, list):
+            raise ValidationError("Invalid list")
+        for item in list_items:
+            if not isinstance(item, dict):
+                raise ValidationError("Invalid list item")
+            _type, _body = item.get('type', None), item.get('body', None)
+            if not _body or not _type or not isinstance(_type, str) or not _type.lower() == "list_item":
+                raise ValidationError("Invalid list item")
+            validate_list_item_body(_body)
+
+    for content_item in content:
+        if not isinstance(content_item, dict):
+            raise ValidationError("Invalid content item")
+        _type = content_item.get('type', None)
+        if not _type or not isinstance(_type, str):
+            raise ValidationError("Invalid content item")
+        _body = content_item.get('body', None)
+        if not _body:
+            raise ValidationError("Invalid content item")
+
+        if _type and _type.lower() in allowed_types:
+            match _type.lower():
+                case "text":
+                    if not isinstance(_body, str):
+                        raise ValidationError("Invalid text")
+                case "list_item":
+                    validate_list_item_body(_body)
+                case "list":
+                    validate_list_body(_body)
+    return content
+
+
+class Command(BaseCommand):
+    help = "Runs benchmarks of the notes app and prints their timings"
+    scenarios = ['compression', 'validation', 'raw_content', 'fuzzy_search', 'serializer', 'pagination']
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f"Benchmarks to run, out of {', '.join(self.scenarios)}. Runs all by default")
+        parser.add_argument('--repeat', type=int, default=5, help="Number of timing runs; the best run is reported")
+        parser.add_argument('--notes', type=int, default=100_000, help="Number of notes searched by the search benchmarks and paginated by the pagination benchmark")
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        self.notes_count = options['notes']
+        scenarios = options['scenarios'] or self.scenarios
+        for scenario in scenarios:
+            if scenario not in self.scenarios:
+                raise CommandError(f"Unknown benchmark: {scenario}")
+
+        for scenario in scenarios:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"Benchmark: {scenario}"))
+            getattr(self, f'benchmark_{scenario}')()
+
+    def time(self, func, number: int) -> float:
+        '''Returns the best time, in milliseconds, of a single call to `func`'''
+        return min(timeit.repeat(func, number=number, repeat=self.repeat)) / number * 1000
+
+    def benchmark_compression(self):
+        '''Stored size and read latency of plain against compressed note content'''
+        self.stdout.write(f"{'size':>8} {'plain bytes':>12} {'packed bytes':>13} {'plain read ms':>14} {'packed read ms':>15}")
+
+        for label, size in SIZES.items():
+            plain = encode_note_content(build_sample_content(size))
+            packed = compress_note_content(plain)
+            number = max(1, 100_000 // size)
+
+            plain_ms = self.time(lambda: LazyNoteContent(plain).items, number)
+            packed_ms = self.time(lambda: LazyNoteContent(packed).items, number)
+            self.stdout.write(
+                f"{label:>8} {len(plain.encode('utf-8')):>12} {len(packed):>13} {plain_ms:>14.3f} {packed_ms:>15.3f}"
+            )
+
+    def benchmark_validation(self):
+        '''
+        Note content validated by the validator compiled by `notes.schema.ContentTypeRegistry` against the validator
+        it replaced, kept in `validate_content_before_registry`, with boolean and with string `checked` values.
+        '''
+        self.stdout.write(f"{'size':>8} {'checked':>8} {'items':>8} {'before ms':>10} {'compiled ms':>12} {'speedup':>8}")
+
+        allowed_types = NoteContent.allowed_content_types
+        for label, size in SIZES.items():
+            number = max(1, 100_000 // size)
+            for checked_type in (bool, str):
+                content = build_sample_content(size)
+                for item in content:
+                    for list_item in item['body']['list_items'] if item['type'] == 'list' else []:
+                        list_item['body']['checked'] = checked_type(list_item['body']['checked'])
+
+                before_ms = self.time(lambda: validate_content_before_registry(content, allowed_types), number)
+                compiled_ms = self.time(lambda: content_types.compile(allowed_types)(content), number)
+                self.stdout.write(
+                    f"{label:>8} {checked_type.__name__:>8} {len(content):>8} {before_ms:>10.3f} {compiled_ms:>12.3f} "
+                    f"{before_ms / compiled_ms:>7.2f}x"
+                )
+
+    def benchmark_raw_content(self):
+        '''Rendering a stored note through the serializer against passing its stored JSON through'''
+        self.stdout.write(f"{'size':>8} {'response bytes':>15} {'serializer ms':>14} {'raw ms':>10} {'speedup':>8}")
+
+        request = APIRequestFactory().get('/')
+        field = Note._meta.get_field('note_content')
+        owner = get_user_model()(username='benchmark')
+        now = timezone.now()
+
+        for label, size in SIZES.items():
+            stored = field.pack(encode_note_content(build_sample_content(size)))
+            number = max(1, 100_000 // size)
+
+            def render(raw_content: bool) -> bytes:
+                # A note as it is read from the database, with its content not decoded yet
+                note = Note(
+                    title='Benchmark', slug='benchmark', owner=owner, date_created=now, last_edited=now,
+                    note_content=LazyNoteContent(stored),
+                )
+                context = {'request': request, 'raw_content': raw_content}
+                renderer = RawJSONRenderer() if raw_content else JSONRenderer()
+                return renderer.render(NoteSerializer(note, context=context).data)
+
+            serializer_ms = self.time(lambda: render(False), number)
+            raw_ms = self.time(lambda: render(True), number)
+            self.stdout.write(
+                f"{label:>8} {len(render(True)):>15} {serializer_ms:>14.3f} {raw_ms:>10.3f} {serializer_ms / raw_ms:>7.1f}x"
+            )
+
+    def benchmark_fuzzy_search(self):
+        '''
+        Latency of plain and fuzzy searches of one user's notes, as the notes grow to `--notes`.
+
+        The notes are created in a transaction that is rolled back at the end.
+        '''
+        self.stdout.write(
+            f"{'notes':>8} {'vocabulary rows':>16} {'rows read':>10} {'plain ms':>9} {'fuzzy ms':>9} {'fuzzy results':>14}"
+        )
+        rng = random.Random(0)
+        vocabulary = build_vocabulary(20_000)
+        # Typos of short words are too far from them for any threshold worth using
+        word = next(word for word in vocabulary[len(vocabulary) // 2:] if len(word) >= 8)
+        query = misspell(word)
+        backend = get_search_backend()
+        steps = [count for count in (1_000, 10_000) if count < self.notes_count] + [self.notes_count]
+
+        def search(qs):
+            # The first page of results and their count, as `NoteSearchAPIView` reads them
+            return list(qs[:10]), qs.count()
+
+        with transaction.atomic():
+            owner = get_user_model().objects.create_user(
+                username='benchmark-search', firstname='Bench', lastname='Mark', email='', password='benchmark',
+            )
+            notes = Note.objects.filter(owner=owner)
+            created = 0
+
+            for count in steps:
+                batch = [
+                    Note(
+                        owner=owner,
+                        title=' '.join(rng.choices(vocabulary, k=3)),
+                        slug=f'benchmark-search-{index}',
+                        note_content=[
+                            {"type": "text", "body": ' '.join(rng.choices(vocabulary, k=30))},
+                            {"type": "list", "body": {"title": rng.choice(vocabulary), "list_items": [
+                                {"type": "list_item", "body": {"checked": False, "item_value": ' '.join(rng.choices(vocabulary, k=4))}}
+                                for _ in range(3)
+                            ]}},
+                        ],
+                    )
+                    for index in range(created, count)
+                ]
+                terms = set()
+                for note in Note.objects.bulk_create(batch, batch_size=1000):
+                    backend.index(note)
+                    terms.update(get_note_terms(note.title, note.note_content.items))
+                NoteTermTrigram.objects.add_terms(owner.pk, terms)
+                # Notes created in bulk are not counted as they are saved
+                NoteCollectionSize.objects.add(owner.pk, len(batch))
+                created = count
+
+                threshold = get_similarity_threshold()
+                trigrams = get_trigrams(query)
+                lowest = math.ceil(len(trigrams) * threshold - 1e-9)
+                highest = math.floor(len(trigrams) / threshold + 1e-9)
+                rows_read = NoteTermTrigram.objects.filter(
+                    owner=owner, trigram__in=trigrams, trigrams_count__range=(lowest, highest),
+                ).count()
+
+                plain_ms = self.time(lambda: search(notes.search(word, user=owner)), 1)
+                fuzzy_ms = self.time(lambda: search(notes.fuzzy_search(query, user=owner)), 1)
+                self.stdout.write(
+                    f"{count:>8} {NoteTermTrigram.objects.count():>16} {rows_read:>10} {plain_ms:>9.2f} {fuzzy_ms:>9.2f} "
+                    f"{notes.fuzzy_search(query, user=owner).count():>14}"
+                )
+
+            transaction.set_rollback(True)
+
+    def benchmark_serializer(self):
+        '''
+        Rows serialized per second by the compiled representation of the note serializers against `Serializer.to_representation`.
+
+        Serializes a page of 100 small notes as read from the database, with their content passed through as stored.
+        '''
+        self.stdout.write(f"{'serializer':>24} {'generic rows/s':>15} {'compiled rows/s':>16} {'speedup':>8}")
+
+        request = Request(APIRequestFactory().get('/api/notes/', SERVER_NAME='localhost'))
+        field = Note._meta.get_field('note_content')
+        owner = get_user_model()(username='benchmark')
+        now = timezone.now()
+        stored = field.pack(encode_note_content(build_sample_content(SIZES['1KB'])))
+        notes = [
+            Note(
+                pk=index, title=f'Benchmark {index}', slug=f'benchmark-{index}', owner=owner, date_created=now, last_edited=now,
+                note_content=LazyNoteContent(stored), preview='Paragraph 0 of the sample note',
+            )
+            for index in range(100)
+        ]
+        context = {'request': request, 'raw_content': True}
+
+        for serializer_class in (NoteSerializer, StrippedNoteSerializer, NoteSummarySerializer):
+            generic_class = type(f'Generic{serializer_class.__name__}', (serializer_class,), {'compiled_representation': False})
+
+            def serialize(cls):
+                return cls(notes, many=True, context=context).data
+
+            generic_ms = self.time(lambda: serialize(generic_class), 20)
+            compiled_ms = self.time(lambda: serialize(serializer_class), 20)
+            self.stdout.write(
+                f"{serializer_class.__name__:>24} {len(notes) / generic_ms * 1000:>15,.0f} {len(notes) / compiled_ms * 1000:>16,.0f} "
+                f"{generic_ms / compiled_ms:>7.2f}x"
+            )
+
+    def benchmark_pagination(self):
+        '''
+        Latency of a page of one user's notes at growing depths, read by offset and by keyset.
+
+        The `--notes` notes are created in a transaction that is rolled back at the end.
+        '''
+        self.stdout.write(f"{'page':>8} {'offset ms':>10} {'keyset ms':>10}")
+        factory = APIRequestFactory()
+        page_size = 10
+
+        with transaction.atomic():
+            owner = get_user_model().objects.create_user(
+                username='benchmark-pages', firstname='Bench', lastname='Mark', email='', password='benchmark',
+            )
+            now = timezone.now()
+            notes = Note.objects.bulk_create(
+                [Note(owner=owner, title=f'Note {index}', slug=f'note-{index}', note_content=[]) for index in range(self.notes_count)],
+                batch_size=1000,
+            )
+            # Creation dates are set on insert, so they are spread out afterwards
+            for index, note in enumerate(notes):
+                note.date_created = now - datetime.timedelta(seconds=index)
+            Note.objects.bulk_update(notes, ['date_created'], batch_size=1000)
+            queryset = Note.objects.filter(owner=owner)
+            pages = [page for page in (1, 10, 100, 1_000, 10_000) if (page - 1) * page_size < self.notes_count]
+
+            for page in pages:
+                offset = (page - 1) * page_size
+                offset_request = Request(factory.get('/api/notes/', {'offset': offset, 'limit': page_size}))
+                keyset_params = {'limit': page_size}
+                if offset:
+                    # The cursor of the `next` link of the previous page
+                    paginator = KeysetPagination()
+                    paginator.request = Request(factory.get('/api/notes/', SERVER_NAME='localhost'))
+                    paginator.ordering = paginator.get_ordering(queryset)
+                    last = queryset.order_by(*paginator.get_order_by(paginator.ordering, reverse=False))[offset - 1]
+                    next_link = paginator.encode_cursor(paginator.get_position(last), reverse=False)
+                    keyset_params['cursor'] = Request(factory.get(next_link)).query_params['cursor']
+                keyset_request = Request(factory.get('/api/notes/', keyset_params))
+
+                offset_ms = self.time(lambda: LimitOffsetPagination().paginate_queryset(queryset, offset_request), 5)
+                keyset_ms = self.time(lambda: KeysetPagination().paginate_queryset(queryset, keyset_request), 5)
+                self.stdout.write(f"{page:>8} {offset_ms:>10.2f} {keyset_ms:>10.2f}")
+
+            transaction.set_rollback(True)
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from notes.models import Note
+from notes.fields import compress_note_content, decompress_note_content
+
+
+class Command(BaseCommand):
+    help = "Recompresses stored note content in batches and reports the bytes saved"
+
+    def add_arguments(self, parser):
+        field = Note._meta.get_field('note_content')
+        parser.add_argument('--batch-size', type=int, default=500, help="Number of notes read per query")
+        parser.add_argument(
+            '--threshold', type=int, default=field.compress_threshold,
+            help="Size in bytes above which content is compressed. Defaults to the field's `compress_threshold`"
+        )
+        parser.add_argument('--decompress', action='store_true', help="Store all content uncompressed")
+        parser.add_argument('--dry-run', action='store_true', help="Report the bytes that would be saved without writing")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        threshold = options['threshold']
+        decompress = options['decompress']
+        dry_run = options['dry_run']
+
+        connection = connections[Note.objects.db]
+        table = connection.ops.quote_name(Note._meta.db_table)
+        column = connection.ops.quote_name(Note._meta.get_field('note_content').column)
+        last_pk = 0
+        scanned = rewritten = bytes_before = bytes_after = 0
+
+        while True:
+            # `LazyNoteContent` keeps the raw column value, so no content is decoded here
+            rows = list(
+                Note.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'note_content')[:batch_size]
+            )
+            if not rows:
+                break
+
+            updates = []
+            for pk, content in rows:
+                if content is None or not isinstance(content.raw, str):
+                    continue
+
+                raw = content.raw
+                plain = decompress_note_content(raw)
+                value = plain if decompress else compress_note_content(plain, threshold)
+
+                scanned += 1
+                bytes_before += len(raw.encode('utf-8'))
+                bytes_after += len(value.encode('utf-8'))
+                if value != raw:
+                    updates.append((value, pk))
+
+            if updates and not dry_run:
+                with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                    cursor.executemany(f'UPDATE {table} SET {column} = %s WHERE id = %s', updates)
+
+            rewritten += len(updates)
+            last_pk = rows[-1][0]
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{'Would rewrite' if dry_run else 'Rewrote'} {rewritten} of {scanned} note(s). "
+                f"{bytes_before} bytes before, {bytes_after} bytes after, {bytes_before - bytes_after} bytes saved"
+            )
+        )
@@ -0,0 +1,77 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+
+from notes.conf import get_setting
+from notes.fields import encode_note_content
+from notes.items import build_items
+from notes.models import Note, NoteRevision
+from notes.revisions import apply_delta, diff_items
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes all but the latest revisions of each note and compacts the rest, "
+        "storing a snapshot every `REVISION_SNAPSHOT_INTERVAL` revisions and deltas in between"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, default=100, help="Number of revisions kept per note")
+
+    def handle(self, *args, **options):
+        keep = options['keep']
+        if keep < 1:
+            raise CommandError("--keep should be at least 1")
+
+        self.interval = get_setting("REVISION_SNAPSHOT_INTERVAL")
+        notes = Note.objects.annotate(revisions_count=Count('revisions')).filter(revisions_count__gt=0).values_list('pk', flat=True)
+        deleted = rewritten = 0
+
+        for note_id in notes.iterator():
+            with transaction.atomic():
+                revisions = list(NoteRevision.objects.select_for_update().filter(note_id=note_id).order_by('number'))
+                pruned, revisions = revisions[:-keep], revisions[-keep:]
+                if pruned:
+                    NoteRevision.objects.filter(pk__in=[revision.pk for revision in pruned]).delete()
+                    deleted += len(pruned)
+                rewritten += self.compact(revisions, replay=pruned + revisions)
+
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} revision(s) and rewrote {rewritten} revision(s)"))
+
+    def is_snapshot_due(self, revision, first: bool) -> bool:
+        # Matches `NoteRevisionManager.record`, which snapshots revision 1, 1 + interval, ...
+        return first or (revision.number - 1) % self.interval == 0
+
+    def compact(self, revisions, replay) -> int:
+        '''
+        Stores `revisions` as a snapshot where one is due and as deltas everywhere else.
+
+        `replay` holds every revision from the oldest one, so the content of each revision can be rebuilt.
+        Returns the number of revisions rewritten.
+        '''
+        kept = {revision.pk for revision in revisions}
+        items = previous = None
+        changed = []
+
+        for revision in replay:
+            data = json.loads(revision.data)
+            previous, items = items, build_items(data) if revision.is_snapshot else apply_delta(items, data)
+
+            if revision.pk not in kept:
+                continue
+
+            should_be_snapshot = self.is_snapshot_due(revision, first=revision is revisions[0])
+            if should_be_snapshot and not revision.is_snapshot:
+                revision.data = encode_note_content([item.to_dict() for item in items])
+            elif not should_be_snapshot and revision.is_snapshot:
+                revision.data = encode_note_content(diff_items(previous, items))
+            else:
+                continue
+
+            revision.is_snapshot = should_be_snapshot
+            changed.append(revision)
+
+        NoteRevision.objects.bulk_update(changed, ['is_snapshot', 'data'])
+        return len(changed)
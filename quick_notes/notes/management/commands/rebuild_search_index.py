@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from notes.models import Note, NoteCollectionSize, NoteTermTrigram
+
+
+class Command(BaseCommand):
+    help = (
+        "Brings the search index of existing notes, and the vocabularies of fuzzy searches, up to date, "
+        "removing the terms no note of their owner contains anymore, and counts the notes of each user again"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Number of notes indexed per transaction")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk = 0
+        indexed = 0
+
+        while True:
+            notes = list(Note.objects.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+            if not notes:
+                break
+
+            with transaction.atomic():
+                for note in notes:
+                    note.update_search_index()
+
+            indexed += len(notes)
+            last_pk = notes[-1].pk
+
+        pruned = 0
+        owners = NoteTermTrigram.objects.order_by().values_list('owner', flat=True).distinct()
+        for owner_pk in owners.iterator():
+            with transaction.atomic():
+                pruned += NoteTermTrigram.objects.prune(owner_pk)
+
+        NoteCollectionSize.objects.recount()
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} note(s) and removed {pruned} term(s) from the vocabularies"))
@@ -0,0 +1,56 @@
+import os
+import socket
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from notes.models import NoteIndexJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Applies the queued changes of notes to the search index, in batches. "
+        "Several workers may run at once; each claims its own jobs"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help="Number of jobs claimed at a time")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds to wait for jobs when the queue is empty")
+        parser.add_argument('--once', action='store_true', help="Exit once no job is due instead of waiting for more")
+        parser.add_argument('--stats', action='store_true', help="Print the state of the queue and exit")
+        parser.add_argument('--retry-failed', action='store_true', help="Make the jobs that failed too often due again and exit")
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.print_stats()
+            return
+        if options['retry_failed']:
+            retried = NoteIndexJob.objects.retry_failed()
+            self.stdout.write(self.style.SUCCESS(f"Made {retried} failed job(s) due again"))
+            return
+
+        worker = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        applied_total = failed_total = 0
+        self.stdout.write(f"Worker {worker} started")
+
+        try:
+            while True:
+                applied, failed = NoteIndexJob.objects.process(worker, options['batch_size'])
+                applied_total += applied
+                failed_total += failed
+                if applied or failed:
+                    self.stdout.write(f"Applied {applied} job(s), {failed} failed, lag {NoteIndexJob.objects.lag():.1f}s")
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f"Applied {applied_total} job(s), {failed_total} failed"))
+
+    def print_stats(self):
+        self.stdout.write(f"Pending jobs: {NoteIndexJob.objects.pending().count()}")
+        self.stdout.write(f"Failed jobs: {NoteIndexJob.objects.failed().count()}")
+        self.stdout.write(f"Lag: {NoteIndexJob.objects.lag():.1f}s")
@@ -1,4 +1,18 @@
-from django.db import models
+import datetime
+from collections import defaultdict
+from typing import Iterable, List, Tuple
+
+from django.apps import apps
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from api.trigrams import find_similar, get_similarity_threshold, get_trigrams
+from .conf import get_setting
+from .fields import encode_note_content
+from .revisions import diff_items, rebuild_content
+from .search import get_note_terms, get_query_terms, get_term_weights, get_search_backend
+from .slugs import get_slug_base, get_numbered_slug
 
 
 
@@ -6,15 +20,44 @@ class NoteQuerySet(models.QuerySet):
     '''Note model custom queryset'''
     
     def search(self, query, user=None):
-        lookup = models.Q(title__icontains=query) | models.Q(content__icontains=query)
-        qs = self.filter(lookup)
+        '''
+        Returns the notes matching `query`, most relevant first, through the configured search backend.
+
+        Pass `user` to only search the user's notes.
+        '''
+        return get_search_backend().search(self, query, user=user)
+
+    def fuzzy_search(self, query, user=None, threshold: float = None):
+        '''
+        Returns the notes containing terms similar to those of `query`, most relevant first.
+
+        The terms of the notes searched, those of `user` when it is given, whose trigram similarity to a term
+        of `query` is at least `threshold` are searched for, boosted by their similarity. The threshold defaults to `settings.TRIGRAM_SIMILARITY_THRESHOLD`.
+        Each term of `query` is expanded to at most `NOTES_CONFIG["FUZZY_MAX_EXPANSIONS"]` terms, the most similar ones.
+        '''
+        threshold = get_similarity_threshold(threshold)
+        vocabulary = apps.get_model(self.model._meta.app_label, 'NoteTermTrigram').objects.all()
+        if user is not None:
+            vocabulary = vocabulary.filter(owner=user)
+        max_expansions = get_setting("FUZZY_MAX_EXPANSIONS")
+        terms = {}
+        for query_term in get_query_terms(query):
+            for match in find_similar(vocabulary, query_term, threshold, ['owner', 'term'], limit=max_expansions):
+                terms[match['term']] = max(terms.get(match['term'], 0), match['similarity'])
+        return get_search_backend().search_terms(self, terms, user=user)
+
+    def with_lists(self):
+        return self.filter(lists_count__gt=0)
 
-        if user:
-            qs2 = self.filter(user=user).filter(lookup)
-            # qs = qs.union(qs2).distinct()
-            qs = (qs | qs2).distinct()
+    def with_list_items(self):
+        return self.filter(list_items_count__gt=0)
 
-        return qs.order_by('title')
+    def with_texts(self):
+        return self.filter(texts_count__gt=0)
+
+    def largest(self):
+        '''Orders notes from the highest to the lowest approximate word count'''
+        return self.order_by('-approximate_word_count', '-date_created')
 
 
 class NoteManager(models.Manager):
@@ -24,4 +67,445 @@ class NoteManager(models.Manager):
         return NoteQuerySet(self.model, using=self._db)
 
     def search(self, query, user=None):
-        return self.get_queryset().search(query, user=user)
\ No newline at end of file
+        return self.get_queryset().search(query, user=user)
+
+    def fuzzy_search(self, query, user=None, threshold: float = None):
+        return self.get_queryset().fuzzy_search(query, user=user, threshold=threshold)
+
+    def with_lists(self):
+        return self.get_queryset().with_lists()
+
+    def with_list_items(self):
+        return self.get_queryset().with_list_items()
+
+    def with_texts(self):
+        return self.get_queryset().with_texts()
+
+    def largest(self):
+        return self.get_queryset().largest()
+
+    def allocate_slugs(self, notes: Iterable) -> list:
+        '''
+        Sets the slugs of `notes` that have none, before they are created with `bulk_create`. Returns `notes`.
+
+        Numbers are reserved once per owner and title slug, however many notes share them, so importing
+        thousands of notes with the same title costs a single statement. Unlike `Note.save`, allocated
+        slugs taken by notes saved with an explicit slug are not skipped.
+        '''
+        notes = list(notes)
+        groups = defaultdict(list)
+        for note in notes:
+            if not note.slug:
+                groups[note.owner_id, get_slug_base(note.title)].append(note)
+
+        SlugCounter = apps.get_model(self.model._meta.app_label, 'NoteSlugCounter')
+        for (owner_pk, base), group in groups.items():
+            if owner_pk is None:
+                for note in group:
+                    note.slug = base
+                continue
+            last_number = SlugCounter.objects.db_manager(self.db).allocate(owner_pk, base, len(group))
+            for number, note in enumerate(group, start=last_number - len(group) + 1):
+                note.slug = get_numbered_slug(base, number)
+        return notes
+
+
+class NoteRevisionQuerySet(models.QuerySet):
+    '''NoteRevision model custom queryset'''
+
+    def chain(self, note, number: int):
+        '''
+        Returns the revisions needed to rebuild revision `number` of `note`, oldest first.
+
+        That is the closest snapshot at or before `number`, followed by the deltas after it.
+        '''
+        snapshot_number = self.filter(note=note, number__lte=number, is_snapshot=True).order_by('-number').values('number')[:1]
+        return self.filter(note=note, number__lte=number, number__gte=models.Subquery(snapshot_number)).order_by('number')
+
+
+class NoteRevisionManager(models.Manager):
+    '''NoteRevision model custom objects manager'''
+
+    def get_queryset(self):
+        return NoteRevisionQuerySet(self.model, using=self._db)
+
+    def chain(self, note, number: int):
+        return self.get_queryset().chain(note, number)
+
+    def get_with_content(self, note, number: int):
+        '''
+        Returns revision `number` of `note` with its rebuilt content set as `content`.
+
+        Costs one query and at most `REVISION_SNAPSHOT_INTERVAL - 1` delta applications.
+        '''
+        chain = list(self.chain(note, number))
+        if not chain or chain[-1].number != number:
+            raise self.model.DoesNotExist("Revision %s does not exist" % number)
+
+        revision = chain[-1]
+        revision.content = rebuild_content(chain)
+        return revision
+
+    def record(self, note):
+        '''
+        Records the current state of `note` as its latest revision.
+
+        A full snapshot is stored every `REVISION_SNAPSHOT_INTERVAL` revisions, and a delta
+        from the previous revision otherwise. Returns None if nothing changed.
+        '''
+        interval = get_setting("REVISION_SNAPSHOT_INTERVAL")
+        last = self.filter(note=note).order_by('-number').only('number', 'title').first()
+        items = note.note_content.items if note.note_content is not None else []
+
+        if last is not None:
+            previous = rebuild_content(list(self.chain(note, last.number)))
+            operations = diff_items(previous.items, items)
+            if not operations and last.title == note.title:
+                return None
+
+        if last is None or last.number % interval == 0:
+            return self.create(
+                note=note,
+                number=last.number + 1 if last else 1,
+                title=note.title,
+                is_snapshot=True,
+                data=encode_note_content([item.to_dict() for item in items]),
+            )
+
+        return self.create(
+            note=note,
+            number=last.number + 1,
+            title=note.title,
+            is_snapshot=False,
+            data=encode_note_content(operations),
+        )
+
+
+class NoteSearchTermManager(models.Manager):
+    '''NoteSearchTerm model custom objects manager'''
+
+    # Entries deleted per query, to stay under the database's limit of query parameters
+    delete_batch_size = 500
+
+    def index(self, note):
+        '''
+        Brings the search index entries of `note` up to date with its title and content.
+
+        Only entries whose term or weight changed are written.
+        '''
+        if note.owner_id is None:
+            # Notes are searched per owner
+            self.filter(note=note).delete()
+            return
+
+        items = note.note_content.items if note.note_content is not None else []
+        weights = get_term_weights(note.title, items)
+        existing = {entry.term: entry for entry in self.filter(note=note).only('pk', 'term', 'weight', 'owner')}
+
+        new_entries = []
+        changed_entries = []
+        for term, weight in weights.items():
+            entry = existing.pop(term, None)
+            if entry is None:
+                new_entries.append(self.model(owner_id=note.owner_id, note=note, term=term, weight=weight))
+            elif entry.weight != weight or entry.owner_id != note.owner_id:
+                entry.weight = weight
+                entry.owner_id = note.owner_id
+                changed_entries.append(entry)
+
+        stale_pks = [entry.pk for entry in existing.values()]
+        for start in range(0, len(stale_pks), self.delete_batch_size):
+            self.filter(pk__in=stale_pks[start:start + self.delete_batch_size]).delete()
+        if changed_entries:
+            self.bulk_update(changed_entries, ['weight', 'owner'])
+        if new_entries:
+            self.bulk_create(new_entries)
+
+
+class NoteTermTrigramManager(models.Manager):
+    '''NoteTermTrigram model custom objects manager'''
+
+    # Terms looked up per query, to stay under the database's limit of query parameters
+    batch_size = 500
+
+    def get_known_terms(self, owner_pk, terms: List[str]) -> set:
+        '''Returns those of `terms` that are in the vocabulary of the owner with `owner_pk`'''
+        known = set()
+        for start in range(0, len(terms), self.batch_size):
+            batch = terms[start:start + self.batch_size]
+            known.update(self.filter(owner_id=owner_pk, term__in=batch).order_by().values_list('term', flat=True).distinct())
+        return known
+
+    def add_terms(self, owner_pk, terms):
+        '''Adds those of `terms` that are not in the vocabulary of the owner with `owner_pk` yet. Notes without an owner have none.'''
+        if owner_pk is None:
+            return
+        terms = list(terms)
+        known = self.get_known_terms(owner_pk, terms)
+
+        entries = []
+        for term in terms:
+            if term in known:
+                continue
+            trigrams = get_trigrams(term)
+            entries.extend(
+                self.model(owner_id=owner_pk, term=term, trigram=trigram, trigrams_count=len(trigrams)) for trigram in trigrams
+            )
+        if entries:
+            self.bulk_create(entries, ignore_conflicts=True)
+
+    def prune(self, owner_pk, terms=None) -> int:
+        '''
+        Removes those of `terms` that are no longer found in the owner's notes from the vocabulary of the owner with `owner_pk`.
+
+        Without `terms`, every term of the owner's vocabulary is checked. Terms are looked up in the index
+        of the configured search backend. Returns the number of terms removed.
+        '''
+        if owner_pk is None:
+            return 0
+        if terms is None:
+            terms = self.filter(owner_id=owner_pk).order_by().values_list('term', flat=True).distinct()
+            known = list(terms)
+        else:
+            known = list(self.get_known_terms(owner_pk, list(terms)))
+
+        found = get_search_backend().find_terms(known, owner_pk, using=self.db)
+        stale = [term for term in known if term not in found]
+        for start in range(0, len(stale), self.batch_size):
+            self.filter(owner_id=owner_pk, term__in=stale[start:start + self.batch_size]).delete()
+        return len(stale)
+
+
+class NoteIndexJobQuerySet(models.QuerySet):
+    '''NoteIndexJob model custom queryset'''
+
+    def pending(self):
+        '''Jobs that have not failed `INDEX_JOB_MAX_ATTEMPTS` times'''
+        return self.filter(attempts__lt=get_setting("INDEX_JOB_MAX_ATTEMPTS"))
+
+    def failed(self):
+        return self.filter(attempts__gte=get_setting("INDEX_JOB_MAX_ATTEMPTS"))
+
+    def lag(self) -> float:
+        '''
+        Seconds since the oldest change waiting in a job that has not failed yet, or 0 when there is none.
+
+        Jobs waiting to be retried are left out, so that a note that fails to be indexed does not make
+        the queue look backlogged while workers keep up with the other changes.
+        '''
+        oldest = self.filter(attempts=0).order_by('enqueued_at').values_list('enqueued_at', flat=True).first()
+        if oldest is None:
+            return 0.0
+        return max(0.0, (timezone.now() - oldest).total_seconds())
+
+
+class NoteIndexJobManager(models.Manager):
+    '''NoteIndexJob model custom objects manager'''
+
+    # Seconds before a failed job is retried, doubled on each further attempt
+    retry_delay = 5
+
+    def get_queryset(self):
+        return NoteIndexJobQuerySet(self.model, using=self._db)
+
+    def pending(self):
+        return self.get_queryset().pending()
+
+    def failed(self):
+        return self.get_queryset().failed()
+
+    def lag(self) -> float:
+        return self.get_queryset().lag()
+
+    def is_backlogged(self) -> bool:
+        '''Whether the index is further behind than `INDEX_QUEUE_MAX_LAG` allows'''
+        return self.lag() > get_setting("INDEX_QUEUE_MAX_LAG")
+
+    def enqueue(self, note_pk, action: str):
+        '''
+        Queues `action` on the search index of the note with `note_pk`.
+
+        A pending job of the note is reused, with the new action, so the note is only processed once
+        however often it changed. Call it in the transaction that changes the note, so the job is
+        only kept if the change is.
+        '''
+        now = timezone.now()
+        changes = {'action': action, 'available_at': now, 'attempts': 0, 'last_error': ''}
+        if self.filter(note_id=note_pk).update(generation=models.F('generation') + 1, **changes):
+            return
+        try:
+            with transaction.atomic():
+                self.create(note_id=note_pk, enqueued_at=now, **changes)
+        except IntegrityError:
+            # Queued by a concurrent save in the meantime
+            self.filter(note_id=note_pk).update(generation=models.F('generation') + 1, **changes)
+
+    def claim(self, worker: str, batch_size: int) -> list:
+        '''
+        Returns up to `batch_size` of the oldest jobs that are due, locked for `worker`.
+
+        Jobs are locked for `INDEX_JOB_LEASE` seconds, after which other workers may claim them,
+        e.g. when `worker` died while processing them.
+        '''
+        now = timezone.now()
+        unlocked = models.Q(locked_until__isnull=True) | models.Q(locked_until__lt=now)
+        due = self.pending().filter(unlocked, available_at__lte=now).order_by('enqueued_at')
+        pks = list(due.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return []
+
+        locked_until = now + datetime.timedelta(seconds=get_setting("INDEX_JOB_LEASE"))
+        self.filter(unlocked, pk__in=pks).update(locked_by=worker, locked_until=locked_until)
+        return list(self.filter(pk__in=pks, locked_by=worker, locked_until=locked_until).order_by('enqueued_at'))
+
+    def process(self, worker: str, batch_size: int = 100) -> Tuple[int, int]:
+        '''
+        Claims a batch of jobs for `worker` and applies them to the search index.
+
+        The vocabularies of fuzzy searches are extended once for the whole batch. Jobs are deleted once applied,
+        unless their note changed again in the meantime. Failed jobs are retried after a delay that doubles
+        on each attempt. Returns the numbers of jobs applied and failed.
+        '''
+        jobs = self.claim(worker, batch_size)
+        if not jobs:
+            return 0, 0
+
+        Note = apps.get_model(self.model._meta.app_label, 'Note')
+        NoteTermTrigram = apps.get_model(self.model._meta.app_label, 'NoteTermTrigram')
+        notes = Note.objects.using(self.db).in_bulk([job.note_id for job in jobs if job.action == self.model.ACTION_INDEX])
+        backend = get_search_backend()
+        terms = defaultdict(set)
+        applied = []
+
+        for job in jobs:
+            note = notes.get(job.note_id, None)
+            try:
+                with transaction.atomic(using=self.db):
+                    if note is None:
+                        # Deleted, or deleted since it was saved
+                        backend.remove(job.note_id, using=self.db)
+                    else:
+                        backend.index(note)
+                        terms[note.owner_id].update(
+                            get_note_terms(note.title, note.note_content.items if note.note_content is not None else [])
+                        )
+            except Exception as error:
+                self.retry(job, error)
+            else:
+                applied.append(job)
+
+        for owner_pk, owner_terms in terms.items():
+            NoteTermTrigram.objects.db_manager(self.db).add_terms(owner_pk, owner_terms)
+        if applied:
+            # Searches of the owners of reindexed notes may now find them differently
+            NoteCollectionVersion = apps.get_model(self.model._meta.app_label, 'NoteCollectionVersion')
+            for owner_pk in {notes[job.note_id].owner_id for job in applied if job.note_id in notes} - {None}:
+                NoteCollectionVersion.objects.db_manager(self.db).bump(owner_pk)
+            finished = models.Q()
+            for job in applied:
+                finished |= models.Q(pk=job.pk, generation=job.generation)
+            self.filter(finished).delete()
+            # Jobs queued again while they were applied are left for the next batch
+            self.filter(pk__in=[job.pk for job in applied]).update(locked_by=None, locked_until=None)
+        return len(applied), len(jobs) - len(applied)
+
+    def retry(self, job, error: Exception):
+        '''Unlocks a failed `job`, to be run again after a delay unless it failed `INDEX_JOB_MAX_ATTEMPTS` times'''
+        delay = datetime.timedelta(seconds=self.retry_delay * 2 ** job.attempts)
+        self.filter(pk=job.pk, generation=job.generation).update(
+            attempts=models.F('attempts') + 1,
+            available_at=timezone.now() + delay,
+            last_error=f"{error.__class__.__name__}: {error}",
+        )
+        self.filter(pk=job.pk).update(locked_by=None, locked_until=None)
+
+    def retry_failed(self) -> int:
+        '''Makes failed jobs due again. Returns their number.'''
+        return self.failed().update(attempts=0, available_at=timezone.now(), last_error='')
+
+
+class NoteCollectionVersionManager(models.Manager):
+    '''NoteCollectionVersion model custom objects manager'''
+
+    def get_version(self, owner_pk) -> int:
+        '''Returns the version of the notes of the user with `owner_pk`, 0 until they first change'''
+        version = self.filter(owner_id=owner_pk).values_list('version', flat=True).first()
+        return version or 0
+
+    def bump(self, owner_pk):
+        '''Moves the notes of the user with `owner_pk` to a new version, invalidating what was cached of them'''
+        if self.filter(owner_id=owner_pk).update(version=models.F('version') + 1):
+            return
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(owner_id=owner_pk, version=1)
+        except IntegrityError:
+            # Created by a concurrent bump in the meantime
+            self.filter(owner_id=owner_pk).update(version=models.F('version') + 1)
+
+
+class NoteCollectionSizeManager(models.Manager):
+    '''NoteCollectionSize model custom objects manager'''
+
+    def get_notes_count(self, owner_pk) -> int:
+        '''Returns the number of notes of the user with `owner_pk`'''
+        notes_count = self.filter(owner_id=owner_pk).values_list('notes_count', flat=True).first()
+        return notes_count or 0
+
+    def add(self, owner_pk, delta: int):
+        '''
+        Adds `delta`, which may be negative, to the number of notes of the user with `owner_pk`.
+
+        Counts never go below 0, and are not created by a negative `delta`, e.g. for the notes deleted along with their owner.
+        '''
+        notes_count = Greatest(models.F('notes_count') + delta, 0)
+        if self.filter(owner_id=owner_pk).update(notes_count=notes_count) or delta <= 0:
+            return
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(owner_id=owner_pk, notes_count=delta)
+        except IntegrityError:
+            # Created by a concurrent add in the meantime
+            self.filter(owner_id=owner_pk).update(notes_count=notes_count)
+
+    def recount(self) -> int:
+        '''Counts the notes of every user again, e.g. after notes were created with `bulk_create`. Returns the number of owners.'''
+        Note = apps.get_model(self.model._meta.app_label, 'Note')
+        counts = Note.objects.using(self.db).filter(owner__isnull=False).order_by().values('owner').annotate(notes_count=models.Count('pk'))
+        sizes = [self.model(owner_id=row['owner'], notes_count=row['notes_count']) for row in counts]
+        with transaction.atomic(using=self.db):
+            self.all().delete()
+            self.bulk_create(sizes, batch_size=1000)
+        return len(sizes)
+
+
+class NoteSlugCounterManager(models.Manager):
+    '''NoteSlugCounter model custom objects manager'''
+
+    def allocate(self, owner_pk, base: str, count: int = 1) -> int:
+        '''
+        Reserves `count` numbers of slugs with `base` for the notes of the user with `owner_pk`. Returns the last of them.
+
+        The counter is created or incremented, and read back, in a single `INSERT ... ON CONFLICT DO UPDATE ... RETURNING`
+        statement where the database supports it, so concurrent allocations never get the same number.
+        Other databases increment it in a transaction.
+        '''
+        connection = connections[self.db]
+        if connection.features.supports_update_conflicts_with_target and connection.features.can_return_columns_from_insert:
+            quote_name = connection.ops.quote_name
+            table = quote_name(self.model._meta.db_table)
+            owner, base_column, last_number = (quote_name(self.model._meta.get_field(name).column) for name in ('owner', 'base', 'last_number'))
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {table} ({owner}, {base_column}, {last_number}) VALUES (%s, %s, %s) '
+                    f'ON CONFLICT ({owner}, {base_column}) DO UPDATE SET {last_number} = {table}.{last_number} + %s '
+                    f'RETURNING {last_number}',
+                    [owner_pk, base, count, count],
+                )
+                return cursor.fetchone()[0]
+
+        with transaction.atomic(using=self.db):
+            counter, _ = self.select_for_update().get_or_create(owner_id=owner_pk, base=base)
+            counter.last_number += count
+            counter.save(update_fields=['last_number'])
+            return counter.last_number
@@ -0,0 +1,93 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:34
+
+import ast
+import json
+
+import notes.fields
+from django.db import migrations
+
+
+BATCH_SIZE = 500
+
+
+def encode_content(content: list) -> str:
+    '''Encodes note content as compact JSON text, as `notes.fields.encode_note_content` did at the time of this migration'''
+    return json.dumps(content, separators=(',', ':'), ensure_ascii=False)
+
+
+def convert_rows(apps, schema_editor, encode):
+    '''Re-encodes every stored note content in batches of `BATCH_SIZE` rows'''
+    Note = apps.get_model('notes', 'Note')
+    connection = schema_editor.connection
+    table = connection.ops.quote_name(Note._meta.db_table)
+    last_pk = 0
+
+    while True:
+        # Read the raw column so that `NoteContentField.from_db_value` is bypassed
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT id, note_content FROM {table} WHERE id > %s ORDER BY id LIMIT %s',
+                [last_pk, BATCH_SIZE],
+            )
+            rows = cursor.fetchall()
+        if not rows:
+            break
+
+        updates = []
+        for pk, value in rows:
+            if isinstance(value, str):
+                new_value = encode(value)
+                if new_value is not None and new_value != value:
+                    updates.append((new_value, pk))
+
+        if updates:
+            with connection.cursor() as cursor:
+                cursor.executemany(f'UPDATE {table} SET note_content = %s WHERE id = %s', updates)
+        last_pk = rows[-1][0]
+
+
+def repr_to_json(value: str):
+    try:
+        json.loads(value)
+        return None
+    except ValueError:
+        pass
+
+    try:
+        content = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return None
+    return encode_content(content)
+
+
+def json_to_repr(value: str):
+    try:
+        content = json.loads(value)
+    except ValueError:
+        return None
+    return str(content)
+
+
+def forwards(apps, schema_editor):
+    convert_rows(apps, schema_editor, repr_to_json)
+
+
+def backwards(apps, schema_editor):
+    convert_rows(apps, schema_editor, json_to_repr)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0004_remove_note_content_note_note_content'),
+    ]
+
+    operations = [
+        # Rows are converted while the column is still text, before any JSON column type is applied
+        migrations.RunPython(forwards, backwards),
+        migrations.AlterField(
+            model_name='note',
+            name='note_content',
+            field=notes.fields.NoteContentField(default=[{'body': '<str>', 'type': 'text'}, {'body': {'checked': False, 'item_value': '<str>'}, 'type': 'list_item'}, {'body': {'list_items': [{'body': {'checked': False, 'item_value': '<str>'}, 'type': 'list_item'}, {'body': {'checked': False, 'item_value': '<str>'}, 'type': 'list_item'}], 'title': '<str>'}, 'type': 'list'}], help_text='Construct your note content using the default format provided in the field.', null=True, storage='json'),
+        ),
+    ]
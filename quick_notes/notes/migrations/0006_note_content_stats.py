@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0005_note_content_json_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='approximate_word_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='list_items_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='lists_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='texts_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+    ]
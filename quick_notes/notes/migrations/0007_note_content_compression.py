@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:39
+
+import notes.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0006_note_content_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='note',
+            name='note_content',
+            field=notes.fields.NoteContentField(compress=True, default=[{'body': '<str>', 'type': 'text'}, {'body': {'checked': False, 'item_value': '<str>'}, 'type': 'list_item'}, {'body': {'list_items': [{'body': {'checked': False, 'item_value': '<str>'}, 'type': 'list_item'}, {'body': {'checked': False, 'item_value': '<str>'}, 'type': 'list_item'}], 'title': '<str>'}, 'type': 'list'}], help_text='Construct your note content using the default format provided in the field.', null=True, storage='json'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0007_note_content_compression'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('title', models.CharField(max_length=400, null=True)),
+                ('is_snapshot', models.BooleanField(default=False)),
+                ('data', models.TextField(help_text='JSON encoded content of a snapshot, or operations of a delta')),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('note', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='notes.note')),
+            ],
+            options={
+                'verbose_name': 'note revision',
+                'verbose_name_plural': 'note revisions',
+                'ordering': ['-number'],
+                'unique_together': {('note', 'number')},
+            },
+        ),
+    ]
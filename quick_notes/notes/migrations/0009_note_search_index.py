@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0008_note_revisions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.FloatField()),
+                ('note', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='notes.note')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'note search term',
+                'verbose_name_plural': 'note search terms',
+                'indexes': [models.Index(fields=['owner', 'term'], name='notes_search_owner_term_idx')],
+                'unique_together': {('note', 'term')},
+            },
+        ),
+    ]
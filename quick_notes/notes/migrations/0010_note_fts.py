@@ -0,0 +1,97 @@
+import ast
+import base64
+import json
+import zlib
+
+from django.db import migrations
+
+
+BATCH_SIZE = 500
+# Header of compressed content, see migration 0007
+COMPRESSION_HEADER = '"zlib:'
+
+
+def decode_content(value: str) -> list:
+    '''Decodes stored content: JSON text, compressed JSON text or the legacy Python-repr encoding'''
+    if value.startswith(COMPRESSION_HEADER):
+        value = zlib.decompress(base64.b64decode(value[len(COMPRESSION_HEADER):-1])).decode('utf-8')
+    try:
+        return json.loads(value)
+    except ValueError:
+        return ast.literal_eval(value)
+
+
+def get_columns(title, content: list):
+    '''Returns the title, the list titles and the rest of the text of a note, as the columns of the table hold them'''
+    headings, body = [], []
+    for item in content:
+        item_type = item['type'].lower()
+        if item_type == 'text':
+            body.append(item['body'])
+        elif item_type == 'list':
+            headings.append(item['body']['title'])
+            body.extend(list_item['body']['item_value'] for list_item in item['body']['list_items'])
+    return title or '', '\n'.join(headings), '\n'.join(body)
+
+
+def create_fts_table(apps, schema_editor):
+    '''Creates and fills the full-text search table of `notes.search.FTS5SearchBackend`, on SQLite only'''
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+
+    Note = apps.get_model('notes', 'Note')
+    table = connection.ops.quote_name(Note._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE VIRTUAL TABLE notes_note_fts USING fts5("
+            "title, headings, body, owner_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER notes_note_fts_delete AFTER DELETE ON {table} BEGIN "
+            "DELETE FROM notes_note_fts WHERE rowid = old.id; END"
+        )
+
+    last_pk = 0
+    while True:
+        # Read the raw column so that `NoteContentField.from_db_value` is bypassed
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT id, title, note_content, owner_id FROM {table} WHERE id > %s ORDER BY id LIMIT %s',
+                [last_pk, BATCH_SIZE],
+            )
+            rows = cursor.fetchall()
+        if not rows:
+            break
+
+        values = []
+        for pk, title, content, owner_id in rows:
+            values.append((pk, *get_columns(title, decode_content(content) if content else []), owner_id))
+
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO notes_note_fts (rowid, title, headings, body, owner_id) VALUES (%s, %s, %s, %s, %s)',
+                values,
+            )
+        last_pk = rows[-1][0]
+
+
+def drop_fts_table(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("DROP TRIGGER IF EXISTS notes_note_fts_delete")
+        cursor.execute("DROP TABLE IF EXISTS notes_note_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0009_note_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,108 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:02
+
+import ast
+import base64
+import json
+import re
+import unicodedata
+import zlib
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 500
+# Header of compressed content, see migration 0007
+COMPRESSION_HEADER = '"zlib:'
+# As in `notes.search`, at the time of this migration
+TOKEN_PATTERN = re.compile(r"\w+")
+MAX_TERM_LENGTH = 64
+
+
+def decode_content(value: str) -> list:
+    '''Decodes stored content: JSON text, compressed JSON text or the legacy Python-repr encoding'''
+    if value.startswith(COMPRESSION_HEADER):
+        value = zlib.decompress(base64.b64decode(value[len(COMPRESSION_HEADER):-1])).decode('utf-8')
+    try:
+        return json.loads(value)
+    except ValueError:
+        return ast.literal_eval(value)
+
+
+def get_terms(title, content: list) -> set:
+    '''Returns the distinct terms of the title and the text of a note'''
+    texts = [title] if title else []
+    for item in content:
+        item_type = item['type'].lower()
+        if item_type == 'text':
+            texts.append(item['body'])
+        elif item_type == 'list':
+            texts.append(item['body']['title'])
+            texts.extend(list_item['body']['item_value'] for list_item in item['body']['list_items'])
+
+    terms = set()
+    for text in texts:
+        text = unicodedata.normalize('NFKC', text).casefold()
+        terms.update(token[:MAX_TERM_LENGTH] for token in TOKEN_PATTERN.findall(text))
+    return terms
+
+
+def get_trigrams(term: str) -> set:
+    padded = f"  {term} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+def index_terms(apps, schema_editor):
+    '''Fills the vocabulary of fuzzy searches with the terms of existing notes'''
+    Note = apps.get_model('notes', 'Note')
+    NoteTermTrigram = apps.get_model('notes', 'NoteTermTrigram')
+    connection = schema_editor.connection
+    table = connection.ops.quote_name(Note._meta.db_table)
+    terms = set()
+    last_pk = 0
+
+    while True:
+        # Read the raw column so that `NoteContentField.from_db_value` is bypassed
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT id, title, note_content FROM {table} WHERE id > %s ORDER BY id LIMIT %s',
+                [last_pk, BATCH_SIZE],
+            )
+            rows = cursor.fetchall()
+        if not rows:
+            break
+
+        for pk, title, content in rows:
+            terms.update(get_terms(title, decode_content(content) if content else []))
+        last_pk = rows[-1][0]
+
+    entries = []
+    for term in terms:
+        trigrams = get_trigrams(term)
+        entries.extend(NoteTermTrigram(term=term, trigram=trigram, trigrams_count=len(trigrams)) for trigram in trigrams)
+    NoteTermTrigram.objects.bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0010_note_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteTermTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('trigram', models.CharField(max_length=3)),
+                ('trigrams_count', models.PositiveSmallIntegerField()),
+            ],
+            options={
+                'verbose_name': 'note term trigram',
+                'verbose_name_plural': 'note term trigrams',
+                'indexes': [models.Index(fields=['trigram', 'trigrams_count'], name='notes_trigram_idx')],
+                'unique_together': {('term', 'trigram')},
+            },
+        ),
+        migrations.RunPython(index_terms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:36
+
+import ast
+import base64
+import json
+import zlib
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+BATCH_SIZE = 500
+# Header of compressed content, see migration 0007
+COMPRESSION_HEADER = '"zlib:'
+
+
+def decode_content(value: str) -> list:
+    '''Decodes stored content: JSON text, compressed JSON text or the legacy Python-repr encoding'''
+    if value.startswith(COMPRESSION_HEADER):
+        value = zlib.decompress(base64.b64decode(value[len(COMPRESSION_HEADER):-1])).decode('utf-8')
+    try:
+        return json.loads(value)
+    except ValueError:
+        return ast.literal_eval(value)
+
+
+def get_unchecked_items_count(content: list) -> int:
+    '''Counts the list items of a note that are not checked, as `NoteContent.details` did at the time of this migration'''
+    count = 0
+    for item in content:
+        item_type = item['type'].lower()
+        if item_type == 'list':
+            list_items = item['body']['list_items']
+        elif item_type == 'list_item':
+            list_items = [item]
+        else:
+            continue
+        for list_item in list_items:
+            # String booleans are kept as given, and read as booleans
+            checked = list_item['body'].get('checked', None)
+            count += not (checked is True or checked == 'True')
+    return count
+
+
+def count_unchecked_items(apps, schema_editor):
+    '''Counts the unchecked list items of existing notes that have list items'''
+    Note = apps.get_model('notes', 'Note')
+    connection = schema_editor.connection
+    table = connection.ops.quote_name(Note._meta.db_table)
+    last_pk = 0
+
+    while True:
+        # Read the raw column so that `NoteContentField.from_db_value` is bypassed
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT id, note_content FROM {table} WHERE id > %s AND list_items_count > 0 ORDER BY id LIMIT %s',
+                [last_pk, BATCH_SIZE],
+            )
+            rows = cursor.fetchall()
+        if not rows:
+            break
+
+        notes = []
+        for pk, content in rows:
+            unchecked_items_count = get_unchecked_items_count(decode_content(content)) if content else 0
+            notes.append(Note(pk=pk, unchecked_items_count=unchecked_items_count))
+        Note.objects.bulk_update(notes, ['unchecked_items_count'])
+        last_pk = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0011_note_term_trigrams'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='unchecked_items_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['owner', 'starred'], name='notes_owner_starred_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['owner', 'date_created'], name='notes_owner_created_idx'),
+        ),
+        migrations.RunPython(count_unchecked_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0012_note_query_filters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteIndexJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('note_id', models.BigIntegerField(unique=True)),
+                ('action', models.CharField(choices=[('index', 'Index'), ('delete', 'Delete')], max_length=10)),
+                ('generation', models.PositiveIntegerField(default=1)),
+                ('enqueued_at', models.DateTimeField(db_index=True)),
+                ('available_at', models.DateTimeField()),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('locked_by', models.CharField(blank=True, max_length=100, null=True)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'note index job',
+                'verbose_name_plural': 'note index jobs',
+            },
+        ),
+    ]
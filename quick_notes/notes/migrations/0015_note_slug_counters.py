@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:00
+
+import re
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# As in `notes.slugs`, at the time of this migration
+NUMBERED_SLUG_PATTERN = re.compile(r'^(?P<base>.+)[-_](?P<number>\d+)$')
+
+
+def parse_numbered_slug(slug: str) -> tuple:
+    '''Returns the base and number that `slug` would be allocated from. Slugs numbered with `_` are parsed too.'''
+    match = NUMBERED_SLUG_PATTERN.match(slug)
+    if match is None:
+        return slug, 1
+    return match['base'], int(match['number']) + 1
+
+
+def create_slug_counters(apps, schema_editor):
+    '''Starts the slug counters of existing notes past the highest number taken with each base'''
+    Note = apps.get_model('notes', 'Note')
+    NoteSlugCounter = apps.get_model('notes', 'NoteSlugCounter')
+    last_numbers = {}
+
+    for owner_pk, slug in Note.objects.filter(owner__isnull=False).values_list('owner_id', 'slug').iterator():
+        for base, number in {(slug, 1), parse_numbered_slug(slug)}:
+            key = (owner_pk, base)
+            last_numbers[key] = max(number, last_numbers.get(key, 0))
+
+    NoteSlugCounter.objects.bulk_create(
+        [NoteSlugCounter(owner_id=owner_pk, base=base, last_number=number) for (owner_pk, base), number in last_numbers.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0014_note_collection_versions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='note',
+            name='slug',
+            field=models.SlugField(auto_created=True, blank=True, editable=False, max_length=200),
+        ),
+        migrations.CreateModel(
+            name='NoteSlugCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base', models.SlugField(max_length=200)),
+                ('last_number', models.PositiveIntegerField(default=0)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'note slug counter',
+                'verbose_name_plural': 'note slug counters',
+                'unique_together': {('owner', 'base')},
+            },
+        ),
+        migrations.RunPython(create_slug_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0015_note_slug_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['owner', 'last_edited'], name='notes_owner_edited_idx'),
+        ),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:02
+
+import ast
+import base64
+import json
+import zlib
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 500
+# Header of compressed content, see migration 0007
+COMPRESSION_HEADER = '"zlib:'
+PREVIEW_LENGTH = 200
+
+
+def decode_content(value: str) -> list:
+    '''Decodes stored content: JSON text, compressed JSON text or the legacy Python-repr encoding'''
+    if value.startswith(COMPRESSION_HEADER):
+        value = zlib.decompress(base64.b64decode(value[len(COMPRESSION_HEADER):-1])).decode('utf-8')
+    try:
+        return json.loads(value)
+    except ValueError:
+        return ast.literal_eval(value)
+
+
+def iter_texts(content: list):
+    '''Yields the text of each item of the content in order, list items following the title of their list'''
+    for item in content:
+        item_type = item['type'].lower()
+        if item_type == 'text':
+            yield item['body']
+        elif item_type == 'list_item':
+            yield item['body']['item_value']
+        elif item_type == 'list':
+            yield item['body']['title']
+            for list_item in item['body']['list_items']:
+                yield list_item['body']['item_value']
+
+
+def get_preview(content: list, length: int = PREVIEW_LENGTH) -> str:
+    '''The text of the content in order, with its whitespace collapsed, cut to at most `length` characters'''
+    texts = []
+    size = 0
+    for text in iter_texts(content):
+        text = ' '.join(text.split())
+        if text:
+            texts.append(text)
+            size += len(text) + 1
+        if size > length:
+            break
+
+    preview = ' '.join(texts)
+    if len(preview) <= length:
+        return preview
+    return preview[:length - 1].rstrip() + '…'
+
+
+def compute_previews(apps, schema_editor):
+    '''Stores the preview of existing notes with content'''
+    Note = apps.get_model('notes', 'Note')
+    connection = schema_editor.connection
+    table = connection.ops.quote_name(Note._meta.db_table)
+    last_pk = 0
+
+    while True:
+        # Read the raw column so that `NoteContentField.from_db_value` is bypassed
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT id, note_content FROM {table} WHERE id > %s AND note_content IS NOT NULL ORDER BY id LIMIT %s',
+                [last_pk, BATCH_SIZE],
+            )
+            rows = cursor.fetchall()
+        if not rows:
+            break
+
+        notes = [Note(pk=pk, preview=get_preview(decode_content(content) if content else [])) for pk, content in rows]
+        Note.objects.bulk_update(notes, ['preview'])
+        last_pk = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0016_note_owner_edited_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='preview',
+            field=models.CharField(blank=True, default='', editable=False, max_length=200),
+        ),
+        migrations.RunPython(compute_previews, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0017_note_preview'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='note',
+            name='notes_owner_starred_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='note',
+            name='notes_owner_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['owner', '-date_created', 'title', 'id'], name='notes_owner_created_page_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['owner', 'starred', '-date_created', 'title', 'id'], name='notes_owner_starred_page_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:27
+
+import django.db.models.deletion
+import notes.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0018_note_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteFTSEntry',
+            fields=[
+                ('note', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='fts_entry', serialize=False, to='notes.note')),
+                ('document', notes.fields.FTSTableField(db_column='notes_note_fts')),
+                ('title', models.TextField()),
+                ('headings', models.TextField()),
+                ('body', models.TextField()),
+                ('owner_id', models.BigIntegerField()),
+            ],
+            options={
+                'verbose_name': 'note full-text search entry',
+                'verbose_name_plural': 'note full-text search entries',
+                'db_table': 'notes_note_fts',
+                'managed': False,
+            },
+        ),
+    ]
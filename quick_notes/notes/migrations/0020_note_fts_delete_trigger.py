@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+def create_delete_trigger(apps, schema_editor):
+    '''
+    Recreates the trigger deleting the full-text search rows of deleted notes, on SQLite only.
+
+    SQLite drops the triggers of a table when Django rebuilds it to alter its columns, as migration 0012 did,
+    so the trigger of migration 0010 is gone, and the rows of the notes deleted since then are left behind.
+    '''
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+
+    Note = apps.get_model('notes', 'Note')
+    table = connection.ops.quote_name(Note._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS notes_note_fts_delete AFTER DELETE ON {table} BEGIN "
+            "DELETE FROM notes_note_fts WHERE rowid = old.id; END"
+        )
+        cursor.execute(f"DELETE FROM notes_note_fts WHERE rowid NOT IN (SELECT id FROM {table})")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0019_note_fts_entry'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_delete_trigger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+def create_vocabulary_table(apps, schema_editor):
+    '''
+    Creates the `fts5vocab` table listing the occurrences of each token of the full-text search table, on SQLite only.
+
+    `notes.search.FTS5SearchBackend.find_terms` reads it to look up many terms in a single query.
+    '''
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS notes_note_fts_vocab USING fts5vocab(notes_note_fts, instance)")
+
+
+def drop_vocabulary_table(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS notes_note_fts_vocab")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0021_note_term_trigram_owner'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_vocabulary_table, drop_vocabulary_table),
+    ]
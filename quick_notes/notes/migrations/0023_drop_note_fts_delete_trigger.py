@@ -0,0 +1,44 @@
+from django.db import migrations
+
+
+def drop_delete_trigger(apps, schema_editor):
+    '''
+    Drops the trigger deleting the full-text search rows of deleted notes, on SQLite only.
+
+    SQLite drops the triggers of a table whenever Django rebuilds it, so the rows are now removed by
+    `notes.signals.remove_deleted_note` instead. Rows of notes deleted while the trigger was missing are deleted too.
+    '''
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+
+    Note = apps.get_model('notes', 'Note')
+    table = connection.ops.quote_name(Note._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute("DROP TRIGGER IF EXISTS notes_note_fts_delete")
+        cursor.execute(f"DELETE FROM notes_note_fts WHERE rowid NOT IN (SELECT id FROM {table})")
+
+
+def create_delete_trigger(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+
+    Note = apps.get_model('notes', 'Note')
+    table = connection.ops.quote_name(Note._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS notes_note_fts_delete AFTER DELETE ON {table} BEGIN "
+            "DELETE FROM notes_note_fts WHERE rowid = old.id; END"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0022_note_fts_vocabulary'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_delete_trigger, create_delete_trigger),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def count_notes(apps, schema_editor):
+    '''Counts the existing notes of each user'''
+    Note = apps.get_model('notes', 'Note')
+    NoteCollectionSize = apps.get_model('notes', 'NoteCollectionSize')
+    counts = Note.objects.filter(owner__isnull=False).order_by().values('owner').annotate(notes_count=models.Count('pk'))
+    NoteCollectionSize.objects.bulk_create(
+        [NoteCollectionSize(owner_id=row['owner'], notes_count=row['notes_count']) for row in counts],
+        batch_size=1000,
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0023_drop_note_fts_delete_trigger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteCollectionSize',
+            fields=[
+                ('owner', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('notes_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'note collection size',
+                'verbose_name_plural': 'note collection sizes',
+            },
+        ),
+        migrations.RunPython(count_notes, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,15 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth import get_user_model
-from django.template.defaultfilters import slugify
 from django.utils.translation import gettext_lazy as _
 
-from .managers import NoteManager
-from .fields import NoteContentField, INITIAL_CONTENT_FORMAT
+from .conf import get_setting
+from .managers import (
+    NoteManager, NoteRevisionManager, NoteSearchTermManager, NoteTermTrigramManager, NoteIndexJobManager,
+    NoteCollectionVersionManager, NoteCollectionSizeManager, NoteSlugCounterManager,
+)
+from .fields import NoteContentField, FTSTableField, LazyNoteContent, INITIAL_CONTENT_FORMAT, PREVIEW_LENGTH
+from .search import get_search_backend, get_note_terms
+from .slugs import get_slug_base, get_numbered_slug
 
 User = get_user_model()
 
@@ -13,12 +18,32 @@ class Note(models.Model):
     '''Notes model'''
 
     title = models.CharField(max_length=400, null=True, help_text='Enter a title for your note')
-    note_content = NoteContentField(null=True)
+    note_content = NoteContentField(null=True, storage=NoteContentField.STORAGE_JSON, compress=True)
     owner = models.ForeignKey(User, related_name='notes', on_delete=models.CASCADE, verbose_name='Note owner', default=None, null=True)
-    slug = models.SlugField(max_length=200, unique=True, auto_created=True, editable=False, blank=True)
+    # Unique per owner, see `NoteSlugCounter`
+    slug = models.SlugField(max_length=200, auto_created=True, editable=False, blank=True)
     date_created = models.DateTimeField(auto_now_add=True)
     last_edited = models.DateTimeField(auto_now=True)
     starred = models.BooleanField(default=False)
+    texts_count = models.PositiveIntegerField(default=0, editable=False, db_index=True)
+    list_items_count = models.PositiveIntegerField(default=0, editable=False, db_index=True)
+    lists_count = models.PositiveIntegerField(default=0, editable=False, db_index=True)
+    unchecked_items_count = models.PositiveIntegerField(default=0, editable=False, db_index=True)
+    approximate_word_count = models.PositiveIntegerField(default=0, editable=False, db_index=True)
+    preview = models.CharField(max_length=PREVIEW_LENGTH, blank=True, default='', editable=False)
+
+    # Maps the content statistics fields to their keys in `NoteContent.details`
+    content_stats_fields = {
+        'texts_count': 'no_of_text_content',
+        'list_items_count': 'no_of_list_items',
+        'lists_count': 'no_of_lists',
+        'unchecked_items_count': 'no_of_unchecked_items',
+        'approximate_word_count': 'approximate_word_count',
+    }
+    # Fields computed from the content when it changes
+    content_derived_fields = [*content_stats_fields, 'preview']
+    # Slugs allocated by a save before it gives up on finding an unused one
+    max_slug_attempts = 5
 
     objects = NoteManager()
 
@@ -27,23 +52,375 @@ class Note(models.Model):
         verbose_name_plural = _("notes")
         ordering = ['-date_created', 'title']
         unique_together = ('slug', 'owner')
+        indexes = [
+            # Read in order by the keyset pagination of note lists, and used by the `starred:` and `created:` filters
+            # of note searches
+            models.Index(fields=['owner', '-date_created', 'title', 'id'], name='notes_owner_created_page_idx'),
+            models.Index(fields=['owner', 'starred', '-date_created', 'title', 'id'], name='notes_owner_starred_page_idx'),
+            # Used by the last edited note of `users.managers.UserQuerySet.with_note_stats`
+            models.Index(fields=['owner', 'last_edited'], name='notes_owner_edited_idx'),
+        ]
 
     def __str__(self):
         return self.slug
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        note = super().from_db(db, field_names, values)
+        # Kept to tell whether the title changed when the note is saved
+        note._loaded_title = note.__dict__.get('title', None)
+        if 'owner_id' in note.__dict__:
+            # Kept to move the note between the counts of `NoteCollectionSize` when its owner changes
+            note._loaded_owner_id = note.owner_id
+        return note
+
+
+    @property
+    def content_details(self):
+        '''The stored statistics of the note's content'''
+        return {key: getattr(self, field) for field, key in self.content_stats_fields.items()}
+
+
+    def update_content_stats(self, force=False):
+        '''
+        Computes the statistics and preview of the note's content and sets them on the note.
+
+        Content loaded from the database that has not been accessed since is unchanged,
+        so its statistics are only recomputed when `force` is True.
+
+        Returns True if the statistics were computed.
+        '''
+        content = self.note_content
+        if not force and isinstance(content, LazyNoteContent) and not content.is_materialized:
+            return False
+
+        if content is None:
+            details = {}
+            self.preview = ''
+        else:
+            content = self._meta.get_field('note_content').to_python(content)
+            self.note_content = content
+            details = content.details
+            self.preview = content.get_preview()
+
+        for field, key in self.content_stats_fields.items():
+            setattr(self, field, details.get(key, 0))
+        return True
+
+
+    def update_search_index(self):
+        '''Indexes the note with the configured search backend, and adds its terms to the owner's vocabulary of fuzzy searches'''
+        get_search_backend().index(self)
+        content = self.note_content
+        NoteTermTrigram.objects.add_terms(self.owner_id, get_note_terms(self.title, content.items if content is not None else []))
+
+
+    def schedule_search_index(self):
+        '''
+        Queues the note to be indexed by the `run_index_worker` command with `INDEX_IN_BACKGROUND` on,
+        and indexes it right away otherwise, or when the queue is too far behind.
+        '''
+        if get_setting("INDEX_IN_BACKGROUND") and not NoteIndexJob.objects.is_backlogged():
+            NoteIndexJob.objects.enqueue(self.pk, NoteIndexJob.ACTION_INDEX)
+        else:
+            self.update_search_index()
+
+
+    def update_collection_sizes(self, previous_owner_pk):
+        '''Moves the note from the count of its previous owner, None when it was just created, to that of its owner'''
+        if previous_owner_pk is not None:
+            NoteCollectionSize.objects.add(previous_owner_pk, -1)
+        if self.owner_id is not None:
+            NoteCollectionSize.objects.add(self.owner_id, 1)
+
+
+    def bump_collection_version(self):
+        '''
+        Invalidates the cached searches and list ETags of the owner's notes once the current transaction commits.
+
+        Bumping after the commit means a search that read the old version can only have cached
+        the notes as they were before the change, under a version that is no longer current.
+        '''
+        if self.owner_id is not None:
+            owner_pk = self.owner_id
+            transaction.on_commit(lambda: NoteCollectionVersion.objects.bump(owner_pk))
+
+
+    def allocate_slug(self, base: str) -> str:
+        '''Returns the next unused slug with `base` among the owner's notes. Notes without an owner get `base` as is.'''
+        if self.owner_id is None:
+            return base
+        return get_numbered_slug(base, NoteSlugCounter.objects.allocate(self.owner_id, base))
+
+
+    def save_with_slug(self, slug_base, *args, **kwargs):
+        '''
+        Saves the note, allocating another slug with `slug_base` while the allocated one is taken.
+
+        Slugs are taken outside of the allocator by notes saved with an explicit slug, e.g. a title `Groceries 1`
+        takes the slug `groceries-1` of the second `Groceries` note. `slug_base` is None when the slug was not allocated.
+        '''
+        for attempt in range(self.max_slug_attempts):
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                if slug_base is None or attempt == self.max_slug_attempts - 1:
+                    raise
+                if not Note.objects.filter(owner_id=self.owner_id, slug=self.slug).exclude(pk=self.pk).exists():
+                    raise
+                self.slug = self.allocate_slug(slug_base)
+
 
     def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields', None)
+        content_changed = False
+        if update_fields is None or 'note_content' in update_fields:
+            content_changed = self.update_content_stats()
+            if content_changed and update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, *self.content_derived_fields}
+
+        slug_base = None
         if not self.slug:
-            slug = slugify(self.title)
+            slug_base = get_slug_base(self.title)
+            self.slug = self.allocate_slug(slug_base)
+
+        title_changed = self.title != getattr(self, '_loaded_title', None) and (update_fields is None or 'title' in update_fields)
+        previous_owner_pk = None if self._state.adding else getattr(self, '_loaded_owner_id', self.owner_id)
 
-            if self.owner:
-                qs = Note.objects.filter(owner=self.owner, slug=slug)
-                if qs.exists():
-                    slug = f'{slug}_{qs.count()}'
-                    
-            self.slug = slug
+        with transaction.atomic():
+            self.save_with_slug(slug_base, *args, **kwargs)
+            if self.owner_id != previous_owner_pk and (update_fields is None or 'owner' in update_fields):
+                self.update_collection_sizes(previous_owner_pk)
+            if content_changed or title_changed:
+                NoteRevision.objects.record(self)
+                self.schedule_search_index()
+            self.bump_collection_version()
+        self._loaded_title = self.title
+        self._loaded_owner_id = self.owner_id
 
-        return super().save(*args, **kwargs)
 
+    def delete(self, *args, **kwargs):
+        # Read before the row is gone, in case the content was deferred
+        content = self.note_content
+        terms = get_note_terms(self.title, content.items if content is not None else [])
+        with transaction.atomic():
+            # Removed from the search index by `notes.signals.remove_deleted_note`, before its terms are pruned
+            result = super().delete(*args, **kwargs)
+            NoteTermTrigram.objects.prune(self.owner_id, terms)
+            self.bump_collection_version()
+        return result
 
+
+
+class NoteRevision(models.Model):
+    '''
+    A saved state of a note.
     
+    Holds either a full snapshot of the note's content or a delta of content operations from the previous revision.
+    '''
+
+    note = models.ForeignKey(Note, related_name='revisions', on_delete=models.CASCADE)
+    number = models.PositiveIntegerField()
+    title = models.CharField(max_length=400, null=True)
+    is_snapshot = models.BooleanField(default=False)
+    data = models.TextField(help_text='JSON encoded content of a snapshot, or operations of a delta')
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    objects = NoteRevisionManager()
+
+    class Meta:
+        verbose_name = _("note revision")
+        verbose_name_plural = _("note revisions")
+        ordering = ['-number']
+        unique_together = ('note', 'number')
+
+    def __str__(self):
+        return f"{self.note} revision {self.number}"
+
+
+    
+
+
+
+class NoteSearchTerm(models.Model):
+    '''
+    An entry of the notes search index, holding the weight of a term in a note.
+
+    Entries are indexed by owner and term, so a search only reads the entries of the user's notes that contain the searched terms.
+    '''
+
+    owner = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    note = models.ForeignKey(Note, related_name='search_terms', on_delete=models.CASCADE)
+    term = models.CharField(max_length=64)
+    weight = models.FloatField()
+
+    objects = NoteSearchTermManager()
+
+    class Meta:
+        verbose_name = _("note search term")
+        verbose_name_plural = _("note search terms")
+        unique_together = ('note', 'term')
+        indexes = [
+            models.Index(fields=['owner', 'term'], name='notes_search_owner_term_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} in {self.note}"
+
+
+
+class NoteFTSEntry(models.Model):
+    '''
+    A row of the SQLite FTS5 table searched by `notes.search.FTS5SearchBackend`, keyed by the id of its note.
+
+    The table is created and written by the backend and the notes migrations, on SQLite only.
+    It is mapped so that searches join notes with their matching rows.
+    '''
+
+    note = models.OneToOneField(
+        Note, primary_key=True, db_column='rowid', related_name='fts_entry', on_delete=models.DO_NOTHING, db_constraint=False,
+    )
+    document = FTSTableField(db_column='notes_note_fts')
+    title = models.TextField()
+    headings = models.TextField()
+    body = models.TextField()
+    owner_id = models.BigIntegerField()
+
+    class Meta:
+        managed = False
+        db_table = 'notes_note_fts'
+        verbose_name = _("note full-text search entry")
+        verbose_name_plural = _("note full-text search entries")
+
+    def __str__(self):
+        return f"Full-text search entry of note {self.note_id}"
+
+
+
+class NoteTermTrigram(models.Model):
+    '''
+    An entry of the trigram index of the terms found in a user's notes, used by fuzzy searches.
+
+    Holds one trigram of a term, along with the number of trigrams of the term. Each user has their own
+    vocabulary, so the expansions of a fuzzy search are only spent on terms of the user's notes.
+    Terms are added as notes are saved, and removed when the last note containing them is deleted.
+    Terms edited out of notes are removed by the `rebuild_search_index` command.
+    '''
+
+    owner = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    term = models.CharField(max_length=64)
+    trigram = models.CharField(max_length=3)
+    trigrams_count = models.PositiveSmallIntegerField()
+
+    objects = NoteTermTrigramManager()
+
+    class Meta:
+        verbose_name = _("note term trigram")
+        verbose_name_plural = _("note term trigrams")
+        unique_together = ('owner', 'term', 'trigram')
+        indexes = [
+            models.Index(fields=['owner', 'trigram', 'trigrams_count'], name='notes_owner_trigram_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.trigram!r} of {self.term}"
+
+
+
+class NoteIndexJob(models.Model):
+    '''
+    A pending update of the search index of a note, applied by the `run_index_worker` command.
+
+    Jobs are coalesced per note: a change to a note with a pending job bumps the job's `generation`
+    instead of adding a job. `enqueued_at` is the time of the oldest change the job covers.
+    '''
+    ACTION_INDEX = 'index'
+    ACTION_DELETE = 'delete'
+    ACTION_CHOICES = [
+        (ACTION_INDEX, 'Index'),
+        (ACTION_DELETE, 'Delete'),
+    ]
+
+    # Not a foreign key, as the jobs of deleted notes are kept until the notes are removed from the index
+    note_id = models.BigIntegerField(unique=True)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    generation = models.PositiveIntegerField(default=1)
+    enqueued_at = models.DateTimeField(db_index=True)
+    available_at = models.DateTimeField()
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    locked_by = models.CharField(max_length=100, null=True, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    objects = NoteIndexJobManager()
+
+    class Meta:
+        verbose_name = _("note index job")
+        verbose_name_plural = _("note index jobs")
+
+    def __str__(self):
+        return f"{self.action} note {self.note_id}"
+
+
+class NoteCollectionVersion(models.Model):
+    '''
+    Version of a user's notes, bumped whenever one of them is saved, deleted or reindexed.
+
+    Results cached per user, such as searches, are kept along with the version they were computed at
+    and are stale once it changed. The ETags of note lists are derived from it.
+    '''
+    owner = models.OneToOneField(User, primary_key=True, on_delete=models.CASCADE, related_name='+')
+    version = models.PositiveBigIntegerField(default=0)
+
+    objects = NoteCollectionVersionManager()
+
+    class Meta:
+        verbose_name = _("note collection version")
+        verbose_name_plural = _("note collection versions")
+
+    def __str__(self):
+        return f"Notes of {self.owner_id} at version {self.version}"
+
+
+class NoteCollectionSize(models.Model):
+    '''
+    Number of a user's notes, counted as they are created and deleted.
+
+    Read by `notes.search.IndexSearchBackend` to weigh searched terms by how rare they are among the user's notes,
+    without counting the notes on every search.
+    '''
+    owner = models.OneToOneField(User, primary_key=True, on_delete=models.CASCADE, related_name='+')
+    notes_count = models.PositiveIntegerField(default=0)
+
+    objects = NoteCollectionSizeManager()
+
+    class Meta:
+        verbose_name = _("note collection size")
+        verbose_name_plural = _("note collection sizes")
+
+    def __str__(self):
+        return f"{self.notes_count} notes of {self.owner_id}"
+
+
+class NoteSlugCounter(models.Model):
+    '''
+    Number of slugs allocated to an owner's notes with the same base slug, the slug of their title.
+
+    Allocating a slug increments the counter in a single statement, so concurrent saves of notes with
+    the same title get distinct slugs without looking up the existing ones.
+    '''
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    base = models.SlugField(max_length=200)
+    last_number = models.PositiveIntegerField(default=0)
+
+    objects = NoteSlugCounterManager()
+
+    class Meta:
+        verbose_name = _("note slug counter")
+        verbose_name_plural = _("note slug counters")
+        unique_together = ('owner', 'base')
+
+    def __str__(self):
+        return f"{self.base} of {self.owner_id}: {self.last_number}"
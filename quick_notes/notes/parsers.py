@@ -0,0 +1,207 @@
+import codecs
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework import exceptions, status
+from rest_framework.parsers import BaseParser
+
+from .conf import get_setting
+from .fields import NoteContent
+from .renderers import RawJSONRenderer
+from .schema import content_types
+
+
+
+class PayloadTooLarge(exceptions.APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = "Request body is too large."
+    default_code = 'payload_too_large'
+
+
+class ValidatedContent(list):
+    '''Note content whose items were validated while the request body was parsed'''
+
+
+def exceeds_depth(value, max_depth: int) -> bool:
+    '''Returns True if lists and dictionaries are nested more than `max_depth` levels deep in `value`'''
+    if isinstance(value, dict):
+        value = value.values()
+    elif not isinstance(value, list):
+        return False
+    if max_depth < 1:
+        return True
+    return any(exceeds_depth(child, max_depth - 1) for child in value)
+
+
+class JSONStream:
+    '''
+    Decodes JSON values one at a time from a byte stream read in chunks.
+
+    Only the value being decoded and the unread rest of the current chunk are held in memory.
+    '''
+    whitespace = ' \t\n\r'
+
+    def __init__(self, stream, encoding: str, max_bytes: int, chunk_size: int):
+        self.stream = stream
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        # Dictionary keys are shared between values, as `json.loads` shares them within a document
+        keys = {}
+        self.json_decoder = json.JSONDecoder(object_pairs_hook=lambda pairs: {keys.setdefault(key, key): value for key, value in pairs})
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.bytes_read = 0
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size: int = None) -> bool:
+        '''Reads up to `size` more bytes, dropping what has been decoded. Returns False at the end of the stream.'''
+        if self.eof:
+            return False
+
+        chunk = self.stream.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            text = self.decoder.decode(b'', final=True)
+        else:
+            self.bytes_read += len(chunk)
+            if self.bytes_read > self.max_bytes:
+                raise PayloadTooLarge(f"Request body is larger than {self.max_bytes} bytes.")
+            text = self.decoder.decode(chunk)
+
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return bool(chunk)
+
+    def peek(self) -> str:
+        '''Returns the next non-whitespace character without consuming it, or "" at the end of the stream'''
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in self.whitespace:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, characters: str) -> str:
+        char = self.peek()
+        if not char or char not in characters:
+            raise exceptions.ParseError(f"JSON parse error - Expecting one of '{characters}' at byte {self.bytes_read}")
+        self.pos += 1
+        return char
+
+    def is_incomplete(self, exc: json.JSONDecodeError) -> bool:
+        # Errors caused by a value being cut off at the end of the buffer, rather than by invalid JSON
+        return not self.eof and (exc.msg.startswith('Unterminated string') or exc.pos >= len(self.buffer) - 8)
+
+    def decode(self):
+        '''Decodes and returns the next JSON value'''
+        size = self.chunk_size
+        while True:
+            self.peek()
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as exc:
+                if not self.is_incomplete(exc):
+                    raise exceptions.ParseError(f"JSON parse error - {exc.msg}")
+            except RecursionError:
+                raise exceptions.ParseError("JSON parse error - Value is nested too deeply")
+            else:
+                # A number at the end of the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof or isinstance(value, (str, list, dict)):
+                    self.pos = end
+                    return value
+
+            self.fill(size)
+            # Read more at a time while a single value spans several chunks
+            size *= 2
+
+
+class NoteJSONParser(BaseParser):
+    '''
+    Parses JSON note payloads as a stream, without buffering the whole request body.
+
+    Items of the note's "content" are decoded and validated one at a time, as they arrive, and
+    the payload is rejected as soon as an item is invalid or a limit is exceeded. Limits are set
+    in `settings.NOTES_CONFIG`:
+
+    - `CONTENT_MAX_BYTES`: size of the request body.
+    - `CONTENT_MAX_ITEMS`: number of content items, counting the items of lists.
+    - `CONTENT_MAX_DEPTH`: nesting of lists and dictionaries within a content item.
+    '''
+    media_type = 'application/json'
+    # Used by the browsable API to render the raw data form
+    renderer_class = RawJSONRenderer
+    chunk_size = 64 * 1024
+    content_key = 'content'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        max_bytes = get_setting("CONTENT_MAX_BYTES")
+
+        request = parser_context.get('request', None)
+        content_length = request.META.get('CONTENT_LENGTH', None) if request is not None else None
+        if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+            raise PayloadTooLarge(f"Request body is larger than {max_bytes} bytes.")
+
+        reader = JSONStream(stream, encoding, max_bytes, self.chunk_size)
+        data = {}
+        reader.expect('{')
+        if reader.peek() == '}':
+            reader.expect('}')
+        else:
+            while True:
+                key = reader.decode()
+                if not isinstance(key, str):
+                    raise exceptions.ParseError("JSON parse error - Expecting property name enclosed in double quotes")
+                reader.expect(':')
+
+                if key == self.content_key and reader.peek() == '[':
+                    data[key] = self.parse_content(reader)
+                else:
+                    data[key] = reader.decode()
+
+                if reader.expect(',}') == '}':
+                    break
+
+        if reader.peek():
+            raise exceptions.ParseError("JSON parse error - Extra data")
+        return data
+
+    def parse_content(self, reader: JSONStream) -> ValidatedContent:
+        max_items = get_setting("CONTENT_MAX_ITEMS")
+        max_depth = get_setting("CONTENT_MAX_DEPTH")
+        validate_content = content_types.compile(NoteContent.allowed_content_types)
+        content = ValidatedContent()
+        items_count = 0
+
+        reader.expect('[')
+        if reader.peek() == ']':
+            reader.expect(']')
+            return content
+
+        while True:
+            index = len(content)
+            item = reader.decode()
+
+            items_count += 1
+            if isinstance(item, dict) and isinstance(item.get('body', None), dict):
+                list_items = item['body'].get('list_items', None)
+                if isinstance(list_items, list):
+                    items_count += len(list_items)
+            if items_count > max_items:
+                raise exceptions.ValidationError({self.content_key: [f"Content has more than {max_items} items"]})
+
+            try:
+                validate_content([item])
+            except DjangoValidationError as exc:
+                raise exceptions.ValidationError({self.content_key: [f"Content item {index}: {message}" for message in exc.messages]})
+            # Validators fix the shape of registered types. Items of other types are kept as given.
+            if item['type'].lower() not in content_types and exceeds_depth(item, max_depth):
+                raise exceptions.ValidationError({self.content_key: [f"Content item {index} is nested too deeply"]})
+            content.append(item)
+
+            if reader.expect(',]') == ']':
+                return content
@@ -0,0 +1,182 @@
+from django.core.exceptions import ValidationError
+from typing import Dict, List, Tuple
+
+from .fields import NoteContent, LazyNoteContent
+from .items import ContentItem, ListItem, ListBlock, build_item
+from .schema import content_types
+
+
+
+OPERATIONS = ('add', 'remove', 'replace', 'move', 'check')
+
+
+def parse_path(path, allow_end: bool = False) -> Tuple:
+    '''
+    Parses the path of a content item.
+
+    A path is an index into the content, e.g. `3` or `"3"`, or the index of a list
+    followed by the index of one of its items, e.g. `"3/1"` or `[3, 1]`.
+    With `allow_end=True`, `"-"` may be used as the last index to point past the last item.
+    '''
+    if isinstance(path, int) and not isinstance(path, bool):
+        parts = [path]
+    elif isinstance(path, str):
+        parts = path.strip('/').split('/')
+    elif isinstance(path, list):
+        parts = path
+    else:
+        raise ValidationError("Invalid path: {}".format(path))
+
+    if not 1 <= len(parts) <= 2:
+        raise ValidationError("Invalid path: {}. A path has at most two indices".format(path))
+
+    indices = []
+    for position, part in enumerate(parts):
+        if allow_end and part == '-' and position == len(parts) - 1:
+            indices.append(None)
+            continue
+        try:
+            index = int(part)
+        except (TypeError, ValueError):
+            raise ValidationError("Invalid path: {}".format(path))
+        if index < 0:
+            raise ValidationError("Invalid path: {}. Indices cannot be negative".format(path))
+        indices.append(index)
+    return tuple(indices)
+
+
+def build_value(value, nested: bool) -> ContentItem:
+    '''Validates the wire format `value` of an operation and returns its item'''
+    if nested:
+        if not isinstance(value, dict) or not isinstance(value.get('type', None), str) or value['type'].lower() != ListItem.type_name:
+            raise ValidationError("Only items of type `list_item` can be placed in a list")
+    content_types.validate_item(value, NoteContent.allowed_content_types)
+    return build_item(value)
+
+
+class ContentPatch:
+    '''
+    Applies item-level operations to the items of a `NoteContent`.
+
+    Operations are applied to copies of the affected items, so the content is left
+    unchanged if any operation fails. Only the items an operation touches are validated.
+    '''
+
+    def __init__(self, items: List[ContentItem]):
+        self.items = list(items)
+
+    def get_container(self, indices: Tuple) -> List[ContentItem]:
+        '''Returns the list holding the item at `indices`, copying a parent list before it is changed'''
+        if len(indices) == 1:
+            return self.items
+
+        parent_index = indices[0]
+        if parent_index is None or parent_index >= len(self.items):
+            raise ValidationError("No content item at index {}".format(parent_index))
+
+        parent = self.items[parent_index]
+        if not isinstance(parent, ListBlock):
+            raise ValidationError("Content item at index {} is not a list".format(parent_index))
+
+        parent = ListBlock(
+            parent.title, list(parent.items), raw_type=parent.raw_type, extra=parent.extra, body_extra=parent.body_extra,
+        )
+        self.items[parent_index] = parent
+        return parent.items
+
+    def get_index(self, container: List, index, inserting: bool = False) -> int:
+        if index is None:
+            return len(container)
+        if index > len(container) or (index == len(container) and not inserting):
+            raise ValidationError("No content item at index {}".format(index))
+        return index
+
+    def add(self, path, value):
+        indices = parse_path(path, allow_end=True)
+        item = build_value(value, nested=len(indices) == 2)
+        self.insert(indices, item)
+
+    def insert(self, indices: Tuple, item: ContentItem):
+        container = self.get_container(indices)
+        container.insert(self.get_index(container, indices[-1], inserting=True), item)
+
+    def remove(self, path) -> ContentItem:
+        indices = parse_path(path)
+        container = self.get_container(indices)
+        index = self.get_index(container, indices[-1])
+        if len(indices) == 2 and len(container) == 1:
+            raise ValidationError("A list cannot be left empty. Remove the list instead")
+        return container.pop(index)
+
+    def replace(self, path, value):
+        indices = parse_path(path)
+        item = build_value(value, nested=len(indices) == 2)
+        container = self.get_container(indices)
+        container[self.get_index(container, indices[-1])] = item
+
+    def move(self, from_path, path):
+        item = self.remove(from_path)
+        indices = parse_path(path, allow_end=True)
+        if len(indices) == 2 and not isinstance(item, ListItem):
+            raise ValidationError("Only items of type `list_item` can be placed in a list")
+        self.insert(indices, item)
+
+    def check(self, path, value):
+        if not isinstance(value, bool):
+            raise ValidationError("The value of a `check` operation should be a boolean")
+        indices = parse_path(path)
+        container = self.get_container(indices)
+        index = self.get_index(container, indices[-1])
+        item = container[index]
+        if not isinstance(item, ListItem):
+            raise ValidationError("Content item at {} is not a `list_item`".format(path))
+        container[index] = ListItem(
+            item.item_value, checked=value, raw_type=item.raw_type, extra=item.extra, body_extra=item.body_extra,
+        )
+
+    def apply(self, operation: Dict):
+        if not isinstance(operation, dict):
+            raise ValidationError("An operation should be a dictionary")
+
+        op = operation.get('op', None)
+        if op not in OPERATIONS:
+            raise ValidationError("Invalid operation: {}. Should be one of {}".format(op, ', '.join(OPERATIONS)))
+        if 'path' not in operation:
+            raise ValidationError("Operation `{}` requires a 'path'".format(op))
+        if op in ('add', 'replace', 'check') and 'value' not in operation:
+            raise ValidationError("Operation `{}` requires a 'value'".format(op))
+        if op == 'move' and 'from' not in operation:
+            raise ValidationError("Operation `move` requires a 'from' path")
+
+        match op:
+            case 'add':
+                self.add(operation['path'], operation['value'])
+            case 'remove':
+                self.remove(operation['path'])
+            case 'replace':
+                self.replace(operation['path'], operation['value'])
+            case 'move':
+                self.move(operation['from'], operation['path'])
+            case 'check':
+                self.check(operation['path'], operation['value'])
+
+
+def apply_content_operations(content: NoteContent, operations: List[Dict]) -> NoteContent:
+    '''
+    Applies `operations` to `content`, all or none of them.
+
+    Raises `ValidationError` naming the first operation that failed.
+    '''
+    if isinstance(content, LazyNoteContent) and not content.is_materialized:
+        # Stored content was validated when it was written
+        content.materialize(validate=False)
+
+    patch = ContentPatch(content.items)
+    for index, operation in enumerate(operations):
+        try:
+            patch.apply(operation)
+        except ValidationError as exc:
+            raise ValidationError(["Operation {}: {}".format(index, message) for message in exc.messages])
+
+    content.items = patch.items
+    return content
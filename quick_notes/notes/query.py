@@ -0,0 +1,156 @@
+import datetime
+import re
+from typing import Callable, Dict, List
+
+from django.db import models
+from django.utils import timezone
+
+from .search import get_search_backend
+
+
+
+TOKEN_PATTERN = re.compile(r'(?P<key>\w+):(?P<value>"[^"]*"|\S+)|"(?P<phrase>[^"]*)"?|(?P<word>\S+)')
+DATE_RANGE_PATTERN = re.compile(r'^(?P<operator>>=|<=|>|<)?(?P<start>[^.]+)(?:\.\.(?P<end>.+))?$')
+
+
+class QueryError(ValueError):
+    '''Raised for a filter of a note search query with an invalid value'''
+
+
+def parse_boolean(key: str, value: str) -> bool:
+    value = value.lower()
+    if value not in ('true', 'false'):
+        raise QueryError(f"Invalid `{key}` value: {value}. Expected true or false")
+    return value == 'true'
+
+
+def parse_date(key: str, value: str) -> datetime.date:
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise QueryError(f"Invalid `{key}` date: {value}. Expected YYYY-MM-DD")
+
+
+def type_filter(key: str, value: str) -> models.Q:
+    '''`type:text`, `type:list` or `type:list_item`, for notes holding content of that type'''
+    field = {
+        'text': 'texts_count',
+        'list': 'lists_count',
+        'list_item': 'list_items_count',
+    }.get(value.lower(), None)
+    if field is None:
+        raise QueryError(f"Invalid `{key}` value: {value}. Expected text, list or list_item")
+    return models.Q(**{f'{field}__gt': 0})
+
+
+def checked_filter(key: str, value: str) -> models.Q:
+    '''`checked:false` for notes with unchecked list items, `checked:true` for notes with checked ones'''
+    if parse_boolean(key, value):
+        return models.Q(list_items_count__gt=models.F('unchecked_items_count'))
+    return models.Q(unchecked_items_count__gt=0)
+
+
+def starred_filter(key: str, value: str) -> models.Q:
+    return models.Q(starred=parse_boolean(key, value))
+
+
+def date_filter(field: str) -> Callable[[str, str], models.Q]:
+    '''
+    Returns a filter of `field` by day, in the current time zone.
+
+    Takes a day, `2026-01-01`, a comparison, `>2026-01-01` or `<=2026-01-01`, or an inclusive range,
+    `2026-01-01..2026-01-31`.
+    '''
+    def start_of(day: datetime.date) -> datetime.datetime:
+        return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+    def filter_by_day(key: str, value: str) -> models.Q:
+        match = DATE_RANGE_PATTERN.match(value)
+        if match is None:
+            raise QueryError(f"Invalid `{key}` value: {value}")
+        operator, start = match['operator'], parse_date(key, match['start'])
+        end = parse_date(key, match['end']) if match['end'] else None
+        if operator and end:
+            raise QueryError(f"Invalid `{key}` value: {value}. A range takes no comparison operator")
+
+        # Days are compared through their bounds, so that the index of `field` is used
+        next_day = datetime.timedelta(days=1)
+        if operator == '>':
+            return models.Q(**{f'{field}__gte': start_of(start + next_day)})
+        if operator == '>=':
+            return models.Q(**{f'{field}__gte': start_of(start)})
+        if operator == '<':
+            return models.Q(**{f'{field}__lt': start_of(start)})
+        if operator == '<=':
+            return models.Q(**{f'{field}__lt': start_of(start + next_day)})
+        return models.Q(**{f'{field}__gte': start_of(start), f'{field}__lt': start_of((end or start) + next_day)})
+
+    return filter_by_day
+
+
+# Filters of note search queries, by key. Each returns the `Q` object of a `key:value` filter.
+FILTERS: Dict[str, Callable[[str, str], models.Q]] = {
+    'type': type_filter,
+    'checked': checked_filter,
+    'starred': starred_filter,
+    'created': date_filter('date_created'),
+}
+
+
+class NoteQuery:
+    '''
+    A parsed note search query.
+
+    Queries mix free text words, quoted phrases and `key:value` filters, e.g.
+    `type:list checked:false starred:true created:>2026-01-01 "groceries"`. Words of the form `key:value`
+    with a `key` that is not in `FILTERS` are free text.
+    '''
+    __slots__ = ('words', 'phrases', 'filters')
+
+    def __init__(self, words: List[str], phrases: List[str], filters: List[models.Q]):
+        self.words = words
+        self.phrases = phrases
+        self.filters = filters
+
+    def __repr__(self):
+        return f"NoteQuery: words={self.words}, phrases={self.phrases}, filters={self.filters}"
+
+    @property
+    def text(self) -> str:
+        '''The words and phrases of the query, which notes are ranked by'''
+        return ' '.join(self.words + self.phrases)
+
+    def apply(self, queryset: models.QuerySet, user=None) -> models.QuerySet:
+        '''
+        Returns the notes of `queryset` that pass the filters of the query and contain its phrases.
+
+        Filters are applied in the database and phrases are looked up in the search index, so the query
+        adds no queries of its own. Pass `user` to only look up the user's notes in the index.
+        '''
+        for q in self.filters:
+            queryset = queryset.filter(q)
+        if self.phrases:
+            backend = get_search_backend()
+            for phrase in self.phrases:
+                queryset = backend.filter_phrase(queryset, phrase, user=user)
+        return queryset
+
+
+def parse_note_query(query: str) -> NoteQuery:
+    '''Parses a note search query. Raises `QueryError` for a filter with an invalid value.'''
+    words, phrases, filters = [], [], []
+
+    for match in TOKEN_PATTERN.finditer(query):
+        if match['key'] is not None:
+            key = match['key'].lower()
+            if key in FILTERS:
+                filters.append(FILTERS[key](key, match['value'].strip('"')))
+            else:
+                words.append(match.group(0))
+        elif match['phrase'] is not None:
+            if match['phrase'].strip():
+                phrases.append(match['phrase'].strip())
+        else:
+            words.append(match['word'])
+
+    return NoteQuery(words, phrases, filters)
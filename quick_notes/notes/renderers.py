@@ -0,0 +1,58 @@
+import functools
+import re
+import uuid
+
+from rest_framework import renderers
+from rest_framework.utils import encoders
+
+
+
+class RawJSON:
+    '''An already encoded JSON value. `RawJSONRenderer` writes it into the response as is.'''
+    __slots__ = ('value',)
+
+    def __init__(self, value: str):
+        self.value = value
+
+    def __repr__(self):
+        return f"RawJSON: {self.value[:50]}"
+
+
+class RawJSONEncoder(encoders.JSONEncoder):
+    '''Encodes `RawJSON` values as numbered placeholders, collecting their JSON in `fragments`'''
+
+    def __init__(self, *args, fragments: list, marker: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fragments = fragments
+        self.marker = marker
+
+    def default(self, obj):
+        if isinstance(obj, RawJSON):
+            self.fragments.append(obj.value)
+            return f"{self.marker}:{len(self.fragments) - 1}"
+        return super().default(obj)
+
+
+class RawJSONRenderer(renderers.JSONRenderer):
+    '''
+    Renders JSON, writing `RawJSON` values into the response without decoding and re-encoding them.
+
+    The rest of the data is encoded as by `JSONRenderer`, with each `RawJSON` value standing in as a placeholder
+    that is then replaced with its JSON.
+    '''
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        fragments = []
+        marker = uuid.uuid4().hex
+        # Renderers are instantiated for each response, so the encoder can be set on the instance
+        self.encoder_class = functools.partial(RawJSONEncoder, fragments=fragments, marker=marker)
+        ret = super().render(data, accepted_media_type, renderer_context)
+        if not fragments:
+            return ret
+
+        placeholder = re.compile(b'"' + marker.encode() + rb':(\d+)"')
+        return placeholder.sub(lambda match: self.encode_fragment(fragments[int(match.group(1))]), ret)
+
+    def encode_fragment(self, fragment: str) -> bytes:
+        # Escaped as `JSONRenderer` escapes them, so the response stays a strict JavaScript subset
+        return fragment.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
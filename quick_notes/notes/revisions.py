@@ -0,0 +1,80 @@
+import difflib
+import json
+from typing import Dict, List, Tuple
+
+from .fields import NoteContent, encode_note_content
+from .items import ContentItem, ListItem, ListBlock, build_items
+from .patches import ContentPatch
+
+
+
+def item_keys(items: List[ContentItem]) -> List[str]:
+    return [encode_note_content(item.to_dict()) for item in items]
+
+
+def format_path(prefix: Tuple, index: int) -> str:
+    return "/".join(str(part) for part in (*prefix, index))
+
+
+def diff_items(old: List[ContentItem], new: List[ContentItem], prefix: Tuple = ()) -> List[Dict]:
+    '''
+    Returns the content operations (see `notes.patches`) that turn the `old` items into the `new` ones.
+
+    Lists that keep their title are diffed item by item, so a change to one list item
+    is stored as an operation on that item only.
+    Operations run from the end of the content to its start, so every path stays valid when applied.
+    '''
+    operations = []
+    matcher = difflib.SequenceMatcher(None, item_keys(old), item_keys(new), autojunk=False)
+
+    for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+        if tag == 'equal':
+            continue
+
+        old_count, new_count = i2 - i1, j2 - j1
+        for offset in range(min(old_count, new_count)):
+            old_item, new_item = old[i1 + offset], new[j1 + offset]
+            operations.extend(diff_item(old_item, new_item, prefix, i1 + offset))
+
+        for offset in range(old_count, new_count):
+            operations.append({"op": "add", "path": format_path(prefix, i1 + offset), "value": new[j1 + offset].to_dict()})
+
+        for _ in range(new_count, old_count):
+            operations.append({"op": "remove", "path": format_path(prefix, i1 + new_count)})
+    return operations
+
+
+def diff_item(old: ContentItem, new: ContentItem, prefix: Tuple, index: int) -> List[Dict]:
+    '''Returns the operations that turn the `old` item at `index` into the `new` one'''
+    if isinstance(old, ListBlock) and isinstance(new, ListBlock) and not prefix:
+        if (old.title, old.raw_type, old.extra, old.body_extra) == (new.title, new.raw_type, new.extra, new.body_extra):
+            return diff_items(old.items, new.items, prefix=(index,))
+
+    if isinstance(old, ListItem) and isinstance(new, ListItem) and isinstance(new.checked, bool):
+        if (old.item_value, old.raw_type, old.extra, old.body_extra) == (new.item_value, new.raw_type, new.extra, new.body_extra):
+            return [{"op": "check", "path": format_path(prefix, index), "value": new.checked}]
+
+    return [{"op": "replace", "path": format_path(prefix, index), "value": new.to_dict()}]
+
+
+def apply_delta(items: List[ContentItem], operations: List[Dict]) -> List[ContentItem]:
+    '''Returns the items that result from applying the `operations` of a delta to `items`'''
+    patch = ContentPatch(items)
+    for operation in operations:
+        patch.apply(operation)
+    return patch.items
+
+
+def rebuild_content(chain: List) -> NoteContent:
+    '''
+    Rebuilds the content of the last revision of `chain`.
+
+    `chain` holds a snapshot revision followed by the delta revisions after it, in order.
+    '''
+    if not chain or not chain[0].is_snapshot:
+        raise ValueError("A revision chain should start with a snapshot")
+
+    items = build_items(json.loads(chain[0].data))
+    for revision in chain[1:]:
+        items = apply_delta(items, json.loads(revision.data))
+    return NoteContent.from_items(items)
@@ -0,0 +1,174 @@
+from django.core.exceptions import ValidationError
+from typing import Callable, Dict, Iterable
+
+
+
+class ContentTypeRegistry:
+    '''
+    Registry of the content item types a `NoteContent` may hold.
+
+    Each type registers a validator for the `body` of its items. Validators take the `body`
+    and the registry, and raise `ValidationError` for an invalid body.
+    The registered validators are compiled into a single-pass validator for a whole note content.
+    '''
+
+    def __init__(self):
+        self._validators: Dict[str, Callable] = {}
+        self._compiled: Dict[tuple, Callable] = {}
+
+    def __repr__(self):
+        return f"ContentTypeRegistry: {self.types}"
+
+    def __contains__(self, type_name: str):
+        return type_name in self._validators
+
+    @property
+    def types(self) -> tuple:
+        return tuple(self._validators)
+
+    def register(self, type_name: str, validator: Callable = None):
+        '''
+        Registers `validator` for content items of type `type_name`.
+        
+        Can also be used as a decorator.
+        '''
+        if not isinstance(type_name, str):
+            raise TypeError("Invalid type: {} for `type_name`".format(type(type_name)))
+
+        if validator is None:
+            def decorator(func: Callable):
+                return self.register(type_name, func)
+            return decorator
+
+        self._validators[type_name.lower()] = validator
+        self._compiled.clear()
+        return validator
+
+    def unregister(self, type_name: str):
+        self._validators.pop(type_name.lower(), None)
+        self._compiled.clear()
+
+    def get_validator(self, type_name: str) -> Callable:
+        try:
+            return self._validators[type_name.lower()]
+        except KeyError:
+            raise ValidationError("Unregistered content type `%s`" % type_name)
+
+    def compile(self, allowed_types: Iterable[str] = None) -> Callable[[list], list]:
+        '''
+        Returns a validator for a whole note content, restricted to `allowed_types`.
+
+        Compiled validators are cached until a type is registered or unregistered.
+        '''
+        key = tuple(allowed_types) if allowed_types is not None else None
+        validator = self._compiled.get(key, None)
+        if validator is None:
+            validator = self._compiled[key] = self._compile(key)
+        return validator
+
+    def validate_item(self, content_item: dict, allowed_types: Iterable[str] = None) -> dict:
+        '''Validates a single content item, e.g. one being added to an existing content, and returns it'''
+        self.compile(allowed_types)([content_item])
+        return content_item
+
+    def _compile(self, allowed_types: tuple = None) -> Callable[[list], list]:
+        validators = {
+            type_name: validator for type_name, validator in self._validators.items()
+            if allowed_types is None or type_name in allowed_types
+        }
+        get_validator = validators.get
+        registry = self
+
+        def validate_content(content: list) -> list:
+            if not isinstance(content, list):
+                raise ValidationError("Invalid content type: {}".format(type(content)))
+
+            for content_item in content:
+                if not isinstance(content_item, dict):
+                    raise ValidationError("Invalid content item")
+
+                _type = content_item.get('type', None)
+                if not _type:
+                    raise ValidationError("content item should have 'type' attribute")
+                if not isinstance(_type, str):
+                    raise ValidationError("content item 'type' attribute should be a string")
+
+                _body = content_item.get('body', None)
+                if not _body:
+                    raise ValidationError("content item type `%s` should have 'body' attribute" % _type)
+
+                # Types that are not allowed are kept as is, as they always have been
+                validator = get_validator(_type.lower(), None)
+                if validator is not None:
+                    validator(_body, registry)
+            return content
+
+        return validate_content
+
+
+content_types = ContentTypeRegistry()
+
+
+@content_types.register('text')
+def validate_text_body(value: str, registry: ContentTypeRegistry = None):
+    if not isinstance(value, str):
+        raise ValidationError("Invalid content item! The `body` of an item of type `text` should be a string")
+
+
+@content_types.register('list_item')
+def validate_list_item_body(value: dict, registry: ContentTypeRegistry = None):
+    if not isinstance(value, dict):
+        raise ValidationError("Invalid content item! The `body` of an item of type `list_item` should be a dictionary")
+    if 1 > len(value) or len(value) > 2:
+        raise ValidationError("Invalid content item! `list_item` may be containing invalid keys or is missing a key")
+
+    checked = value.get('checked', None)
+    if checked is not None and checked is not True and checked is not False:
+        # String booleans are accepted, as they were when they went through `ast.literal_eval`
+        if checked not in ('True', 'False'):
+            raise ValidationError("Invalid content item! `list_item` key, 'checked', is not boolean")
+
+    item_value = value.get('item_value', None)
+    if not item_value:
+        raise ValidationError("Invalid content item! `list_item` key, 'item_value', is required")
+    if not isinstance(item_value, str):
+        raise ValidationError("Invalid content item! `list_item` key, 'item_value', should be a string")
+
+
+@content_types.register('list')
+def validate_list_body(value: dict, registry: ContentTypeRegistry = None):
+    if not isinstance(value, dict):
+        raise ValidationError("Invalid content item! The `body` of an item of type `list` should be a dictionary")
+    if len(value) != 2:
+        raise ValidationError("Invalid content item! `list` has missing key(s)")
+
+    title = value.get('title', None)
+    list_items = value.get('list_items', None)
+    if not title:
+        raise ValidationError("Invalid content item! `list` key, 'title', is required")
+    if not list_items:
+        raise ValidationError("Invalid content item! `list` key, 'list_items', is required")
+
+    if not isinstance(title, str):
+        raise ValidationError("Invalid content item! `list` key, 'title', is not a string")
+    if not isinstance(list_items, list):
+        raise ValidationError("Invalid content item! `list` key, 'list_items', is not a list")
+
+    validate_item_body = (registry or content_types).get_validator('list_item')
+    for item in list_items:
+        if not isinstance(item, dict):
+            raise ValidationError("Invalid list item")
+
+        _type = item.get('type', None)
+        _body = item.get('body', None)
+
+        if not _body:
+            raise ValidationError("list item should have 'body' attribute")
+        if not _type:
+            raise ValidationError("list item should have 'type' attribute")
+        if not isinstance(_type, str):
+            raise ValidationError("list item 'type' attribute should be a string")
+        if _type != "list_item" and _type.lower() != "list_item":
+            raise ValidationError("list item 'type' attribute is invalid")
+
+        validate_item_body(_body, registry)
@@ -0,0 +1,419 @@
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+from django.apps import apps
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, models
+from django.utils.module_loading import import_string
+
+from api.trigrams import similarity
+from .conf import get_setting
+from .items import ContentItem, TextItem, ListItem, ListBlock
+
+
+
+TOKEN_PATTERN = re.compile(r"\w+")
+MAX_TERM_LENGTH = 64
+
+# How much an occurrence of a term counts towards its weight in a note, by where in the note it occurs
+FIELD_WEIGHTS = {
+    'title': 4,
+    'list_title': 2,
+    'text': 1,
+    'list_item': 1,
+}
+
+# Columns of the full-text search table that hold each field
+FTS_FIELD_COLUMNS = {
+    'title': 'title',
+    'list_title': 'headings',
+    'text': 'body',
+    'list_item': 'body',
+}
+
+item_fields = {
+    TextItem: 'text',
+    ListBlock: 'list_title',
+    ListItem: 'list_item',
+}
+
+# Term frequency saturation, as in BM25. A term occurring many times in a note only counts for so much more.
+K1 = 1.2
+
+
+def tokenize(text: str) -> List[str]:
+    '''Splits `text` into lowercase word terms'''
+    text = unicodedata.normalize('NFKC', text).casefold()
+    return [token[:MAX_TERM_LENGTH] for token in TOKEN_PATTERN.findall(text)]
+
+
+def get_query_terms(query: str) -> List[str]:
+    '''Returns the distinct terms of a search query, in the order they occur'''
+    return list(dict.fromkeys(tokenize(query)))
+
+
+def iter_note_fields(title: str, items: Iterable[ContentItem]) -> Iterator[Tuple[str, str]]:
+    '''Yields the searchable text of a note as `(field, text)` pairs'''
+    if title:
+        yield 'title', title
+    for item in items:
+        for nested_item in item.iter_flat():
+            field = item_fields.get(nested_item.__class__, None)
+            if field is not None:
+                yield field, nested_item.text
+
+
+def get_term_weights(title: str, items: Iterable[ContentItem]) -> Dict[str, float]:
+    '''Returns the weight of each term of a note, from how often and where in the note it occurs'''
+    counts = Counter()
+    for field, text in iter_note_fields(title, items):
+        field_weight = FIELD_WEIGHTS[field]
+        for term in tokenize(text):
+            counts[term] += field_weight
+    return {term: count * (K1 + 1) / (count + K1) for term, count in counts.items()}
+
+
+def inverse_document_frequency(notes_count: int, document_frequency: int) -> float:
+    '''How much matching a term says about a note, given how many of the `notes_count` notes contain it'''
+    return math.log(1 + (notes_count - document_frequency + 0.5) / (document_frequency + 0.5))
+
+
+def get_fts_columns(title: str, items: Iterable[ContentItem]) -> Dict[str, str]:
+    '''Returns the text of a note for each column of the full-text search table'''
+    columns = {'title': [], 'headings': [], 'body': []}
+    for field, text in iter_note_fields(title, items):
+        columns[FTS_FIELD_COLUMNS[field]].append(text)
+    return {column: '\n'.join(texts) for column, texts in columns.items()}
+
+
+def get_note_terms(title: str, items: Iterable[ContentItem]) -> set:
+    '''Returns the distinct terms of a note'''
+    return {term for field, text in iter_note_fields(title, items) for term in tokenize(text)}
+
+
+def make_snippet(texts: Iterable[str], matches: Callable[[str], bool], start: str, end: str, size: int) -> str | None:
+    '''
+    Returns about `size` words around the first term of `texts` for which `matches` is True,
+    with the matching terms between `start` and `end`. Returns None if no term matches.
+    '''
+    def is_match(word: str) -> bool:
+        return any(matches(term) for term in tokenize(word))
+
+    for text in texts:
+        words = text.split()
+        for index, word in enumerate(words):
+            if not is_match(word):
+                continue
+
+            first = max(0, index - size // 2)
+            window = words[first:first + size]
+            snippet = ' '.join(f"{start}{word}{end}" if is_match(word) else word for word in window)
+            if first > 0:
+                snippet = '…' + snippet
+            if first + size < len(words):
+                snippet += '…'
+            return snippet
+    return None
+
+
+class SearchBackend:
+    '''
+    Base class of the backends used by `Note.objects.search`.
+
+    The backend in use is set by `NOTES_CONFIG["SEARCH_BACKEND"]`, as a dotted path.
+    Only that backend's index is kept up to date as notes are saved, so after switching to another backend,
+    run the `rebuild_search_index` command.
+    '''
+    snippet_start = '<mark>'
+    snippet_end = '</mark>'
+    # Number of words in a snippet
+    snippet_size = 12
+
+    def index(self, note):
+        '''Brings the index of `note` up to date with its title and content'''
+        raise NotImplementedError
+
+    def remove(self, note_pk, using: str = 'default'):
+        '''Removes the note with `note_pk` from the index, if it is in it'''
+        raise NotImplementedError
+
+    def search(self, queryset, query: str, user=None):
+        '''
+        Returns the notes of `queryset` matching any term of `query`, most relevant first.
+
+        Notes are annotated with their `search_rank`, higher being more relevant.
+        '''
+        return self.search_terms(queryset, dict.fromkeys(get_query_terms(query), 1.0), user=user)
+
+    def search_terms(self, queryset, terms: Dict[str, float], user=None):
+        '''
+        Returns the notes of `queryset` containing any of `terms`, most relevant first.
+
+        `terms` maps each term to a boost of its weight in the ranking, e.g. the similarity of a term
+        to the searched one in a fuzzy search.
+        '''
+        raise NotImplementedError
+
+    def filter_phrase(self, queryset, phrase: str, user=None):
+        '''Returns the notes of `queryset` containing the terms of `phrase`, one after the other'''
+        raise NotImplementedError
+
+    def find_terms(self, terms: Iterable[str], owner_pk, using: str = 'default') -> set:
+        '''Returns those of `terms` that are found in the indexed notes of the owner with `owner_pk`'''
+        raise NotImplementedError
+
+    def get_snippet(self, note, query: str, threshold: float = None) -> str | None:
+        '''
+        Returns the highlighted text of `note` around its match of `query`.
+
+        Pass the similarity `threshold` of a fuzzy search to also highlight terms similar to those of `query`.
+        A `search_snippet` annotated on the note by the backend is used as is.
+        '''
+        snippet = getattr(note, 'search_snippet', None)
+        if snippet is not None:
+            return snippet
+
+        content = note.note_content
+        items = content.items if content is not None else []
+        fields = list(iter_note_fields(note.title, items))
+        # The title is shown with the note, so its match is only used when the content has none
+        texts = [text for field, text in fields if field != 'title'] + [text for field, text in fields if field == 'title']
+        query_terms = get_query_terms(query)
+
+        if threshold is None:
+            matches = set(query_terms).__contains__
+        else:
+            def matches(term: str) -> bool:
+                return any(similarity(term, query_term) >= threshold for query_term in query_terms)
+        return make_snippet(texts, matches, self.snippet_start, self.snippet_end, self.snippet_size)
+
+
+class IndexSearchBackend(SearchBackend):
+    '''Searches notes through the per-owner inverted index held by the `NoteSearchTerm` model'''
+
+    # Terms looked up per query, to stay under the database's limit of query parameters
+    batch_size = 500
+
+    def index(self, note):
+        note._meta.get_field('search_terms').related_model.objects.index(note)
+
+    def remove(self, note_pk, using: str = 'default'):
+        apps.get_model('notes', 'NoteSearchTerm').objects.using(using).filter(note_id=note_pk).delete()
+
+    def search_terms(self, queryset, terms: Dict[str, float], user=None):
+        if not terms:
+            return queryset.none()
+
+        Note = queryset.model
+        entries = Note._meta.get_field('search_terms').related_model.objects.filter(term__in=terms)
+        if user is not None:
+            entries = entries.filter(owner=user)
+
+        frequencies = dict(entries.order_by().values_list('term').annotate(frequency=models.Count('pk')))
+        if not frequencies:
+            return queryset.none()
+
+        if user is not None:
+            # Counted as notes are created and deleted, rather than on every search
+            notes_count = apps.get_model('notes', 'NoteCollectionSize').objects.db_manager(queryset.db).get_notes_count(user.pk)
+        else:
+            notes_count = queryset.count()
+        # A count behind the index, e.g. after notes were created in bulk, still weighs every term above 0
+        notes_count = max(notes_count, *frequencies.values())
+        weights = [
+            models.When(term=term, then=models.F('weight') * (inverse_document_frequency(notes_count, frequency) * terms[term]))
+            for term, frequency in frequencies.items()
+        ]
+        rank = entries.filter(note=models.OuterRef('pk')).order_by().values('note').annotate(
+            rank=models.Sum(models.Case(*weights, default=0.0, output_field=models.FloatField()))
+        ).values('rank')
+
+        qs = queryset.filter(pk__in=entries.values('note')).annotate(search_rank=models.Subquery(rank, output_field=models.FloatField()))
+        return qs.order_by('-search_rank', *Note._meta.ordering)
+
+    def find_terms(self, terms: Iterable[str], owner_pk, using: str = 'default') -> set:
+        terms = list(terms)
+        entries = apps.get_model('notes', 'NoteSearchTerm').objects.using(using).filter(owner_id=owner_pk)
+        found = set()
+        for start in range(0, len(terms), self.batch_size):
+            batch = terms[start:start + self.batch_size]
+            found.update(entries.filter(term__in=batch).order_by().values_list('term', flat=True).distinct())
+        return found
+
+    def filter_phrase(self, queryset, phrase: str, user=None):
+        '''
+        Returns the notes of `queryset` containing every term of `phrase`.
+
+        The index does not hold where terms occur, so the terms are not checked to follow one another.
+        '''
+        terms = get_query_terms(phrase)
+        if not terms:
+            return queryset
+
+        entries = queryset.model._meta.get_field('search_terms').related_model.objects.filter(term__in=terms)
+        if user is not None:
+            entries = entries.filter(owner=user)
+        notes = entries.order_by().values('note').annotate(terms_count=models.Count('pk')).filter(terms_count=len(terms))
+        return queryset.filter(pk__in=notes.values('note'))
+
+
+class BM25(models.Func):
+    '''The BM25 score of a match of an FTS5 table, lower being more relevant, given the weights of its columns'''
+    function = 'bm25'
+    output_field = models.FloatField()
+
+
+class Snippet(models.Func):
+    '''The text around the terms of an FTS5 table that matched, as returned by the FTS5 `snippet()` function'''
+    function = 'snippet'
+    output_field = models.TextField()
+
+
+class FTS5SearchBackend(SearchBackend):
+    '''
+    Searches notes through an SQLite FTS5 table, ranking them by BM25.
+
+    The table, created by the notes migrations, holds the title, the list titles and the rest of the text
+    of each note, keyed by the note's id, and is mapped by the `NoteFTSEntry` model. Rows of deleted notes are removed
+    by `remove`, called from `notes.signals.remove_deleted_note`.
+    '''
+    table = 'notes_note_fts'
+    # `fts5vocab` table listing the occurrences of each token of `table`
+    vocabulary_table = 'notes_note_fts_vocab'
+    # Tokens looked up per query, to stay under the database's limit of query parameters
+    batch_size = 500
+    # BM25 weights of the columns, in the order they are declared
+    column_weights = (FIELD_WEIGHTS['title'], FIELD_WEIGHTS['list_title'], FIELD_WEIGHTS['text'])
+
+    def check_connection(self, connection):
+        if connection.vendor != 'sqlite':
+            raise ImproperlyConfigured(f"{self.__class__.__name__} requires an SQLite database")
+
+    def get_match_expression(self, terms: Iterable[str]) -> str:
+        # Terms are quoted, so they are never read as FTS5 query syntax
+        return ' OR '.join('"%s"' % term.replace('"', '""') for term in terms)
+
+    def index(self, note):
+        connection = connections[note._state.db or 'default']
+        self.check_connection(connection)
+        content = note.note_content
+        columns = get_fts_columns(note.title, content.items if content is not None else [])
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [note.pk])
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, title, headings, body, owner_id) VALUES (%s, %s, %s, %s, %s)',
+                [note.pk, columns['title'], columns['headings'], columns['body'], note.owner_id],
+            )
+
+    def remove(self, note_pk, using: str = 'default'):
+        connection = connections[using]
+        self.check_connection(connection)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [note_pk])
+
+    def search_terms(self, queryset, terms: Dict[str, float], user=None):
+        '''
+        Returns the notes of `queryset` containing any of `terms`, ranked by BM25.
+
+        FTS5 does not weigh the terms of a query apart, so the boosts of `terms` are not used in the ranking.
+        '''
+        self.check_connection(connections[queryset.db])
+        if not terms:
+            return queryset.none()
+        match = self.get_match_expression(terms)
+
+        if user is not None:
+            # Filtering the notes is cheaper than reading the unindexed owner column of each match
+            queryset = queryset.filter(owner=user)
+
+        # Notes are joined with their matching rows, so that BM25 and snippets are computed in the same pass as the match
+        document = models.F('fts_entry__document')
+        weights = [models.Value(float(weight)) for weight in self.column_weights]
+        qs = queryset.filter(fts_entry__document__match=match).annotate(
+            search_rank=-BM25(document, *weights),
+            search_snippet=Snippet(
+                document, models.Value(-1), models.Value(self.snippet_start), models.Value(self.snippet_end),
+                models.Value('…'), models.Value(self.snippet_size),
+            ),
+        )
+        return qs.order_by('-search_rank', *queryset.model._meta.ordering)
+
+    def filter_phrase(self, queryset, phrase: str, user=None):
+        self.check_connection(connections[queryset.db])
+        terms = tokenize(phrase)
+        if not terms:
+            return queryset
+
+        entries = apps.get_model('notes', 'NoteFTSEntry').objects.filter(
+            document__match=self.get_match_expression([' '.join(terms)]),
+        )
+        return queryset.filter(pk__in=entries.values('note'))
+
+    def get_table_tokens(self, term: str) -> List[str]:
+        '''
+        Returns the forms the table's `unicode61` tokenizer may have stored `term` as, one list per token of the term.
+
+        The tokenizer splits on underscores, which `tokenize` keeps, and removes the diacritics of letters
+        that have a simpler form, so a token is looked up both with and without its diacritics.
+        '''
+        forms = []
+        for token in re.findall(r"[^\W_]+", term):
+            token = unicodedata.normalize('NFC', token.lower())
+            stripped = ''.join(char for char in unicodedata.normalize('NFD', token) if not unicodedata.combining(char))
+            forms.append(list(dict.fromkeys([stripped, token])))
+        return forms
+
+    def find_terms(self, terms: Iterable[str], owner_pk, using: str = 'default') -> set:
+        '''
+        Returns those of `terms` that are found in the indexed notes of the owner with `owner_pk`.
+
+        The tokens of the terms are looked up in batches in the `fts5vocab` table of the index, which lists
+        each token's occurrences by note. A term is found when each of its tokens is.
+        Terms cut to `MAX_TERM_LENGTH` end with a prefix of a token, which is looked up on its own.
+        '''
+        connection = connections[using]
+        self.check_connection(connection)
+        Note = apps.get_model('notes', 'Note')
+        notes_table = connection.ops.quote_name(Note._meta.db_table)
+        owner_notes = f'SELECT id FROM {notes_table} WHERE owner_id = %s'
+
+        term_tokens = {term: self.get_table_tokens(term) for term in terms}
+        tokens = list({form for token_forms in term_tokens.values() for forms in token_forms for form in forms})
+        found_tokens = set()
+        with connection.cursor() as cursor:
+            for start in range(0, len(tokens), self.batch_size):
+                batch = tokens[start:start + self.batch_size]
+                cursor.execute(
+                    f'SELECT DISTINCT term FROM {self.vocabulary_table} '
+                    f'WHERE term IN ({", ".join(["%s"] * len(batch))}) AND doc IN ({owner_notes})',
+                    [*batch, owner_pk],
+                )
+                found_tokens.update(token for token, in cursor.fetchall())
+
+            found = set()
+            for term, token_forms in term_tokens.items():
+                if not token_forms:
+                    continue
+                if len(term) >= MAX_TERM_LENGTH:
+                    for prefix in token_forms[-1]:
+                        if prefix in found_tokens:
+                            break
+                        # Ranges of tokens are read from the vocabulary's index, as single tokens are
+                        cursor.execute(
+                            f'SELECT 1 FROM {self.vocabulary_table} WHERE term >= %s AND term < %s AND doc IN ({owner_notes}) LIMIT 1',
+                            [prefix, prefix + '\U0010ffff', owner_pk],
+                        )
+                        if cursor.fetchone() is not None:
+                            found_tokens.add(prefix)
+                            break
+                if all(any(form in found_tokens for form in forms) for forms in token_forms):
+                    found.add(term)
+        return found
+
+
+def get_search_backend() -> SearchBackend:
+    '''Returns an instance of the search backend set in `NOTES_CONFIG["SEARCH_BACKEND"]`'''
+    return import_string(get_setting("SEARCH_BACKEND"))()
@@ -1,23 +1,58 @@
 from rest_framework import serializers
-from django.template.defaultfilters import slugify
+from rest_framework.reverse import reverse
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
 from typing import Dict
 import json
 
-from .models import Note
-from .fields import INITIAL_CONTENT_FORMAT
+from .models import Note, NoteRevision
+from .fields import INITIAL_CONTENT_FORMAT, NoteContent, LazyNoteContent
+from .parsers import ValidatedContent
+from .patches import apply_content_operations
+from .renderers import RawJSON
+from api.fields import TemplatedHyperlinkedIdentityField
+from api.serializers import CompiledRepresentationMixin, SparseFieldsetMixin
 
 
-class NoteSerializer(serializers.ModelSerializer):
-    '''Note objects serializer'''
+class NoteContentSerializerField(serializers.JSONField):
+    '''
+    Serializes a note's content.
+
+    With `raw_content` set in the serializer context, content that is unchanged since it was read from
+    the database is passed on as its stored JSON, for `RawJSONRenderer` to write into the response as is.
+    '''
+
+    def get_attribute(self, instance):
+        if self.context.get('raw_content', False):
+            content = getattr(instance, self.source_attrs[0], None)
+            if isinstance(content, LazyNoteContent):
+                raw_json = content.raw_json
+                if raw_json is not None:
+                    return RawJSON(raw_json)
+        return super().get_attribute(instance)
+
+    def to_representation(self, value):
+        if isinstance(value, RawJSON):
+            return value
+        return super().to_representation(value)
+
+
+class NoteSerializer(SparseFieldsetMixin, CompiledRepresentationMixin, serializers.ModelSerializer):
+    '''
+    Note objects serializer.
+
+    Notes are serialized through a compiled plan of the fields, see `api.serializers.CompiledRepresentationMixin`,
+    trimmed to the fields requested by the view, see `api.serializers.SparseFieldsetMixin`.
+    '''
 
     allowed_content_types = ['text', 'list', 'list_item']
 
     title = serializers.CharField(required=True)
-    content = serializers.JSONField(source="note_content.content", initial=INITIAL_CONTENT_FORMAT, required=True)
-    details = serializers.JSONField(source="content.details", read_only=True)
+    content = NoteContentSerializerField(source="note_content.content", initial=INITIAL_CONTENT_FORMAT, required=True)
+    details = serializers.JSONField(source="content_details", read_only=True)
     slug = serializers.SlugField(read_only=True)
-    url = serializers.HyperlinkedIdentityField(view_name='note-detail', read_only=True, lookup_field='slug')
-    edit_url = serializers.HyperlinkedIdentityField(view_name='note-update', read_only=True, lookup_field='slug')
+    url = TemplatedHyperlinkedIdentityField(view_name='note-detail', read_only=True, lookup_field='slug')
+    edit_url = TemplatedHyperlinkedIdentityField(view_name='note-update', read_only=True, lookup_field='slug')
     owner_username = serializers.CharField(source="owner.username", read_only=True)
     date_created = serializers.SerializerMethodField(read_only=True)
     last_edited = serializers.SerializerMethodField(read_only=True)
@@ -37,6 +72,18 @@ class NoteSerializer(serializers.ModelSerializer):
             'last_edited',
         ]
 
+    def validate_content(self, value):
+        '''
+        Validates the note content once for the request.
+        
+        The resulting `NoteContent` is carried through to `Note.save()` and not validated again.
+        '''
+        try:
+            # Content parsed by `NoteJSONParser` had its items validated as they were read
+            return NoteContent(value, validated=isinstance(value, ValidatedContent))
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError(exc.messages)
+
     def get_date_created(self, note):
         return f"{note.date_created.date()} {note.date_created.time()}"
 
@@ -48,7 +95,6 @@ class NoteSerializer(serializers.ModelSerializer):
         validated_data['note_content'] = validated_data['note_content']['content']
         request = self.context.get('request')
         validated_data.update({'owner': request.user})
-        validated_data = self.add_slug(validated_data)
 
         return Note.objects.create(**validated_data)
 
@@ -58,39 +104,125 @@ class NoteSerializer(serializers.ModelSerializer):
         validated_data['note_content'] = validated_data['note_content']['content']
 
         if instance.title.lower() != title.lower():
-            validated_data = self.add_slug(validated_data)
+            # Allocated again from the new title by `Note.save`
+            validated_data['slug'] = ''
 
         return super().update(instance, validated_data)
 
-    
-    def add_slug(self, validated_data: Dict):
-        if not isinstance(validated_data, dict):
-            raise TypeError('validated_data should be of type "dict"')
-
-        title = validated_data.get('title')
-        owner = validated_data.get('owner')
-        slug = slugify(title)
 
-        if owner:
-            qs = Note.objects.filter(owner=owner, slug=slug)
-            if qs.exists():
-                slug = f'{slug}-{qs.count()}'
-                
-        validated_data['slug'] = slug
-
-        return validated_data 
+class StrippedNoteSerializer(NoteSerializer):
+    '''
+    Serializes the main fields of a note.
 
+    Search results, serialized with the search query and backend in the context, also get a highlighted `snippet` of the match.
+    '''
+    snippet = serializers.SerializerMethodField(read_only=True)
 
-class StrippedNoteSerializer(NoteSerializer):
     class Meta(NoteSerializer.Meta):
         fields = [
             'title',
             'content',
+            'snippet',
+            'slug',
+            'owner_username',
+            'url',
+            'edit_url',
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if 'search_query' not in self.context:
+            self.fields.pop('snippet', None)
+
+    def get_snippet(self, note):
+        return self.context['search_backend'].get_snippet(note, self.context['search_query'], self.context.get('search_threshold', None))
+
+
+class NoteSummarySerializer(StrippedNoteSerializer):
+    '''
+    Serializes a note without its content, for lists of notes.
+
+    The content is summed up by `preview`, its first characters, and `details`, its statistics, both stored with the note.
+    '''
+    preview = serializers.CharField(read_only=True)
+
+    class Meta(StrippedNoteSerializer.Meta):
+        fields = [
+            'title',
+            'preview',
+            'details',
+            'snippet',
             'slug',
+            'starred',
             'owner_username',
             'url',
             'edit_url',
+            'last_edited',
         ]
 
 
+class NoteContentPatchSerializer(serializers.Serializer):
+    '''
+    Applies item-level operations to a note's content, all or none of them.
+
+    Each operation is a dictionary with an 'op' of `add`, `remove`, `replace`, `move` or `check`,
+    a 'path' and, depending on the op, a 'value' or a 'from' path.
+    '''
+    operations = serializers.ListField(child=serializers.DictField(), allow_empty=False, write_only=True)
+
+    def update(self, note, validated_data):
+        with transaction.atomic():
+            note = Note.objects.select_for_update().get(pk=note.pk)
+            try:
+                apply_content_operations(note.note_content, validated_data['operations'])
+            except DjangoValidationError as exc:
+                raise serializers.ValidationError({'operations': exc.messages})
+            note.save()
+        return note
+
+    def to_representation(self, note):
+        return NoteSerializer(note, context=self.context).data
+
+
+class NoteRevisionSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    '''NoteRevision objects serializer'''
+
+    url = serializers.SerializerMethodField(read_only=True)
+    date_created = serializers.SerializerMethodField(read_only=True)
+
+    class Meta:
+        model = NoteRevision
+        fields = [
+            'number',
+            'title',
+            'is_snapshot',
+            'url',
+            'date_created',
+        ]
+        read_only_fields = fields
+
+    def get_url(self, revision):
+        request = self.context.get('request')
+        kwargs = {'slug': revision.note.slug, 'number': revision.number}
+        return reverse(viewname='note-revision-detail', kwargs=kwargs, request=request)
+
+    def get_date_created(self, revision):
+        return f"{revision.date_created.date()} {revision.date_created.time()}"
+
+
+class NoteRevisionDetailSerializer(NoteRevisionSerializer):
+    '''Serializes a revision with its rebuilt content'''
+
+    content = serializers.JSONField(source="content.content", read_only=True)
+
+    class Meta(NoteRevisionSerializer.Meta):
+        fields = [
+            'number',
+            'title',
+            'content',
+            'is_snapshot',
+            'url',
+            'date_created',
+        ]
+        read_only_fields = fields
 
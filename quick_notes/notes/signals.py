@@ -0,0 +1,23 @@
+from .conf import get_setting
+from .models import NoteCollectionSize, NoteIndexJob
+from .search import get_search_backend
+
+
+def remove_deleted_note(sender, instance, using, **kwargs):
+    '''
+    Removes a deleted note from the search index, whether it was deleted on its own, in bulk or along with its owner.
+
+    Connected to `post_delete` of `Note` in `NotesConfig.ready`, in place of a database trigger, which SQLite
+    drops whenever a migration rebuilds the notes table.
+    '''
+    if get_setting("INDEX_IN_BACKGROUND"):
+        # Supersedes a pending index job of the note
+        NoteIndexJob.objects.db_manager(using).enqueue(instance.pk, NoteIndexJob.ACTION_DELETE)
+    else:
+        get_search_backend().remove(instance.pk, using=using)
+
+
+def count_deleted_note(sender, instance, using, **kwargs):
+    '''Removes a deleted note from the count of its owner's notes, see `NoteCollectionSize`'''
+    if instance.owner_id is not None:
+        NoteCollectionSize.objects.db_manager(using).add(instance.owner_id, -1)
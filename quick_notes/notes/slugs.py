@@ -0,0 +1,39 @@
+import re
+from typing import Optional, Tuple
+
+from django.template.defaultfilters import slugify
+
+
+SEPARATOR = '-'
+# Leaves room in `Note.slug` for the separator and number of a suffix
+MAX_BASE_LENGTH = 180
+DEFAULT_BASE = 'note'
+NUMBERED_SLUG_PATTERN = re.compile(r'^(?P<base>.+)[-_](?P<number>\d+)$')
+
+
+def get_slug_base(title: Optional[str]) -> str:
+    '''Returns the slug of `title`, before it is numbered, or `DEFAULT_BASE` for titles without any slug character'''
+    return slugify(title or '')[:MAX_BASE_LENGTH].strip('-_') or DEFAULT_BASE
+
+
+def get_numbered_slug(base: str, number: int) -> str:
+    '''
+    Returns the slug of the `number`th note of an owner with the slug `base`.
+
+    The first note gets `base` itself and the later ones a suffix counting from 1, `base-1`, `base-2`...
+    '''
+    if number <= 1:
+        return base
+    return f'{base}{SEPARATOR}{number - 1}'
+
+
+def parse_numbered_slug(slug: str) -> Tuple[str, int]:
+    '''
+    Returns the base and number that `slug` would be allocated from, the reverse of `get_numbered_slug`.
+
+    Slugs numbered with `_`, as they once were, are parsed too.
+    '''
+    match = NUMBERED_SLUG_PATTERN.match(slug)
+    if match is None:
+        return slug, 1
+    return match['base'], int(match['number']) + 1
@@ -1,3 +1,1654 @@
-from django.test import TestCase
+import base64
+import datetime
+import importlib
+import io
+import json
+import tracemalloc
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.management import call_command
+from django.db import connection, models
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api.trigrams import get_trigrams
+
+from .cache import CachedSearch, SearchResultCache, search_cache
+from .fields import (
+    COMPRESSION_HEADER, LazyNoteContent, NoteContent, compress_note_content, content_load_stats, decode_note_content,
+    decompress_note_content, encode_note_content, is_compressed,
+)
+from .items import build_items
+from .models import Note, NoteCollectionSize, NoteFTSEntry, NoteIndexJob, NoteRevision, NoteSlugCounter, NoteTermTrigram
+from .parsers import NoteJSONParser, PayloadTooLarge, ValidatedContent
+from .patches import apply_content_operations
+from .query import QueryError, parse_note_query
+from .renderers import RawJSONRenderer
+from .revisions import apply_delta, diff_items
+from .schema import ContentTypeRegistry, content_types
+from .search import FTS5SearchBackend, IndexSearchBackend, get_fts_columns, get_note_terms, get_search_backend
+from .serializers import NoteSerializer, NoteSummarySerializer, StrippedNoteSerializer
+from .slugs import parse_numbered_slug
+from .views import RawContentMixin
+
+
+def build_payload(items_count: int) -> dict:
+    content = []
+    for index in range(items_count):
+        content.append({"type": "text", "body": "Paragraph {} of a long note".format(index)})
+        content.append({
+            "type": "list",
+            "body": {
+                "title": "List {}".format(index),
+                "list_items": [{"type": "list_item", "body": {"checked": False, "item_value": "Item {}".format(index)}}],
+            },
+        })
+    return {"title": "A long note", "content": content, "starred": False}
+
+
+class CountingStream(io.BytesIO):
+    '''Counts the bytes read from it'''
+
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+class NoteJSONParserTestCase(SimpleTestCase):
+
+    def parse(self, data: bytes, parser: NoteJSONParser = None):
+        return (parser or NoteJSONParser()).parse(io.BytesIO(data))
+
+    def test_parses_like_json(self):
+        payload = build_payload(500)
+        data = self.parse(json.dumps(payload, indent=2).encode('utf-8'))
+        self.assertEqual(data, payload)
+        self.assertIsInstance(data['content'], ValidatedContent)
+
+        # Values spanning several chunks are read whole
+        parser = NoteJSONParser()
+        parser.chunk_size = 7
+        self.assertEqual(self.parse(json.dumps(payload).encode('utf-8'), parser), payload)
+        self.assertEqual(self.parse(b'{"title": 12345678901234567890, "content": []}', parser), {"title": 12345678901234567890, "content": []})
+
+    def test_rejects_invalid_json(self):
+        for data in (b'', b'[]', b'{"title": "x",}', b'{"title": "x"} {}', b'{"content": [{"type": "text", "body": "x"}'):
+            with self.assertRaises(exceptions.ParseError):
+                self.parse(data)
+
+    def test_rejects_invalid_item_early(self):
+        payload = build_payload(2000)
+        payload['content'][1]['body'] = "not a list"
+        data = json.dumps(payload).encode('utf-8')
+
+        parser = NoteJSONParser()
+        parser.chunk_size = 1024
+        stream = CountingStream(data)
+        with self.assertRaises(exceptions.ValidationError) as context:
+            parser.parse(stream)
+
+        self.assertIn("Content item 1", str(context.exception.detail['content'][0]))
+        self.assertLess(stream.bytes_read, len(data) // 10)
+
+    def test_limits(self):
+        data = json.dumps(build_payload(100)).encode('utf-8')
+
+        with override_settings(NOTES_CONFIG={"CONTENT_MAX_BYTES": len(data) - 1}):
+            with self.assertRaises(PayloadTooLarge):
+                self.parse(data)
+
+        # 100 texts, 100 lists and their 100 list items
+        with override_settings(NOTES_CONFIG={"CONTENT_MAX_ITEMS": 299}):
+            with self.assertRaises(exceptions.ValidationError):
+                self.parse(data)
+        with override_settings(NOTES_CONFIG={"CONTENT_MAX_ITEMS": 300}):
+            self.parse(data)
+
+        nested = {"content": [{"type": "drawing", "body": [[[[[[[[[["deep"]]]]]]]]]]}]}
+        with self.assertRaises(exceptions.ValidationError) as context:
+            self.parse(json.dumps(nested).encode('utf-8'))
+        self.assertIn("nested too deeply", str(context.exception.detail['content'][0]))
+
+    def test_peak_memory(self):
+        # The streaming parser never holds the whole body, and its decoded text, in memory at once
+        data = json.dumps(build_payload(3000)).encode('utf-8')
+
+        def measure(parser) -> int:
+            tracemalloc.start()
+            try:
+                parser.parse(io.BytesIO(data))
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        self.assertLess(measure(NoteJSONParser()), measure(JSONParser()))
+
+
+def create_user(username: str):
+    return get_user_model().objects.create_user(
+        username=username, firstname=username.capitalize(), lastname='Tester', email=f'{username}@example.com',
+        password='a-long-password',
+    )
+
+
+@override_settings(NOTES_CONFIG={"INDEX_IN_BACKGROUND": False})
+class NoteContentRoundTripTestCase(TestCase):
+
+    def test_keys_of_items_are_kept(self):
+        content = [
+            {"type": "text", "body": "hi", "color": "red"},
+            {"type": "Text", "body": "Spelt differently"},
+            {"type": "list", "body": {"title": "Todo", "list_items": [
+                {"type": "list_item", "body": {"item_value": "Call", "due": "2026-10-20"}},
+                {"type": "list_item", "body": {"checked": "True", "item_value": "Write"}, "priority": 1},
+            ]}, "pinned": True},
+            {"type": "drawing", "body": {"strokes": []}},
+        ]
+        validated = NoteSerializer().fields['content'].run_validation(content)
+        note = Note.objects.create(title='Round trip', owner=create_user('writer'), note_content=validated)
+
+        self.assertEqual(Note.objects.get(pk=note.pk).note_content.content, content)
+        self.assertEqual(NoteContent.from_items(build_items(content)).content, content)
+
+
+def build_list(title: str, *values: str, checked: bool = False) -> dict:
+    return {"type": "list", "body": {"title": title, "list_items": [
+        {"type": "list_item", "body": {"checked": checked, "item_value": value}} for value in values
+    ]}}
+
+
+@override_settings(NOTES_CONFIG={"INDEX_IN_BACKGROUND": False})
+class LegacyNoteContentTestCase(TestCase):
+
+    def setUp(self):
+        self.user = create_user('legacy')
+        self.content = [{"type": "text", "body": "Café, naïve 日本語 — “quoted”"}, build_list("Todo", "Ünïcode", checked=True)]
+
+    def set_raw_content(self, note, value: str):
+        with connection.cursor() as cursor:
+            cursor.execute(f'UPDATE {Note._meta.db_table} SET note_content = %s WHERE id = %s', [value, note.pk])
+
+    def test_legacy_repr_rows_are_read(self):
+        note = Note.objects.create(title='Legacy', owner=self.user, note_content=[])
+        self.set_raw_content(note, str(self.content))
+
+        note = Note.objects.get(pk=note.pk)
+        self.assertIsNone(note.note_content.raw_json)
+        self.assertEqual(note.note_content.content, self.content)
+        self.assertEqual(decode_note_content(str(self.content)), self.content)
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(reverse('note-detail', kwargs={'slug': note.slug}))
+        self.assertEqual(response.json()['content'], self.content)
+
+        for value in ('[{"type": "text"', "{'type': 'text'}", "not content"):
+            with self.subTest(value=value):
+                with self.assertRaises(DjangoValidationError):
+                    decode_note_content(value)
+
+    def test_non_ascii_text_round_trips(self):
+        encoded = encode_note_content(self.content)
+        self.assertIn("日本語", encoded)
+        self.assertNotIn("\\u", encoded)
+        self.assertEqual(decode_note_content(encoded), self.content)
+
+        note = Note.objects.create(title='Unicode', owner=self.user, note_content=self.content)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT note_content FROM {Note._meta.db_table} WHERE id = %s', [note.pk])
+            self.assertEqual(cursor.fetchone()[0], encoded)
+        self.assertEqual(Note.objects.get(pk=note.pk).note_content.content, self.content)
+
+
+class NoteContentStorageMigrationTestCase(TransactionTestCase):
+    '''Runs migration 0005 over a mix of legacy repr and JSON rows, forwards and backwards'''
+    migrate_from = ('notes', '0004_remove_note_content_note_note_content')
+    migrate_to = ('notes', '0005_note_content_json_storage')
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.leaf_nodes = self.executor.loader.graph.leaf_nodes()
+        self.executor.migrate([self.migrate_from])
+
+    def tearDown(self):
+        # Rows of the test are not converted by the later migrations
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM notes_note')
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.leaf_nodes)
+
+    def migrate(self, target):
+        self.executor.loader.build_graph()
+        self.executor.migrate([target])
+
+    def get_rows(self) -> dict:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT title, note_content FROM notes_note ORDER BY id')
+            return dict(cursor.fetchall())
+
+    def test_rows_are_converted_forwards_and_backwards(self):
+        content = [{"type": "text", "body": "Café 日本語"}, build_list("Todo", "Milk", checked=True)]
+        rows = {
+            'repr': str(content),
+            'json': encode_note_content(content),
+            'spaced json': json.dumps(content),
+            'empty': '[]',
+            'broken': "[{'type': ",
+        }
+        with connection.cursor() as cursor:
+            for title, value in rows.items():
+                cursor.execute(
+                    "INSERT INTO notes_note (title, note_content, date_created, last_edited, slug, starred) "
+                    "VALUES (%s, %s, %s, %s, %s, %s)",
+                    [title, value, timezone.now(), timezone.now(), title.replace(' ', '-'), False],
+                )
+
+        self.migrate(self.migrate_to)
+        migrated = self.get_rows()
+        self.assertEqual(migrated['repr'], encode_note_content(content))
+        self.assertEqual(migrated['json'], rows['json'])
+        # Valid JSON rows and rows that cannot be read are left as they are
+        self.assertEqual(migrated['spaced json'], rows['spaced json'])
+        self.assertEqual(migrated['empty'], '[]')
+        self.assertEqual(migrated['broken'], rows['broken'])
+
+        self.migrate(self.migrate_from)
+        reverted = self.get_rows()
+        self.assertEqual(reverted['repr'], str(content))
+        self.assertEqual(reverted['json'], str(content))
+        self.assertEqual(reverted['spaced json'], str(content))
+        self.assertEqual(reverted['broken'], rows['broken'])
+
+
+@override_settings(NOTES_CONFIG={"INDEX_IN_BACKGROUND": False})
+class NoteContentCompressionTestCase(TestCase):
+
+    def setUp(self):
+        self.user = create_user('compressor')
+        self.small_content = [{"type": "text", "body": "Short"}]
+        self.large_content = [build_list("Groceries", *[f"Item {index} to buy" for index in range(100)])]
+        self.small = Note.objects.create(title='Small', owner=self.user, note_content=self.small_content)
+        self.large = Note.objects.create(title='Large', owner=self.user, note_content=self.large_content)
+
+    def get_raw(self, note) -> str:
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT note_content FROM {Note._meta.db_table} WHERE id = %s', [note.pk])
+            return cursor.fetchone()[0]
+
+    def test_content_above_the_threshold_is_compressed(self):
+        threshold = Note._meta.get_field('note_content').compress_threshold
+        self.assertLess(len(encode_note_content(self.small_content).encode()), threshold)
+        self.assertGreater(len(encode_note_content(self.large_content).encode()), threshold)
+
+        self.assertEqual(self.get_raw(self.small), encode_note_content(self.small_content))
+        raw = self.get_raw(self.large)
+        self.assertTrue(is_compressed(raw))
+        self.assertLess(len(raw), len(encode_note_content(self.large_content)))
+        self.assertEqual(decompress_note_content(raw), encode_note_content(self.large_content))
+
+        # Content that compression does not shrink is kept plain
+        self.assertEqual(compress_note_content('[]', threshold=0), '[]')
+
+    def test_compressed_content_reads_as_plain_content(self):
+        plain = Note.objects.create(title='Plain', owner=self.user, note_content=[])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {Note._meta.db_table} SET note_content = %s WHERE id = %s',
+                [encode_note_content(self.large_content), plain.pk],
+            )
+
+        compressed, plain = Note.objects.get(pk=self.large.pk), Note.objects.get(pk=plain.pk)
+        self.assertEqual(compressed.note_content.raw_json, plain.note_content.raw_json)
+        self.assertEqual(compressed.note_content.content, plain.note_content.content)
+        self.assertEqual(compressed.note_content.details, plain.note_content.details)
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        responses = [client.get(reverse('note-detail', kwargs={'slug': note.slug})).json() for note in (compressed, plain)]
+        self.assertEqual(responses[0]['content'], responses[1]['content'])
+        self.assertEqual(responses[0]['content'], self.large_content)
+
+        with self.assertRaises(DjangoValidationError):
+            decompress_note_content(COMPRESSION_HEADER + 'not compressed"')
+
+    def call_command(self, *args) -> str:
+        stdout = io.StringIO()
+        call_command('compress_note_content', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_command_rewrites_rows(self):
+        compressed = self.get_raw(self.large)
+
+        output = self.call_command('--decompress', '--dry-run')
+        self.assertIn("Would rewrite 1 of 2 note(s)", output)
+        self.assertEqual(self.get_raw(self.large), compressed)
+
+        output = self.call_command('--decompress')
+        self.assertIn("Rewrote 1 of 2 note(s)", output)
+        self.assertEqual(self.get_raw(self.large), encode_note_content(self.large_content))
+        self.assertEqual(self.get_raw(self.small), encode_note_content(self.small_content))
+
+        output = self.call_command('--dry-run')
+        self.assertIn("Would rewrite 1 of 2 note(s)", output)
+        self.assertEqual(self.get_raw(self.large), encode_note_content(self.large_content))
+
+        self.assertIn("Rewrote 1 of 2 note(s)", self.call_command())
+        self.assertEqual(self.get_raw(self.large), compressed)
+
+        # Without a threshold, small content is still kept plain, as compressing it saves no bytes
+        self.assertIn("Rewrote 0 of 2 note(s)", self.call_command('--threshold', '0'))
+        self.assertEqual(self.get_raw(self.small), encode_note_content(self.small_content))
+
+
+@override_settings(NOTES_CONFIG={"INDEX_IN_BACKGROUND": False})
+class ContentStatsTestCase(TestCase):
+
+    def setUp(self):
+        self.user = create_user('counter')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.texts = Note.objects.create(title='Texts', owner=self.user, note_content=[
+            {"type": "text", "body": "One two three"}, {"type": "text", "body": "Four"},
+        ])
+        self.lists = Note.objects.create(title='Lists', owner=self.user, note_content=[
+            build_list("Todo", "Call", "Write", "Read"), build_list("Done", "Sleep", checked=True),
+        ])
+        self.mixed = Note.objects.create(title='Mixed', owner=self.user, note_content=[
+            {"type": "text", "body": "Some words"}, build_list("Groceries", "Milk"),
+        ])
+        self.empty = Note.objects.create(title='Empty', owner=self.user, note_content=[])
+
+    def assert_stats_match_content(self, note):
+        stored = Note.objects.get(pk=note.pk)
+        self.assertEqual(stored.content_details, stored.note_content.details)
+
+    def test_stored_counts_match_the_content(self):
+        for note in (self.texts, self.lists, self.mixed, self.empty):
+            with self.subTest(note=note.title):
+                self.assert_stats_match_content(note)
+        self.assertEqual(
+            Note.objects.get(pk=self.lists.pk).content_details,
+            {"no_of_text_content": 0, "no_of_list_items": 4, "no_of_lists": 2, "no_of_unchecked_items": 3, "approximate_word_count": 6},
+        )
+
+        self.texts.note_content = [build_list("Replaced", "Only item")]
+        self.texts.save()
+        self.assert_stats_match_content(self.texts)
+        self.assertEqual(Note.objects.get(pk=self.texts.pk).lists_count, 1)
+
+        response = self.client.patch(
+            reverse('note-patch', kwargs={'slug': self.mixed.slug}),
+            {"operations": [{"op": "check", "path": "1/0", "value": True}, {"op": "remove", "path": "0"}]}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assert_stats_match_content(self.mixed)
+        self.assertEqual(Note.objects.get(pk=self.mixed.pk).texts_count, 0)
+        self.assertEqual(Note.objects.get(pk=self.mixed.pk).unchecked_items_count, 0)
+
+    def test_backfill_fixes_stale_rows(self):
+        Note.objects.filter(owner=self.user).update(
+            texts_count=9, list_items_count=9, lists_count=9, unchecked_items_count=9, approximate_word_count=9, preview='',
+        )
+        stdout = io.StringIO()
+        call_command('backfill_note_stats', '--batch-size', '2', stdout=stdout)
+        self.assertIn("Updated content statistics and previews of 4 note(s)", stdout.getvalue())
+
+        for note in (self.texts, self.lists, self.mixed, self.empty):
+            with self.subTest(note=note.title):
+                self.assert_stats_match_content(note)
+        self.assertEqual(Note.objects.get(pk=self.texts.pk).preview, 'One two three Four')
+
+    def get_titles(self, **params) -> list:
+        response = self.client.get(reverse('note-list-create'), {'fields': 'title', **params})
+        self.assertEqual(response.status_code, 200)
+        return [note['title'] for note in response.data['results']]
+
+    def test_filters_and_orderings(self):
+        self.assertEqual(set(self.get_titles(has='texts')), {'Texts', 'Mixed'})
+        self.assertEqual(set(self.get_titles(has='lists')), {'Lists', 'Mixed'})
+        self.assertEqual(set(self.get_titles(has='texts,list_items')), {'Mixed'})
+        self.assertEqual(set(self.get_titles(has=' lists , list_items')), {'Lists', 'Mixed'})
+
+        self.assertEqual(self.get_titles(ordering='-list_items_count')[:2], ['Lists', 'Mixed'])
+        self.assertEqual(self.get_titles(ordering='approximate_word_count')[0], 'Empty')
+        self.assertEqual(self.get_titles(ordering='-texts_count', has='texts'), ['Texts', 'Mixed'])
+
+    def test_invalid_filter_and_ordering_values(self):
+        for params in ({'has': 'images'}, {'has': 'texts,'}, {'ordering': 'title'}, {'ordering': '--texts_count'}, {'ordering': 'preview'}):
+            with self.subTest(**params):
+                response = self.client.get(reverse('note-list-create'), params)
+                self.assertEqual(response.status_code, 400)
+
+
+@override_settings(NOTES_CONFIG={"INDEX_IN_BACKGROUND": False})
+class LazyNoteContentTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('lazy')
+        for index in range(3):
+            Note.objects.create(title=f'Lazy {index}', owner=cls.user, note_content=[
+                {"type": "text", "body": f"Note {index}"}, build_list("Todo", "Wake up", checked=True),
+            ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        content_load_stats.reset()
+
+    def test_content_is_materialized_once_on_access(self):
+        note = Note.objects.get(title='Lazy 0')
+        self.assertIsInstance(note.note_content, LazyNoteContent)
+        self.assertFalse(note.note_content.is_materialized)
+        self.assertEqual(content_load_stats.as_dict(), {"loaded": 1, "materialized": 0})
+
+        self.assertEqual(len(note.note_content.items), 2)
+        self.assertEqual(note.note_content.items[0].text, "Note 0")
+        self.assertEqual(note.note_content.details["no_of_list_items"], 1)
+        self.assertTrue(note.note_content.is_materialized)
+        self.assertEqual(content_load_stats.as_dict(), {"loaded": 1, "materialized": 1})
+
+    def test_listing_notes_does_not_materialize_them(self):
+        notes = list(Note.objects.filter(owner=self.user))
+        self.assertEqual(len(notes), 3)
+        self.assertEqual(content_load_stats.as_dict(), {"loaded": 3, "materialized": 0})
+
+        content_load_stats.reset()
+        list(Note.objects.only('title', 'slug'))
+        self.assertEqual(content_load_stats.as_dict(), {"loaded": 0, "materialized": 0})
+
+    def test_raw_and_summary_views_do_not_materialize_notes(self):
+        for url, params in (
+            (reverse('note-list-create'), {}),
+            (reverse('note-list-create'), {'view': 'summary'}),
+            (reverse('starred-note-list'), {}),
+            (reverse('note-detail', kwargs={'slug': 'lazy-1'}), {}),
+        ):
+            with self.subTest(url=url, **params):
+                content_load_stats.reset()
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(content_load_stats.materialized, 0)
+                if params:
+                    self.assertEqual(content_load_stats.loaded, 0)
+
+        content_load_stats.reset()
+        response = self.client.get(reverse('note-list-create'), {'fields': 'title,slug'})
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertEqual(content_load_stats.loaded, 0)
+
+
+@override_settings(NOTES_CONFIG={"INDEX_IN_BACKGROUND": False})
+class RawContentTestCase(TestCase):
+
+    def setUp(self):
+        self.user = create_user('raw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        search_cache.reset()
+
+    def set_raw_content(self, note, value: str):
+        with connection.cursor() as cursor:
+            cursor.execute(f'UPDATE {Note._meta.db_table} SET note_content = %s WHERE id = %s', [value, note.pk])
+
+    def assert_responses_match(self, note):
+        for url, params in (
+            (reverse('note-detail', kwargs={'slug': note.slug}), {}),
+            (reverse('note-list-create'), {}),
+            (reverse('note-find'), {'q': 'raw'}),
+        ):
+            with self.subTest(url=url):
+                raw = self.client.get(url, params)
+                with mock.patch.object(RawContentMixin, 'raw_content', False):
+                    plain = self.client.get(url, params)
+                self.assertEqual(raw.status_code, 200)
+                self.assertEqual(raw.content, plain.content)
+
+    def test_plain_rows_are_written_as_stored(self):
+        note = Note.objects.create(title='Raw note', owner=self.user, starred=True, note_content=[
+            {"type": "text", "body": "Café, naïve 日本語 — “quoted” \"escaped\" \\ slash"}, build_list("Todo", "Ünïcode", checked=True),
+        ])
+        self.assertEqual(Note.objects.get(pk=note.pk).note_content.raw_json, encode_note_content(note.note_content.content))
+        self.assert_responses_match(note)
+
+    def test_compressed_rows_are_written_decompressed(self):
+        note = Note.objects.create(title='Raw note', owner=self.user, note_content=[
+            build_list("Groceries", *[f"Item {index} to buy" for index in range(100)]),
+        ])
+        content = Note.objects.get(pk=note.pk).note_content
+        self.assertTrue(is_compressed(content.raw))
+        self.assertEqual(content.raw_json, decompress_note_content(content.raw))
+        self.assert_responses_match(note)
+
+    def test_legacy_rows_fall_back(self):
+        note = Note.objects.create(title='Raw note', owner=self.user, note_content=[])
+        self.set_raw_content(note, str([{"type": "text", "body": "Stored as a repr"}]))
+        self.assertIsNone(Note.objects.get(pk=note.pk).note_content.raw_json)
+        self.assert_responses_match(note)
+
+    def test_materialized_content_falls_back(self):
+        Note.objects.create(title='Raw note', owner=self.user, note_content=[{"type": "text", "body": "Read"}])
+        request = Request(APIRequestFactory().get('/api/notes/'))
+        rendered = []
+        for raw_content in (True, False):
+            note = Note.objects.get(title='Raw note')
+            self.assertEqual(len(note.note_content.items), 1)
+            data = NoteSerializer(note, context={'request': request, 'raw_content': raw_content}).data
+            self.assertEqual(data['content'], [{"type": "text", "body": "Read"}])
+            rendered.append(RawJSONRenderer().render(data))
+        self.assertEqual(rendered[0], rendered[1])
+
+    def test_line_separators_are_escaped(self):
+        body = "Line\u2028separator and paragraph\u2029separator"
+        note = Note.objects.create(title='Raw note', owner=self.user, note_content=[{"type": "text", "body": body}])
+        self.assertIn('\u2028', Note.objects.get(pk=note.pk).note_content.raw_json)
+        self.assert_responses_match(note)
+
+        response = self.client.get(reverse('note-detail', kwargs={'slug': note.slug}))
+        self.assertIn(b'Line\\u2028separator and paragraph\\u2029separator', response.content)
+        self.assertNotIn('\u2028'.encode(), response.content)
+        self.assertEqual(response.json()['content'][0]['body'], body)
+
+
+class ContentTypeRegistryTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.registry = ContentTypeRegistry()
+        for type_name in ('text', 'list', 'list_item'):
+            self.registry.register(type_name, content_types.get_validator(type_name))
+        self.validate = content_types.compile(NoteContent.allowed_content_types)
+
+    def assert_message(self, content, message: str):
+        with self.assertRaises(DjangoValidationError) as context:
+            self.validate(content)
+        self.assertEqual(context.exception.messages, [message])
+
+    def test_custom_types(self):
+        @self.registry.register('Drawing')
+        def validate_drawing_body(value, registry=None):
+            if not isinstance(value, dict) or 'strokes' not in value:
+                raise DjangoValidationError("A drawing should have strokes")
+
+        self.assertIn('drawing', self.registry)
+        self.assertEqual(self.registry.types, ('text', 'list', 'list_item', 'drawing'))
+        drawing = {"type": "DRAWING", "body": {"strokes": []}}
+        self.assertEqual(self.registry.compile()([drawing]), [drawing])
+        with self.assertRaises(DjangoValidationError):
+            self.registry.compile()([{"type": "drawing", "body": {"lines": []}}])
+
+        # Types left out of the allowed ones are kept as is
+        self.assertEqual(self.registry.compile(('text',))([{"type": "drawing", "body": {"lines": []}}]), [{"type": "drawing", "body": {"lines": []}}])
+
+        self.registry.unregister('drawing')
+        self.assertNotIn('drawing', self.registry)
+        with self.assertRaises(DjangoValidationError) as context:
+            self.registry.get_validator('drawing')
+        self.assertEqual(context.exception.messages, ["Unregistered content type `drawing`"])
+
+    def test_malformed_items_are_rejected(self):
+        cases = [
+            ({"type": "text"}, "Invalid content type: <class 'dict'>"),
+            ([["text"]], "Invalid content item"),
+            ([{"body": "x"}], "content item should have 'type' attribute"),
+            ([{"type": 1, "body": "x"}], "content item 'type' attribute should be a string"),
+            ([{"type": "text", "body": ""}], "content item type `text` should have 'body' attribute"),
+            ([{"type": "text", "body": ["x"]}], "Invalid content item! The `body` of an item of type `text` should be a string"),
+            ([{"type": "list_item", "body": "x"}], "Invalid content item! The `body` of an item of type `list_item` should be a dictionary"),
+            ([{"type": "list_item", "body": {"checked": True, "item_value": "x", "due": "now"}}],
+             "Invalid content item! `list_item` may be containing invalid keys or is missing a key"),
+            ([{"type": "list_item", "body": {"checked": "yes", "item_value": "x"}}], "Invalid content item! `list_item` key, 'checked', is not boolean"),
+            ([{"type": "list_item", "body": {"checked": False}}], "Invalid content item! `list_item` key, 'item_value', is required"),
+            ([{"type": "list_item", "body": {"item_value": 1}}], "Invalid content item! `list_item` key, 'item_value', should be a string"),
+            ([{"type": "list", "body": {"title": "x"}}], "Invalid content item! `list` has missing key(s)"),
+            ([{"type": "list", "body": {"title": "", "list_items": []}}], "Invalid content item! `list` key, 'title', is required"),
+            ([{"type": "list", "body": {"title": 1, "list_items": [1]}}], "Invalid content item! `list` key, 'title', is not a string"),
+            ([{"type": "list", "body": {"title": "x", "list_items": "y"}}], "Invalid content item! `list` key, 'list_items', is not a list"),
+            ([{"type": "list", "body": {"title": "x", "list_items": ["y"]}}], "Invalid list item"),
+            ([{"type": "list", "body": {"title": "x", "list_items": [{"type": "list_item"}]}}], "list item should have 'body' attribute"),
+            ([{"type": "list", "body": {"title": "x", "list_items": [{"type": "text", "body": "y"}]}}], "list item 'type' attribute is invalid"),
+        ]
+        for content, message in cases:
+            with self.subTest(message=message):
+                self.assert_message(content, message)
+
+    def test_string_booleans_are_checked_values(self):
+        for checked in (True, False, "True", "False", None):
+            with self.subTest(checked=checked):
+                body = {"item_value": "Call"} if checked is None else {"checked": checked, "item_value": "Call"}
+                self.validate([build_list("Todo", "Write"), {"type": "list_item", "body": body}])
+        for checked in ("true", "yes", 1, 0):
+            with self.subTest(checked=checked):
+                self.assert_message(
+                    [{"type": "list_item", "body": {"checked": checked, "item_value": "Call"}}],
+                    "Invalid content item! `list_item` key, 'checked', is not boolean",
+                )
+
+    def test_compiled_validators_are_cached_per_allowed_types(self):
+        validator = self.registry.compile(('text', 'list'))
+        self.assertIs(self.registry.compile(('text', 'list')), validator)
+        self.assertIs(self.registry.compile(['text', 'list']), validator)
+        self.assertIsNot(self.registry.compile(('list', 'text')), validator)
+        self.assertIsNot(self.registry.compile(), validator)
+
+        # Registering a type clears the cache
+        self.registry.register('drawing', lambda value, registry=None: None)
+        self.assertIsNot(self.registry.compile(('text', 'list')), validator)
+
+    def test_validation_benchmark(self):
+        stdout = io.StringIO()
+        call_command('benchmark_notes', 'validation', '--repeat', '1', stdout=stdout)
+        rows = stdout.getvalue().splitlines()[2:]
+        self.assertEqual([row.split()[:2] for row in rows], [[size, checked] for size in ('1KB', '100KB', '1MB') for checked in ('bool', 'str')])
+
+
+class ContentPatchTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.content = [
+            {"type": "text", "body": "First"},
+            build_list("Groceries", "Milk", "Eggs"),
+            {"type": "text", "body": "Last"},
+        ]
+
+    def patch(self, *operations) -> list:
+        return apply_content_operations(NoteContent(self.content), list(operations)).content
+
+    def test_add(self):
+        text = {"type": "text", "body": "New"}
+        self.assertEqual(self.patch({"op": "add", "path": "0", "value": text})[0], text)
+        self.assertEqual(self.patch({"op": "add", "path": "-", "value": text})[-1], text)
+
+        item = {"type": "list_item", "body": {"checked": False, "item_value": "Bread"}}
+        content = self.patch({"op": "add", "path": "1/-", "value": item})
+        self.assertEqual(content[1], build_list("Groceries", "Milk", "Eggs", "Bread"))
+
+    def test_remove(self):
+        self.assertEqual(self.patch({"op": "remove", "path": 0}), self.content[1:])
+        self.assertEqual(self.patch({"op": "remove", "path": "1/0"})[1], build_list("Groceries", "Eggs"))
+
+    def test_replace(self):
+        text = {"type": "text", "body": "Replaced"}
+        self.assertEqual(self.patch({"op": "replace", "path": [2], "value": text})[2], text)
+
+    def test_move(self):
+        content = self.patch({"op": "move", "from": "0", "path": "-"})
+        self.assertEqual(content, [self.content[1], self.content[2], self.content[0]])
+        self.assertEqual(self.patch({"op": "move", "from": "1/1", "path": "1/0"})[1], build_list("Groceries", "Eggs", "Milk"))
+
+    def test_check(self):
+        content = self.patch({"op": "check", "path": "1/1", "value": True})
+        self.assertEqual(content[1]["body"]["list_items"][1]["body"], {"checked": True, "item_value": "Eggs"})
+        self.assertEqual(content[1]["body"]["list_items"][0], self.content[1]["body"]["list_items"][0])
+
+    def test_rejects_out_of_range_indexes(self):
+        text = {"type": "text", "body": "New"}
+        for operation in [
+            {"op": "remove", "path": "3"},
+            {"op": "replace", "path": "3", "value": text},
+            {"op": "add", "path": "4", "value": text},
+            {"op": "check", "path": "1/2", "value": True},
+            {"op": "remove", "path": "5/0"},
+            {"op": "move", "from": "1/5", "path": "0"},
+            {"op": "remove", "path": "-1"},
+        ]:
+            with self.subTest(operation=operation), self.assertRaises(DjangoValidationError):
+                self.patch(operation)
+
+    def test_rejects_invalid_operations(self):
+        for operation in [
+            {"op": "copy", "path": "0"},
+            {"op": "add", "path": "0"},
+            {"op": "check", "path": "0", "value": True},
+            {"op": "check", "path": "1/0", "value": "yes"},
+            {"op": "add", "path": "1/0", "value": {"type": "text", "body": "Not a list item"}},
+            {"op": "move", "from": "0", "path": "1/0"},
+            {"op": "add", "path": "0", "value": {"type": "text", "body": 1}},
+        ]:
+            with self.subTest(operation=operation), self.assertRaises(DjangoValidationError):
+                self.patch(operation)
+
+    def test_all_or_none(self):
+        content = NoteContent(self.content)
+        operations = [
+            {"op": "remove", "path": "0"},
+            {"op": "check", "path": "0/0", "value": True},
+            {"op": "remove", "path": "9"},
+        ]
+        with self.assertRaisesMessage(DjangoValidationError, "Operation 2"):
+            apply_content_operations(content, operations)
+        self.assertEqual(content.content, self.content)
+
+
+@override_settings(NOTES_CONFIG={"INDEX_IN_BACKGROUND": False})
+class NoteContentPatchViewTestCase(TestCase):
+
+    def setUp(self):
+        self.user = create_user('patcher')
+        self.content = [{"type": "text", "body": "First"}, build_list("Groceries", "Milk", "Eggs")]
+        self.note = Note.objects.create(title='Patched', owner=self.user, note_content=self.content)
+        self.url = reverse('note-patch', kwargs={'slug': self.note.slug})
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_patch(self):
+        operations = [{"op": "check", "path": "1/0", "value": True}, {"op": "remove", "path": "0"}]
+        response = self.client.patch(self.url, {"operations": operations}, format='json')
+        self.assertEqual(response.status_code, 200)
+        expected = [build_list("Groceries", "Milk", "Eggs")]
+        expected[0]["body"]["list_items"][0]["body"]["checked"] = True
+        self.assertEqual(response.data['content'], expected)
+        self.assertEqual(Note.objects.get(pk=self.note.pk).note_content.content, expected)
+
+    def test_invalid_operation_leaves_content_unchanged(self):
+        operations = [{"op": "remove", "path": "0"}, {"op": "replace", "path": "5", "value": {"type": "text", "body": "x"}}]
+        response = self.client.patch(self.url, {"operations": operations}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Note.objects.get(pk=self.note.pk).note_content.content, self.content)
+
+
+class RevisionDeltaTestCase(SimpleTestCase):
+
+    def test_apply_delta(self):
+        old = [{"type": "text", "body": "Kept"}, build_list("Groceries", "Milk", "Eggs"), {"type": "text", "body": "Removed"}]
+        new = [{"type": "text", "body": "Added"}, {"type": "text", "body": "Kept"}, build_list("Groceries", "Milk", "Bread")]
+        operations = diff_items(build_items(old), build_items(new))
+        self.assertEqual([item.to_dict() for item in apply_delta(build_items(old), operations)], new)
+
+    def test_checked_item_is_stored_as_check(self):
+        old = [build_list("Groceries", "Milk", "Eggs")]
+        new = [build_list("Groceries", "Milk", "Eggs")]
+        new[0]["body"]["list_items"][1]["body"]["checked"] = True
+        operations = diff_items(build_items(old), build_items(new))
+        self.assertEqual(operations, [{"op": "check", "path": "0/1", "value": True}])
+        self.assertEqual([item.to_dict() for item in apply_delta(build_items(old), operations)], new)
+
+
+@override_settings(NOTES_CONFIG={"INDEX_IN_BACKGROUND": False, "REVISION_SNAPSHOT_INTERVAL": 3})
+class NoteRevisionTestCase(TestCase):
+
+    def setUp(self):
+        self.note = Note.objects.create(title='Revised', owner=create_user('reviser'), note_content=[build_list("Todo", "Item 0")])
+        # Content of each revision, by number
+        self.expected = {1: [build_list("Todo", "Item 0")]}
+        for number in range(2, 9):
+            content = [build_list("Todo", *(f"Item {index}" for index in range(number)))]
+            content[0]["body"]["list_items"][0]["body"]["checked"] = number % 2 == 0
+            if number % 3 == 0:
+                content.insert(0, {"type": "text", "body": f"Revision {number}"})
+            self.note.note_content = content
+            self.note.save()
+            self.expected[number] = content
+
+    def assertRevisionsRebuilt(self, numbers):
+        for number in numbers:
+            with self.subTest(number=number):
+                revision = NoteRevision.objects.get_with_content(self.note, number)
+                self.assertEqual(revision.content.content, self.expected[number])
+
+    def test_snapshots_and_deltas_rebuild_each_revision(self):
+        snapshots = NoteRevision.objects.filter(note=self.note, is_snapshot=True).values_list('number', flat=True)
+        self.assertEqual(sorted(snapshots), [1, 4, 7])
+        self.assertRevisionsRebuilt(range(1, 9))
+
+    def test_title_change_is_recorded(self):
+        note = Note.objects.get(pk=self.note.pk)
+        note.title = 'Renamed'
+        note.save()
+        revision = NoteRevision.objects.get_with_content(note, 9)
+        self.assertEqual(revision.title, 'Renamed')
+        self.assertEqual(revision.content.content, self.expected[8])
+
+        note.save()
+        self.assertFalse(NoteRevision.objects.filter(note=note, number=10).exists())
+
+    def test_prune_compacts_kept_revisions(self):
+        call_command('prune_note_revisions', keep=5, stdout=io.StringIO())
+        revisions = NoteRevision.objects.filter(note=self.note).order_by('number')
+        self.assertEqual([revision.number for revision in revisions], [4, 5, 6, 7, 8])
+        self.assertEqual([revision.number for revision in revisions if revision.is_snapshot], [4, 7])
+        self.assertRevisionsRebuilt(range(4, 9))
+
+        call_command('prune_note_revisions', keep=4, stdout=io.StringIO())
+        self.assertTrue(NoteRevision.objects.get(note=self.note, number=5).is_snapshot)
+        self.assertRevisionsRebuilt(range(5, 9))
+
+
+class SearchBackendSelectionTestCase(SimpleTestCase):
+
+    @override_settings(NOTES_CONFIG={})
+    def test_index_backend_is_the_default(self):
+        self.assertIsInstance(get_search_backend(), IndexSearchBackend)
+
+    @override_settings(NOTES_CONFIG={"SEARCH_BACKEND": "notes.search.FTS5SearchBackend"})
+    def test_backend_is_read_from_settings(self):
+        self.assertIsInstance(get_search_backend(), FTS5SearchBackend)
+
+
+@override_settings(NOTES_CONFIG={"INDEX_IN_BACKGROUND": False})
+class SearchBackendTestCase(TestCase):
+
+    def setUp(self):
+        self.user = create_user('searcher')
+        self.in_title = Note.objects.create(title='Garden plans', owner=self.user, note_content=[
+            {"type": "text", "body": "Seeds to order"},
+        ])
+        self.in_list = Note.objects.create(title='Weekend', owner=self.user, note_content=[
+            build_list("Garden", "Rake the leaves"),
+        ])
+        self.in_body = Note.objects.create(title='Chores', owner=self.user, note_content=[
+            {"type": "text", "body": "Water the plants in the garden before leaving on holiday"},
+        ])
+        Note.objects.create(title='Garden of another user', owner=create_user('neighbour'))
+
+    def test_matches_are_ranked_by_column_weight(self):
+        results = list(Note.objects.search('garden', user=self.user))
+        self.assertEqual(results, [self.in_title, self.in_list, self.in_body])
+        self.assertGreater(results[0].search_rank, results[1].search_rank)
+        self.assertGreater(results[1].search_rank, results[2].search_rank)
+
+    def test_ranks_do_not_depend_on_the_notes_searched(self):
+        ranks = {note.pk: note.search_rank for note in Note.objects.search('garden', user=self.user)}
+        with CaptureQueriesContext(connection) as queries:
+            result = Note.objects.filter(pk=self.in_body.pk).search('garden', user=self.user).get()
+        self.assertEqual(result.search_rank, ranks[self.in_body.pk])
+        # The notes of the user are not counted on every search
+        self.assertFalse([query['sql'] for query in queries if 'COUNT(*)' in query['sql'] and '"notes_note"' in query['sql']])
+
+    def test_snippets_highlight_the_match(self):
+        backend = get_search_backend()
+        results = {note.pk: note for note in Note.objects.search('plants', user=self.user)}
+        self.assertEqual(list(results), [self.in_body.pk])
+        self.assertIn('<mark>plants</mark>', backend.get_snippet(results[self.in_body.pk], 'plants'))
+
+    def test_search_is_scoped_to_the_user(self):
+        self.assertEqual(Note.objects.search('garden').count(), 4)
+        self.assertEqual(Note.objects.search('another', user=self.user).count(), 0)
+
+    def test_updated_and_deleted_notes_are_reindexed(self):
+        self.in_body.note_content = [{"type": "text", "body": "Nothing left to do"}]
+        self.in_body.save()
+        self.in_title.delete()
+        self.assertEqual(list(Note.objects.search('garden', user=self.user)), [self.in_list])
+
+    def test_phrase_terms_are_all_contained(self):
+        backend = get_search_backend()
+        notes = Note.objects.filter(owner=self.user)
+        self.assertEqual(list(backend.filter_phrase(notes, 'the leaves')), [self.in_list])
+        self.assertFalse(backend.filter_phrase(notes, 'plants leaves').exists())
+
+
+@override_settings(NOTES_CONFIG={"INDEX_IN_BACKGROUND": False, "SEARCH_BACKEND": "notes.search.FTS5SearchBackend"})
+class FTS5SearchBackendTestCase(SearchBackendTestCase):
+    '''Runs the search tests with the full-text search table'''
+
+    def test_snippets_are_annotated(self):
+        results = {note.pk: note for note in Note.objects.search('plants', user=self.user)}
+        self.assertIn('<mark>plants</mark>', results[self.in_body.pk].search_snippet)
+
+    def test_rows_of_notes_deleted_in_bulk_are_deleted(self):
+        Note.objects.filter(owner=self.user).delete()
+        self.assertFalse(NoteFTSEntry.objects.filter(owner_id=self.user.pk).exists())
+
+    def test_rows_of_notes_deleted_with_their_owner_are_deleted(self):
+        # Rows are removed by the backend, not by a trigger that SQLite drops when the notes table is rebuilt
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s", [Note._meta.db_table])
+            self.assertEqual(cursor.fetchall(), [])
+
+        self.user.delete()
+        self.assertEqual(list(NoteFTSEntry.objects.values_list('title', flat=True)), ['Garden of another user'])
+
+    def test_deleted_notes_are_queued_for_removal_in_background(self):
+        with self.settings(NOTES_CONFIG={**settings.NOTES_CONFIG, "INDEX_IN_BACKGROUND": True}):
+            Note.objects.filter(pk__in=[self.in_title.pk, self.in_list.pk]).delete()
+        jobs = NoteIndexJob.objects.values_list('note_id', 'action')
+        self.assertEqual(
+            sorted(jobs), [(self.in_title.pk, NoteIndexJob.ACTION_DELETE), (self.in_list.pk, NoteIndexJob.ACTION_DELETE)],
+        )
+        self.assertEqual(NoteFTSEntry.objects.filter(owner_id=self.user.pk).count(), 3)
+
+    def test_phrase_terms_follow_one_another(self):
+        backend = get_search_backend()
+        notes = Note.objects.filter(owner=self.user)
+        self.assertEqual(list(backend.filter_phrase(notes, 'the leaves')), [self.in_list])
+        self.assertFalse(backend.filter_phrase(notes, 'leaves the').exists())
+
+    def test_migration_fills_columns_as_the_backend_does(self):
+        migration = importlib.import_module('notes.migrations.0010_note_fts')
+        for note in Note.objects.filter(owner=self.user):
+            with self.subTest(note=note.title):
+                columns = get_fts_columns(note.title, note.note_content.items)
+                self.assertEqual(
+                    migration.get_columns(note.title, note.note_content.content),
+                    (columns['title'], columns['headings'], columns['body']),
+                )
+
+
+@override_settings(NOTES_CONFIG={"INDEX_IN_BACKGROUND": False})
+class FuzzyVocabularyTestCase(TestCase):
+
+    def setUp(self):
+        self.user = create_user('gardener')
+        self.neighbour = create_user('neighbour')
+        self.note = Note.objects.create(title='Tomatoes', owner=self.user, note_content=[
+            {"type": "text", "body": "Stake the tomatoes and water the basil"},
+        ])
+        self.other_note = Note.objects.create(title='Basil', owner=self.user, note_content=[])
+        Note.objects.create(title='Tomatoey', owner=self.neighbour, note_content=[])
+
+    def get_terms(self, user) -> set:
+        return set(NoteTermTrigram.objects.filter(owner=user).values_list('term', flat=True))
+
+    def test_vocabularies_are_kept_per_owner(self):
+        self.assertEqual(self.get_terms(self.user), {'tomatoes', 'stake', 'the', 'and', 'water', 'basil'})
+        self.assertEqual(self.get_terms(self.neighbour), {'tomatoey'})
+
+    def test_expansions_are_not_spent_on_terms_of_other_users(self):
+        # "tomatoey" is closer to the query, but only the user's terms are expanded to
+        with self.settings(NOTES_CONFIG={**settings.NOTES_CONFIG, "FUZZY_MAX_EXPANSIONS": 1}):
+            results = Note.objects.fuzzy_search('tomatoe', user=self.user)
+            self.assertEqual(list(results), [self.note])
+
+    def test_terms_of_deleted_notes_are_pruned(self):
+        self.note.delete()
+        self.assertEqual(self.get_terms(self.user), {'basil'})
+        self.assertEqual(self.get_terms(self.neighbour), {'tomatoey'})
+
+    def test_deletes_look_up_terms_in_batches(self):
+        words = ' '.join(f'word{index}' for index in range(300))
+        note = Note.objects.create(title='Many words', owner=self.user, note_content=[{"type": "text", "body": words}])
+        with CaptureQueriesContext(connection) as queries:
+            note.delete()
+        self.assertLess(len(queries), 15)
+        self.assertEqual(self.get_terms(self.user), {'tomatoes', 'stake', 'the', 'and', 'water', 'basil'})
+
+    def test_rebuild_prunes_terms_edited_out_of_notes(self):
+        self.note.note_content = [{"type": "text", "body": "Water the basil"}]
+        self.note.save()
+        self.assertIn('stake', self.get_terms(self.user))
+
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(self.get_terms(self.user), {'tomatoes', 'the', 'water', 'basil'})
+
+    def test_migrations_find_terms_as_notes_do(self):
+        content = [{"type": "text", "body": "Ｗａｔｅｒ the Café " + "x" * 80}, build_list("Todo", "Stake it")]
+        for name in ('0011_note_term_trigrams', '0021_note_term_trigram_owner'):
+            with self.subTest(migration=name):
+                migration = importlib.import_module(f'notes.migrations.{name}')
+                self.assertEqual(migration.get_terms('Tomatoes', content), get_note_terms('Tomatoes', build_items(content)))
+                self.assertEqual(migration.get_trigrams('tomato'), get_trigrams('tomato'))
+
+
+@override_settings(NOTES_CONFIG={"INDEX_IN_BACKGROUND": False, "SEARCH_BACKEND": "notes.search.FTS5SearchBackend"})
+class FTS5FuzzyVocabularyTestCase(FuzzyVocabularyTestCase):
+    '''Runs the vocabulary tests with the terms of notes looked up in the full-text search table'''
+
+    def test_long_terms_are_found_by_prefix(self):
+        Note.objects.create(title='y' * 80, owner=self.user, note_content=[])
+        Note.objects.create(title='y' * 80 + ' seeds', owner=self.user, note_content=[]).delete()
+        self.assertIn('y' * 64, self.get_terms(self.user))
+
+    def test_terms_are_found_as_the_table_tokenizes_them(self):
+        Note.objects.create(title='Café crème', owner=self.user, note_content=[{"type": "text", "body": "snake_case ガイド"}])
+        Note.objects.create(title='Café crème snake_case ガイド', owner=self.user, note_content=[]).delete()
+        self.assertTrue({'café', 'crème', 'snake_case', 'ガイド'} <= self.get_terms(self.user))
+        self.assertEqual(
+            FTS5SearchBackend().find_terms(['café', 'cafe', 'snake_case', 'snake', 'ガイド', 'カイト', 'tomatoey'], self.user.pk),
+            {'café', 'cafe', 'snake_case', 'snake', 'ガイド'},
+        )
+
+
+@override_settings(NOTES_CONFIG={"INDEX_IN_BACKGROUND": False})
+class NoteCollectionSizeTestCase(TestCase):
+
+    def setUp(self):
+        self.user = create_user('counter')
+        self.neighbour = create_user('neighbour')
+        self.notes = [Note.objects.create(title=f'Note {index}', owner=self.user, note_content=[]) for index in range(3)]
+        Note.objects.create(title='Other note', owner=self.neighbour, note_content=[])
+
+    def get_counts(self) -> dict:
+        return dict(NoteCollectionSize.objects.values_list('owner', 'notes_count'))
+
+    def test_notes_are_counted_as_they_are_created_and_deleted(self):
+        self.assertEqual(self.get_counts(), {self.user.pk: 3, self.neighbour.pk: 1})
+
+        self.notes[0].title = 'Renamed'
+        self.notes[0].save()
+        self.notes[1].delete()
+        self.assertEqual(NoteCollectionSize.objects.get_notes_count(self.user.pk), 2)
+
+        Note.objects.filter(owner=self.user).delete()
+        self.assertEqual(self.get_counts(), {self.user.pk: 0, self.neighbour.pk: 1})
+
+    def test_notes_given_to_another_owner_are_moved(self):
+        note = Note.objects.get(pk=self.notes[0].pk)
+        note.owner = self.neighbour
+        note.save()
+        self.assertEqual(self.get_counts(), {self.user.pk: 2, self.neighbour.pk: 2})
+
+    def test_counts_are_deleted_with_their_owner(self):
+        self.user.delete()
+        self.assertEqual(self.get_counts(), {self.neighbour.pk: 1})
+
+    def test_rebuild_counts_notes_created_in_bulk(self):
+        Note.objects.bulk_create([Note(title='Imported', slug=f'imported-{index}', owner=self.user) for index in range(2)])
+        self.assertEqual(NoteCollectionSize.objects.get_notes_count(self.user.pk), 3)
+
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(self.get_counts(), {self.user.pk: 5, self.neighbour.pk: 1})
+
+    def test_migration_counts_notes_as_they_are_counted(self):
+        expected = self.get_counts()
+        NoteCollectionSize.objects.all().delete()
+        importlib.import_module('notes.migrations.0024_note_collection_sizes').count_notes(apps, None)
+        self.assertEqual(self.get_counts(), expected)
+
+
+def start_of(year: int, month: int, day: int) -> datetime.datetime:
+    return timezone.make_aware(datetime.datetime(year, month, day))
+
+
+class NoteQueryParserTestCase(SimpleTestCase):
+
+    def test_words_and_quoted_phrases(self):
+        query = parse_note_query('buy "green apples" milk ""  "open phrase')
+        self.assertEqual(query.words, ['buy', 'milk'])
+        self.assertEqual(query.phrases, ['green apples', 'open phrase'])
+        self.assertEqual(query.filters, [])
+        self.assertEqual(query.text, 'buy milk green apples open phrase')
+
+    def test_unknown_keys_are_words(self):
+        query = parse_note_query('color:red to:do')
+        self.assertEqual(query.words, ['color:red', 'to:do'])
+        self.assertEqual(query.filters, [])
+
+    def test_filters(self):
+        cases = {
+            'type:text': models.Q(texts_count__gt=0),
+            'TYPE:List': models.Q(lists_count__gt=0),
+            'type:list_item': models.Q(list_items_count__gt=0),
+            'checked:false': models.Q(unchecked_items_count__gt=0),
+            'checked:TRUE': models.Q(list_items_count__gt=models.F('unchecked_items_count')),
+            'starred:true': models.Q(starred=True),
+            'starred:"false"': models.Q(starred=False),
+            'created:2026-01-15': models.Q(date_created__gte=start_of(2026, 1, 15), date_created__lt=start_of(2026, 1, 16)),
+            'created:>2026-01-15': models.Q(date_created__gte=start_of(2026, 1, 16)),
+            'created:>=2026-01-15': models.Q(date_created__gte=start_of(2026, 1, 15)),
+            'created:<2026-01-15': models.Q(date_created__lt=start_of(2026, 1, 15)),
+            'created:<=2026-01-15': models.Q(date_created__lt=start_of(2026, 1, 16)),
+            'created:2026-01-01..2026-01-31': models.Q(date_created__gte=start_of(2026, 1, 1), date_created__lt=start_of(2026, 2, 1)),
+        }
+        for text, expected in cases.items():
+            with self.subTest(query=text):
+                query = parse_note_query(f'groceries {text}')
+                self.assertEqual(query.filters, [expected])
+                self.assertEqual(query.words, ['groceries'])
+
+    def test_invalid_filter_values(self):
+        for text in (
+            'type:image', 'checked:maybe', 'starred:1', 'created:2026-13-01', 'created:yesterday',
+            'created:>2026-01-01..2026-01-31', 'created:2026-01-01..soon',
+        ):
+            with self.subTest(query=text):
+                with self.assertRaises(QueryError):
+                    parse_note_query(f'groceries {text}')
+
+    def test_migration_counts_unchecked_items_as_notes_do(self):
+        migration = importlib.import_module('notes.migrations.0012_note_query_filters')
+        content = [
+            build_list("Done", "Milk", "Eggs", checked=True),
+            build_list("Todo", "Bread"),
+            {"type": "List", "body": {"title": "Mixed", "list_items": [
+                {"type": "list_item", "body": {"checked": "True", "item_value": "Called"}},
+                {"type": "list_item", "body": {"checked": "False", "item_value": "Write"}},
+                {"type": "list_item", "body": {"item_value": "Read"}},
+            ]}},
+            {"type": "list_item", "body": {"checked": False, "item_value": "Loose"}},
+            {"type": "text", "body": "Not a list"},
+        ]
+        self.assertEqual(migration.get_unchecked_items_count(content), NoteContent(content).unchecked_items_count)
+        self.assertEqual(migration.get_unchecked_items_count(content), 4)
+
+
+@override_settings(NOTES_CONFIG={"INDEX_IN_BACKGROUND": False})
+class NoteSearchQueryViewTestCase(TestCase):
+
+    def setUp(self):
+        self.user = create_user('finder')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.list_note = Note.objects.create(
+            title='Groceries', owner=self.user, starred=True, note_content=[build_list("Market", "Green apples", "Milk")],
+        )
+        self.text_note = Note.objects.create(
+            title='Groceries budget', owner=self.user, note_content=[{"type": "text", "body": "Apples and pears this week"}],
+        )
+
+    def find(self, query: str):
+        return self.client.get(reverse('note-find'), {'q': query})
+
+    def get_titles(self, response) -> list:
+        self.assertEqual(response.status_code, 200)
+        return [note['title'] for note in response.data['results']]
+
+    def test_filters_and_phrases_narrow_the_search(self):
+        self.assertCountEqual(self.get_titles(self.find('groceries')), ['Groceries', 'Groceries budget'])
+        self.assertEqual(self.get_titles(self.find('groceries type:list')), ['Groceries'])
+        self.assertEqual(self.get_titles(self.find('starred:false')), ['Groceries budget'])
+        self.assertEqual(self.get_titles(self.find('"green apples"')), ['Groceries'])
+
+    def test_invalid_filter_is_rejected(self):
+        response = self.find('groceries created:someday')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(NOTES_CONFIG={"INDEX_IN_BACKGROUND": True, "INDEX_JOB_MAX_ATTEMPTS": 2})
+class NoteIndexJobTestCase(TestCase):
+
+    def setUp(self):
+        self.user = create_user('indexer')
+        self.note = Note.objects.create(title='Queued', owner=self.user, note_content=[{"type": "text", "body": "Indexed later"}])
+
+    def get_job(self) -> NoteIndexJob:
+        return NoteIndexJob.objects.get(note_id=self.note.pk)
+
+    def make_due(self, **changes):
+        past = timezone.now() - datetime.timedelta(seconds=1)
+        NoteIndexJob.objects.update(**{field: past for field in changes or ('available_at',)})
+
+    def test_changes_of_a_note_share_one_job(self):
+        job = self.get_job()
+        enqueued_at = job.enqueued_at
+        self.assertEqual((job.action, job.generation), (NoteIndexJob.ACTION_INDEX, 1))
+        self.assertFalse(Note.objects.search('indexed', user=self.user).exists())
+
+        self.note.title = 'Queued again'
+        self.note.save()
+        self.assertEqual(self.get_job().generation, 2)
+
+        pk = self.note.pk
+        self.note.delete()
+        job = NoteIndexJob.objects.get()
+        self.assertEqual((job.note_id, job.action, job.generation), (pk, NoteIndexJob.ACTION_DELETE, 3))
+        # The job dates from the oldest change it covers
+        self.assertEqual(job.enqueued_at, enqueued_at)
+
+    def test_claimed_jobs_are_locked_for_the_lease(self):
+        self.assertEqual([job.note_id for job in NoteIndexJob.objects.claim('first', 10)], [self.note.pk])
+        self.assertEqual(NoteIndexJob.objects.claim('second', 10), [])
+
+        # The first worker died before its lease ended
+        self.make_due(locked_until=True)
+        self.assertEqual([job.locked_by for job in NoteIndexJob.objects.claim('second', 10)], ['second'])
+
+    def test_applied_jobs_are_deleted(self):
+        self.assertEqual(NoteIndexJob.objects.process('worker'), (1, 0))
+        self.assertFalse(NoteIndexJob.objects.exists())
+        self.assertEqual(list(Note.objects.search('indexed', user=self.user)), [self.note])
+
+    def test_job_of_a_note_changed_while_it_was_applied_is_kept(self):
+        index = IndexSearchBackend.index
+
+        def index_and_change(backend, note):
+            index(backend, note)
+            NoteIndexJob.objects.enqueue(note.pk, NoteIndexJob.ACTION_INDEX)
+
+        with mock.patch.object(IndexSearchBackend, 'index', index_and_change):
+            self.assertEqual(NoteIndexJob.objects.process('worker'), (1, 0))
+        job = self.get_job()
+        self.assertEqual((job.generation, job.locked_by), (2, None))
+
+        self.assertEqual(NoteIndexJob.objects.process('worker'), (1, 0))
+        self.assertFalse(NoteIndexJob.objects.exists())
+
+    def test_failed_jobs_are_retried_after_a_delay(self):
+        with mock.patch.object(IndexSearchBackend, 'index', side_effect=RuntimeError("Index unavailable")):
+            self.assertEqual(NoteIndexJob.objects.process('worker'), (0, 1))
+            job = self.get_job()
+            self.assertEqual((job.attempts, job.locked_by, job.last_error), (1, None, "RuntimeError: Index unavailable"))
+            self.assertGreater(job.available_at, timezone.now())
+            self.assertEqual(NoteIndexJob.objects.process('worker'), (0, 0))
+
+            self.make_due()
+            self.assertEqual(NoteIndexJob.objects.process('worker'), (0, 1))
+            self.assertEqual(list(NoteIndexJob.objects.failed()), [self.get_job()])
+            self.make_due()
+            self.assertEqual(NoteIndexJob.objects.process('worker'), (0, 0))
+
+        self.assertEqual(NoteIndexJob.objects.retry_failed(), 1)
+        self.assertEqual(NoteIndexJob.objects.process('worker'), (1, 0))
+        self.assertFalse(NoteIndexJob.objects.exists())
+
+    def test_jobs_waiting_for_a_retry_do_not_hold_back_the_queue(self):
+        long_ago = timezone.now() - datetime.timedelta(hours=1)
+        NoteIndexJob.objects.update(enqueued_at=long_ago, attempts=1)
+        self.assertEqual(NoteIndexJob.objects.lag(), 0)
+        self.assertFalse(NoteIndexJob.objects.is_backlogged())
+
+        NoteIndexJob.objects.update(attempts=0)
+        self.assertTrue(NoteIndexJob.objects.is_backlogged())
+        # Saves are indexed right away while the queue is behind
+        other = Note.objects.create(title='Urgent', owner=self.user, note_content=[])
+        self.assertFalse(NoteIndexJob.objects.filter(note_id=other.pk).exists())
+        self.assertEqual(list(Note.objects.search('urgent', user=self.user)), [other])
+
+
+@override_settings(NOTES_CONFIG={"SEARCH_CACHE_MAX_IDS": 10})
+class SearchResultCacheTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = SearchResultCache()
+
+    def test_entries_of_other_versions_are_misses(self):
+        self.cache.set('key', CachedSearch(1, [3, 2, 1]))
+        self.assertEqual(list(self.cache.get('key', 1).ids), [3, 2, 1])
+        self.assertIsNone(self.cache.get('key', 2))
+        # The stale entry was dropped
+        self.assertEqual(self.cache.as_dict()['entries'], 0)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_least_recently_used_entries_are_evicted_by_size(self):
+        self.cache.set('first', CachedSearch(1, range(4)))
+        self.cache.set('second', CachedSearch(1, range(3)))
+        self.assertIsNotNone(self.cache.get('first', 1))
+
+        self.cache.set('third', CachedSearch(1, range(2)))
+        self.assertIsNone(self.cache.get('second', 1))
+        self.assertIsNotNone(self.cache.get('first', 1))
+        self.assertIsNotNone(self.cache.get('third', 1))
+        self.assertEqual((self.cache.size, self.cache.evictions), (8, 1))
+
+        # Larger than the whole cache
+        self.cache.set('fourth', CachedSearch(1, range(10)))
+        self.assertIsNone(self.cache.get('fourth', 1))
+        self.assertEqual(self.cache.size, 8)
+
+
+@override_settings(NOTES_CONFIG={"INDEX_IN_BACKGROUND": False})
+class NoteSearchCacheViewTestCase(TestCase):
+
+    def setUp(self):
+        search_cache.reset()
+        self.addCleanup(search_cache.reset)
+        self.user = create_user('cacher')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.notes = [
+                Note.objects.create(title=f'Recipe {number}', owner=self.user, note_content=[]) for number in range(3)
+            ]
+
+    def find(self, query: str = 'recipe'):
+        response = self.client.get(reverse('note-find'), {'q': query, 'fuzzy': 'false'})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assertCacheStatus(self, status: str, count: int):
+        response = self.find()
+        self.assertEqual(response['X-Search-Cache'], status)
+        self.assertEqual(len(response.data['results']), count)
+
+    def test_searches_are_cached_until_the_notes_change(self):
+        self.assertCacheStatus('miss', 3)
+        self.assertCacheStatus('hit', 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Note.objects.create(title='Recipe 3', owner=self.user, note_content=[])
+        self.assertCacheStatus('miss', 4)
+        self.assertCacheStatus('hit', 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.notes[0].delete()
+        self.assertCacheStatus('miss', 3)
+
+    def test_searches_of_other_users_are_kept(self):
+        self.assertCacheStatus('miss', 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            Note.objects.create(title='Recipe', owner=create_user('other'), note_content=[])
+        self.assertCacheStatus('hit', 3)
+
+    @override_settings(NOTES_CONFIG={"INDEX_IN_BACKGROUND": False, "SEARCH_CACHE_MAX_RESULTS": 2})
+    def test_large_results_are_not_cached(self):
+        self.assertCacheStatus('miss', 3)
+        self.assertCacheStatus('miss', 3)
+        self.assertEqual(search_cache.as_dict()['entries'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.notes[0].delete()
+        self.assertCacheStatus('miss', 2)
+        self.assertCacheStatus('hit', 2)
+
+
+@override_settings(NOTES_CONFIG={"INDEX_IN_BACKGROUND": False})
+class NoteSlugTestCase(TestCase):
+
+    def setUp(self):
+        self.user = create_user('slugger')
+
+    def create_notes(self, *titles, owner=None) -> list:
+        return [Note.objects.create(title=title, owner=owner or self.user, note_content=[]).slug for title in titles]
+
+    def test_notes_with_the_same_title_are_numbered(self):
+        self.assertEqual(self.create_notes('Groceries', 'Groceries', 'groceries!'), ['groceries', 'groceries-1', 'groceries-2'])
+        self.assertEqual(self.create_notes('', None), ['note', 'note-1'])
+
+    def test_slugs_taken_by_other_titles_are_skipped(self):
+        self.assertEqual(self.create_notes('Groceries', 'Groceries 1', 'Groceries'), ['groceries', 'groceries-1', 'groceries-2'])
+        self.assertEqual(self.create_notes('Groceries 1'), ['groceries-1-1'])
+
+    def test_slugs_are_allocated_without_upserts(self):
+        with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False):
+            self.assertEqual(self.create_notes('Groceries', 'Groceries 1', 'Groceries'), ['groceries', 'groceries-1', 'groceries-2'])
+        self.assertEqual(NoteSlugCounter.objects.get(owner=self.user, base='groceries').last_number, 3)
+
+    def test_slugs_are_allocated_in_bulk(self):
+        self.create_notes('Groceries')
+        notes = Note.objects.allocate_slugs([
+            Note(title='Groceries', owner=self.user), Note(title='Todo', owner=self.user), Note(title='Groceries', owner=self.user),
+            Note(title='Groceries', slug='kept', owner=self.user), Note(title='Groceries'),
+        ])
+        self.assertEqual([note.slug for note in notes], ['groceries-1', 'todo', 'groceries-2', 'kept', 'groceries'])
+        Note.objects.bulk_create(notes)
+        self.assertEqual(self.create_notes('Groceries', 'Todo'), ['groceries-3', 'todo-1'])
+
+    def test_slugs_are_unique_per_owner(self):
+        other = create_user('other')
+        self.create_notes('Shared')
+        self.create_notes('Shared', owner=other)
+        Note.objects.filter(owner=self.user).update(note_content=[{"type": "text", "body": "Mine"}])
+        Note.objects.filter(owner=other).update(note_content=[{"type": "text", "body": "Theirs"}])
+
+        client = APIClient()
+        for user, body in ((self.user, "Mine"), (other, "Theirs")):
+            with self.subTest(user=user.username):
+                client.force_authenticate(user)
+                response = client.get(reverse('note-detail', kwargs={'slug': 'shared'}))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['content'], [{"type": "text", "body": body}])
+
+    def test_migration_parses_slugs_as_notes_do(self):
+        migration = importlib.import_module('notes.migrations.0015_note_slug_counters')
+        for slug in ('groceries', 'groceries-1', 'groceries_12', 'groceries-1-1', '2026', 'note-', '-3'):
+            with self.subTest(slug=slug):
+                self.assertEqual(migration.parse_numbered_slug(slug), parse_numbered_slug(slug))
+
+
+@override_settings(NOTES_CONFIG={"INDEX_IN_BACKGROUND": False})
+class NoteSummaryViewTestCase(TestCase):
+
+    def setUp(self):
+        self.user = create_user('summarizer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.content = [
+            {"type": "text", "body": "Bring   a\ncoat " + "and more " * 30},
+            build_list("Packing", "Socks", "Hat"),
+        ]
+        Note.objects.create(title='Trip', owner=self.user, note_content=self.content)
+
+    def test_summaries_leave_the_content_out(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('note-list-create'), {'view': 'summary'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(queries.captured_queries)
+        for query in queries.captured_queries:
+            self.assertNotIn('note_content', query['sql'])
+
+        summary = response.data['results'][0]
+        self.assertNotIn('content', summary)
+        self.assertTrue(summary['preview'].startswith('Bring a coat and more'))
+        self.assertLessEqual(len(summary['preview']), 200)
+        self.assertEqual(summary['details'], NoteContent(self.content).details)
+
+        response = self.client.get(reverse('note-list-create'), {'view': 'FULL'})
+        self.assertIn('content', response.data['results'][0])
+
+    def test_invalid_view_is_rejected(self):
+        response = self.client.get(reverse('note-list-create'), {'view': 'compact'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_migration_computes_previews_as_notes_do(self):
+        migration = importlib.import_module('notes.migrations.0017_note_preview')
+        for content in (self.content, [], [{"type": "list_item", "body": {"item_value": "Alone"}}, {"type": "drawing", "body": {"strokes": []}}]):
+            with self.subTest(content=content):
+                self.assertEqual(migration.get_preview(content), NoteContent(content).get_preview())
+
+
+@override_settings(NOTES_CONFIG={"INDEX_IN_BACKGROUND": False})
+class CompiledRepresentationTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = create_user('compiler')
+        Note.objects.create(title='Packing list', owner=owner, starred=True, note_content=[
+            {"type": "text", "body": "Pack light for the trip"}, build_list("Clothes", "Socks", "Coat", checked=True),
+        ])
+        Note.objects.create(title='Ownerless packing', note_content=[{"type": "text", "body": "Nobody packs"}])
+        cls.owner_pk = owner.pk
+
+    def get_contexts(self) -> dict:
+        request = Request(APIRequestFactory().get('/api/notes/'))
+        search = {'search_query': 'packing', 'search_backend': IndexSearchBackend(), 'search_threshold': None}
+        return {
+            'plain': {'request': request},
+            'raw content': {'request': request, 'raw_content': True},
+            'search': {'request': request, **search},
+            'fuzzy search': {'request': request, **search, 'search_query': 'pakcing', 'search_threshold': 0.3},
+            'sparse': {'request': request, 'sparse_fields': (['title', 'slug', 'url', 'owner_username'], [])},
+            'excluded': {'request': request, 'sparse_fields': (None, ['owner_username', 'edit_url'])},
+        }
+
+    def serialize(self, serializer_class, context: dict, compiled: bool) -> bytes:
+        # Notes are read again for each serializer, as serializing them materializes their content.
+        # The data is rendered, as raw content is only written out by the renderer
+        notes = Note.objects.select_related('owner').order_by('pk')
+        if 'search_query' in context:
+            notes = notes.annotate(search_snippet=models.Value(None, output_field=models.TextField()))
+        data = []
+        for note in notes:
+            serializer = serializer_class(note, context=context)
+            serializer.compiled_representation = compiled
+            data.append(serializer.data)
+        return RawJSONRenderer().render(data)
+
+    def test_compiled_output_matches_serializer_output(self):
+        for serializer_class in (NoteSerializer, StrippedNoteSerializer, NoteSummarySerializer):
+            for name, context in self.get_contexts().items():
+                with self.subTest(serializer=serializer_class.__name__, context=name):
+                    compiled = self.serialize(serializer_class, context, compiled=True)
+                    self.assertEqual(compiled, self.serialize(serializer_class, context, compiled=False))
+                    self.assertEqual(len(json.loads(compiled)), 2)
+
+
+@override_settings(NOTES_CONFIG={"INDEX_IN_BACKGROUND": False})
+class KeysetPaginationTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('pager')
+        Note.objects.create(title='Not mine', owner=create_user('other'), note_content=[])
+        dates = [start_of(2024, 1, 1), start_of(2024, 1, 2), start_of(2024, 1, 2), start_of(2024, 1, 3)]
+        titles = [None, 'Beta', None, 'Alpha', 'Gamma', 'Alpha', None]
+        for index, title in enumerate(titles * 2):
+            items = [build_list("List", *["item"] * (index % 3))] if index % 3 else []
+            note = Note.objects.create(title=title, owner=cls.user, note_content=items)
+            # Every date is shared by several notes, among them notes without a title and notes with the same one
+            Note.objects.filter(pk=note.pk).update(date_created=dates[index % len(dates)])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_expected(self, *ordering: str) -> list:
+        notes = Note.objects.filter(owner=self.user).order_by(
+            *ordering, '-date_created', models.F('title').asc(nulls_first=True), 'id',
+        )
+        return list(notes.values_list('slug', flat=True))
+
+    def walk(self, url: str, link: str) -> list:
+        '''Returns the pages met following the `link` links from `url`'''
+        pages = []
+        while url is not None:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(set(response.data), {'next', 'previous', 'results'})
+            pages.append([note['slug'] for note in response.data['results']])
+            url = response.data[link]
+        return pages
+
+    def test_forward_and_backward_walks(self):
+        expected = self.get_expected()
+        self.assertEqual(len(expected), 14)
+
+        pages = self.walk(reverse('note-list-create') + '?limit=3&fields=slug', 'next')
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 3, 2])
+        self.assertEqual([slug for page in pages for slug in page], expected)
+
+        # Back from the last page, through the `previous` link of each page
+        response = self.client.get(reverse('note-list-create') + '?limit=3&fields=slug')
+        for _ in range(4):
+            response = self.client.get(response.data['next'])
+        self.assertIsNone(response.data['next'])
+        backward = self.walk(response.data['previous'], 'previous')
+        self.assertEqual([len(page) for page in backward], [3, 3, 3, 3])
+        self.assertEqual([slug for page in reversed(backward) for slug in page], expected[:-2])
+
+    def test_walks_follow_the_ordering(self):
+        for ordering in ('list_items_count', '-list_items_count'):
+            with self.subTest(ordering=ordering):
+                expected = self.get_expected(ordering)
+                url = reverse('note-list-create') + f'?limit=4&ordering={ordering}&fields=slug'
+                pages = self.walk(url, 'next')
+                self.assertEqual([slug for page in pages for slug in page], expected)
+
+                response = self.client.get(self.client.get(url).data['next'])
+                self.assertEqual(self.walk(response.data['previous'], 'previous'), [expected[:4]])
+
+    def test_offset_is_ignored(self):
+        response = self.client.get(reverse('note-list-create') + '?limit=3&offset=6&fields=slug')
+        self.assertEqual([note['slug'] for note in response.data['results']], self.get_expected()[:3])
+        self.assertIsNone(response.data['previous'])
+
+    def test_invalid_cursors(self):
+        wrong_length = base64.urlsafe_b64encode(json.dumps({'p': ['2024-01-01T00:00:00+00:00']}).encode()).decode()
+        wrong_value = base64.urlsafe_b64encode(json.dumps({'p': ['yesterday', None, 1]}).encode()).decode()
+        for cursor in ('not-a-cursor', '!!!', wrong_length, wrong_value, 'e30='):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('note-list-create'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+
+@override_settings(NOTES_CONFIG={"INDEX_IN_BACKGROUND": False})
+class SparseNoteFieldsTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('sparse')
+        Note.objects.create(title='Garden', owner=cls.user, note_content=[
+            {"type": "text", "body": "Plant the tomatoes before the rain"},
+        ])
+
+    def setUp(self):
+        search_cache.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_note_selects(self, url: str, params: dict) -> tuple:
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        selects = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and 'FROM "notes_note"' in query['sql']
+        ]
+        self.assertTrue(selects)
+        return response, selects
+
+    def test_fields_leave_the_content_out_of_the_query(self):
+        for url in (reverse('note-list-create'), reverse('note-detail', kwargs={'slug': 'garden'})):
+            with self.subTest(url=url):
+                response, selects = self.get_note_selects(url, {'fields': 'title,slug'})
+                self.assertFalse([sql for sql in selects if '"note_content"' in sql])
+                self.assertIn('"title"', selects[-1])
+
+                response, selects = self.get_note_selects(url, {'fields': 'title,content'})
+                self.assertIn('"note_content"', selects[-1])
+
+    def test_search_keeps_the_content_for_snippets(self):
+        response, selects = self.get_note_selects(reverse('note-find'), {'q': 'tomatoes', 'exclude': 'content'})
+        self.assertIn('"note_content"', selects[-1])
+        note = response.json()['results'][0]
+        self.assertNotIn('content', note)
+        self.assertIn('tomatoes', note['snippet'])
+
+        search_cache.reset()
+        response, selects = self.get_note_selects(reverse('note-find'), {'q': 'tomatoes', 'fields': 'title,slug'})
+        self.assertFalse([sql for sql in selects if '"note_content"' in sql])
+        self.assertEqual(response.json()['results'], [{'title': 'Garden', 'slug': 'garden'}])
+
+
+@override_settings(NOTES_CONFIG={"INDEX_IN_BACKGROUND": False})
+class ConditionalGetTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='poller', firstname='Poller', lastname='Tester', email='poller@example.com', password='a-long-password',
+        )
+        # Class data is deep copied for each test, and notes cannot be: `NoteContent` defines `__dict__` as a method.
+        # The note's pk is kept instead.
+        cls.note_pk = Note.objects.create(title='Polled', owner=cls.user, note_content=[{"type": "text", "body": "Polled note"}]).pk
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_note_not_modified(self):
+        note = Note.objects.get(pk=self.note_pk)
+        url = reverse('note-detail', kwargs={'slug': note.slug})
+        response = self.client.get(url)
+        self.assertIn('Last-Modified', response)
+
+        # Only the last edit time of the note is read
+        with self.assertNumQueries(1):
+            response = self.client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            note.starred = True
+            note.save()
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_note_list_not_modified_until_notes_change(self):
+        url = reverse('note-list-create')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(url, {'view': 'summary'}, headers={'If-None-Match': etag}).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Note.objects.create(title='Another', owner=self.user, note_content=[])
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
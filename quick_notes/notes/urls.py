@@ -5,8 +5,12 @@ from . import views
 urlpatterns = [
     path('', views.NoteListCreateAPIView.as_view(), name='note-list-create'),
     path('find/', views.NoteSearchAPIView.as_view(), name='note-find'),
+    path('find/cache/', views.NoteSearchCacheAPIView.as_view(), name='note-find-cache'),
     path('starred/', views.StarredNoteListAPIView.as_view(), name='starred-note-list'),
     path('<str:slug>/', views.NoteDetailAPIView.as_view(), name='note-detail'),
     path('<str:slug>/edit/', views.NoteUpdateAPIView.as_view(), name="note-update"),
+    path('<str:slug>/patch/', views.NoteContentPatchAPIView.as_view(), name="note-patch"),
+    path('<str:slug>/revisions/', views.NoteRevisionListAPIView.as_view(), name="note-revision-list"),
+    path('<str:slug>/revisions/<int:number>/', views.NoteRevisionDetailAPIView.as_view(), name="note-revision-detail"),
     path('<str:slug>/delete/', views.NoteDestroyAPIView.as_view(), name='note-delete'),
 ]
@@ -1,44 +1,257 @@
-from rest_framework import generics
+import calendar
+import datetime
+import hashlib
+from typing import Optional, Tuple
 
-from .models import Note
-from .serializers import NoteSerializer, StrippedNoteSerializer
-from api.mixins import SlugLookupMixin, UserQuerySetMixin, AllowOwnerOnlyMixin
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework import generics, exceptions, parsers, renderers, views
+from rest_framework.response import Response
+
+from .cache import CachedSearch, CachedSearchResults, search_cache
+from .conf import get_setting
+from .models import Note, NoteRevision, NoteCollectionVersion
+from .parsers import NoteJSONParser
+from .query import QueryError, parse_note_query
+from .renderers import RawJSONRenderer
+from .search import get_search_backend
+from .serializers import (
+    NoteSerializer, StrippedNoteSerializer, NoteSummarySerializer, NoteContentPatchSerializer, NoteRevisionSerializer,
+    NoteRevisionDetailSerializer,
+)
+from api.mixins import SlugLookupMixin, UserQuerySetMixin, AllowOwnerOnlyMixin, FuzzySearchMixin, SparseFieldsMixin
+from api.pagination import KeysetPagination
+from api.permissions import IsAdministratorOrSuperuser
 
 global_queryset = Note.objects.all()
 
 
-class NoteListCreateAPIView(UserQuerySetMixin, SlugLookupMixin, generics.ListCreateAPIView):
+class ContentStatsFilterMixin():
+    '''
+    Filters and orders notes by their stored content statistics.
+
+    - `?has=` takes a comma separated list of `texts`, `lists` and `list_items`.
+    - `?ordering=` takes a content statistics field, prefixed with `-` for descending order.
+    '''
+    has_lookups = {
+        'texts': 'texts_count__gt',
+        'lists': 'lists_count__gt',
+        'list_items': 'list_items_count__gt',
+    }
+
+    def get_queryset(self, *args, **kwargs):
+        qs = super().get_queryset(*args, **kwargs)
+        has = self.request.GET.get('has', None)
+        ordering = self.request.GET.get('ordering', None)
+
+        if has:
+            for name in has.split(','):
+                lookup = self.has_lookups.get(name.strip(), None)
+                if not lookup:
+                    raise exceptions.ValidationError(f"Invalid `has` value: {name}")
+                qs = qs.filter(**{lookup: 0})
+
+        if ordering:
+            if ordering.removeprefix('-') not in Note.content_stats_fields:
+                raise exceptions.ValidationError(f"Invalid `ordering` value: {ordering}")
+            qs = qs.order_by(ordering, *Note._meta.ordering)
+        return qs
+
+
+class RawContentMixin():
+    '''
+    Writes the stored JSON of notes' content into responses as is, instead of decoding and re-encoding it.
+
+    Set `raw_content = False` on a view to serialize the content the usual way.
+    '''
+    raw_content = True
+    renderer_classes = [RawJSONRenderer, renderers.BrowsableAPIRenderer]
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        # The browsable API renders its content with the first renderer, `RawJSONRenderer`
+        accepted_renderer = getattr(self.request, 'accepted_renderer', None)
+        context['raw_content'] = self.raw_content and isinstance(accepted_renderer, (RawJSONRenderer, renderers.BrowsableAPIRenderer))
+        return context
+
+
+class SummaryViewMixin():
+    '''
+    Lists notes in full or as summaries.
+
+    `?view=summary` serializes notes with `NoteSummarySerializer`, a preview and the statistics of their content
+    instead of the content, which is then left out of the query. `?view=full`, the default, serializes them as usual.
+    Owners are read along with the notes either way.
+    '''
+    view_choices = ('full', 'summary')
+    summary_serializer_class = NoteSummarySerializer
+    # Whether summaries leave the content out of the query
+    summary_defers_content = True
+
+    @property
+    def is_summary(self) -> bool:
+        if self.request.method != 'GET':
+            return False
+        view = self.request.GET.get('view', 'full').lower()
+        if view not in self.view_choices:
+            raise exceptions.ValidationError(f"Invalid `view` value: {view}")
+        return view == 'summary'
+
+    def get_serializer_class(self):
+        if self.is_summary:
+            return self.summary_serializer_class
+        return super().get_serializer_class()
+
+    def get_queryset(self, *args, **kwargs):
+        qs = super().get_queryset(*args, **kwargs).select_related('owner')
+        if self.summary_defers_content and self.is_summary:
+            qs = qs.defer('note_content')
+        return qs
+
+
+class SparseNoteFieldsMixin(SparseFieldsMixin):
+    '''
+    Trims notes to the fields requested by `?fields=` and `?exclude=`, see `api.mixins.SparseFieldsMixin`.
+
+    Notes are read without their content when no field serialized from it is requested.
+    '''
+    # Fields serialized from the content of notes
+    content_fields = ('content',)
+
+    def get_queryset(self, *args, **kwargs):
+        qs = super().get_queryset(*args, **kwargs)
+        if self.request.method == 'GET' and not any(self.is_field_requested(name) for name in self.content_fields):
+            qs = qs.defer('note_content')
+        return qs
+
+
+class ConditionalGetMixin():
+    '''
+    Answers conditional GET requests with a 304 when the client's copy is current, before reading anything else.
+
+    `get_validators` returns the version of the data a response is built from and the time it was last modified,
+    either of which may be None. The strong ETag of a response hashes the version with the request user,
+    the URL and the accepted media type, which make up the rest of the response.
+    '''
+
+    def get_validators(self) -> Tuple[Optional[str], Optional[datetime.datetime]]:
+        raise NotImplementedError
+
+    def get_etag(self, version: str) -> str:
+        request = self.request
+        key = '\n'.join((version, request.user.get_username(), request.build_absolute_uri(), request.accepted_media_type or ''))
+        return '"%s"' % hashlib.sha256(key.encode()).hexdigest()[:32]
+
+    def get(self, request, *args, **kwargs):
+        version, last_modified = self.get_validators()
+        etag = self.get_etag(version) if version is not None else None
+        # In seconds, as compared with `If-Modified-Since`
+        timestamp = calendar.timegm(last_modified.utctimetuple()) if last_modified is not None else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            if etag is not None:
+                response.headers.setdefault('ETag', etag)
+            if timestamp is not None:
+                response.headers.setdefault('Last-Modified', http_date(timestamp))
+            # Revalidated on every request rather than reused for a while from `Last-Modified`
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class NoteCollectionConditionalMixin(ConditionalGetMixin):
+    '''Validates lists of the request user's notes by the version of their notes, see `NoteCollectionVersion`'''
+
+    def get_validators(self):
+        return f'notes:{NoteCollectionVersion.objects.get_version(self.request.user.pk)}', None
+
+
+class NoteConditionalMixin(ConditionalGetMixin):
+    '''Validates a note by the time it was last edited, read without the rest of the note'''
+
+    def get_validators(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        qs = self.filter_queryset(self.get_queryset()).filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        note = qs.values_list('pk', 'last_edited').first()
+        if note is None:
+            return None, None
+        pk, last_edited = note
+        return f'note:{pk}:{last_edited.isoformat()}', last_edited
+
+
+class NoteListCreateAPIView(NoteCollectionConditionalMixin, SparseNoteFieldsMixin, RawContentMixin, SummaryViewMixin, ContentStatsFilterMixin, UserQuerySetMixin, SlugLookupMixin, generics.ListCreateAPIView):
     queryset = global_queryset
     serializer_class = StrippedNoteSerializer
+    pagination_class = KeysetPagination
+    parser_classes = [NoteJSONParser, parsers.FormParser, parsers.MultiPartParser]
 
 
-class StarredNoteListAPIView(UserQuerySetMixin, SlugLookupMixin, generics.ListAPIView):
+class StarredNoteListAPIView(NoteCollectionConditionalMixin, SparseNoteFieldsMixin, RawContentMixin, SummaryViewMixin, ContentStatsFilterMixin, UserQuerySetMixin, SlugLookupMixin, generics.ListAPIView):
     queryset = global_queryset
     serializer_class = StrippedNoteSerializer
+    pagination_class = KeysetPagination
 
     def get_queryset(self, *args, **kwargs):
         qs = super().get_queryset(*args, **kwargs)
         return qs.filter(starred=True)
 
 
-class NoteDetailAPIView(AllowOwnerOnlyMixin, SlugLookupMixin, generics.RetrieveAPIView):
+class NoteDetailAPIView(NoteConditionalMixin, SparseNoteFieldsMixin, RawContentMixin, AllowOwnerOnlyMixin, UserQuerySetMixin, SlugLookupMixin, generics.RetrieveAPIView):
     queryset = global_queryset
     serializer_class = NoteSerializer
 
 
-class NoteUpdateAPIView(AllowOwnerOnlyMixin, SlugLookupMixin, generics.UpdateAPIView):
+class NoteUpdateAPIView(SparseNoteFieldsMixin, AllowOwnerOnlyMixin, UserQuerySetMixin, SlugLookupMixin, generics.UpdateAPIView):
     queryset = global_queryset
     serializer_class = NoteSerializer
+    parser_classes = [NoteJSONParser, parsers.FormParser, parsers.MultiPartParser]
+
+
+class NoteContentPatchAPIView(SparseNoteFieldsMixin, AllowOwnerOnlyMixin, UserQuerySetMixin, SlugLookupMixin, generics.UpdateAPIView):
+    queryset = global_queryset
+    serializer_class = NoteContentPatchSerializer
+    http_method_names = ['patch']
 
+    def patch(self, request, *args, **kwargs):
+        # Operations are always required, so the update is not a partial one
+        return self.update(request, *args, **kwargs)
 
-class NoteDestroyAPIView(AllowOwnerOnlyMixin, SlugLookupMixin, generics.DestroyAPIView):
+
+class NoteDestroyAPIView(AllowOwnerOnlyMixin, UserQuerySetMixin, SlugLookupMixin, generics.DestroyAPIView):
     queryset = global_queryset
     serializer_class = NoteSerializer
 
 
-class NoteSearchAPIView(UserQuerySetMixin, SlugLookupMixin, generics.ListAPIView):
+class NoteSearchAPIView(SparseNoteFieldsMixin, FuzzySearchMixin, RawContentMixin, SummaryViewMixin, UserQuerySetMixin, SlugLookupMixin, generics.ListAPIView):
+    '''
+    Searches the request user's notes.
+
+    `?q=` takes free text, quoted phrases and filters, see `notes.query.NoteQuery`.
+    Notes are ranked by the text and phrases, or kept in their usual order when there are only filters.
+
+    The ids of the results are cached in `notes.cache.search_cache` until the user's notes change, so paging
+    through them only fetches the notes of each page. The `X-Search-Cache` header tells whether a search was cached.
+    '''
     queryset = global_queryset
     serializer_class = StrippedNoteSerializer
+    # Snippets of notes not found by the FTS5 backend's query are built from their content
+    summary_defers_content = False
+    content_fields = ('content', 'snippet')
+    search_text = ''
+    search_cache_status = None
+
+    def get_search_cache_key(self, query: str) -> tuple:
+        '''Key of the search in the cache, for the request user, the normalized `query` and the search parameters'''
+        return (
+            self.request.user.pk,
+            get_setting("SEARCH_BACKEND"),
+            ' '.join(query.casefold().split()),
+            self.request.GET.get('fuzzy', 'auto').lower(),
+            self.request.GET.get('threshold', None),
+        )
 
     def get_queryset(self):
         query = self.request.GET.get('q')
@@ -46,6 +259,99 @@ class NoteSearchAPIView(UserQuerySetMixin, SlugLookupMixin, generics.ListAPIView
         if not query:
             return Note.objects.none()
 
-        qs = super().get_queryset().search(query)
-        return qs
+        try:
+            parsed_query = parse_note_query(query)
+        except QueryError as error:
+            raise exceptions.ValidationError(str(error))
+        self.search_text = parsed_query.text
+        if not self.search_text and not parsed_query.filters:
+            return Note.objects.none()
+
+        if not get_setting("SEARCH_CACHE_MAX_IDS"):
+            return self.search_notes(parsed_query)
+
+        key = self.get_search_cache_key(query)
+        # Read before searching, so that results of notes changed during the search are cached as already stale
+        version = NoteCollectionVersion.objects.get_version(self.request.user.pk)
+        cached = search_cache.get(key, version)
+        if cached is not None:
+            self.search_cache_status = 'hit'
+            self.fuzzy_threshold = cached.fuzzy_threshold
+            return CachedSearchResults(cached.ids, super().get_queryset())
+
+        self.search_cache_status = 'miss'
+        qs = self.search_notes(parsed_query)
+        max_results = get_setting("SEARCH_CACHE_MAX_RESULTS")
+        ids = list(qs.values_list('pk', flat=True)[:max_results + 1])
+        if len(ids) > max_results:
+            return qs
+
+        cached = CachedSearch(version, ids, self.fuzzy_threshold)
+        search_cache.set(key, cached)
+        return CachedSearchResults(cached.ids, super().get_queryset())
+
+    def search_notes(self, parsed_query):
+        qs = parsed_query.apply(super().get_queryset(), user=self.request.user)
+        if not self.search_text:
+            return qs
+        return self.search(qs, self.search_text, user=self.request.user)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.search_cache_status is not None:
+            response['X-Search-Cache'] = self.search_cache_status
+        return response
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context.update({
+            'search_query': self.search_text,
+            'search_threshold': self.fuzzy_threshold,
+            'search_backend': get_search_backend(),
+        })
+        return context
+
+
+class NoteSearchCacheAPIView(views.APIView):
+    '''
+    Counters and size of the note search result cache.
+
+    `search_cache` is held in the memory of each server process, so the response describes the cache
+    of the process that answered it. Every process fills its own cache, up to `SEARCH_CACHE_MAX_IDS`.
+    '''
+    permission_classes = [IsAdministratorOrSuperuser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(search_cache.as_dict())
+
+
+class NoteRevisionMixin():
+    '''Scopes revisions to the note, owned by the request user, that is named by the `slug` URL parameter'''
+
+    def get_note(self):
+        if not hasattr(self, '_note'):
+            notes = Note.objects.filter(owner=self.request.user).only('pk', 'slug', 'owner')
+            self._note = get_object_or_404(notes, slug=self.kwargs['slug'])
+        return self._note
+
+
+class NoteRevisionListAPIView(SparseFieldsMixin, NoteRevisionMixin, generics.ListAPIView):
+    serializer_class = NoteRevisionSerializer
+
+    def get_queryset(self):
+        fields = ('number', 'title', 'is_snapshot', 'date_created', 'note__slug')
+        return NoteRevision.objects.filter(note=self.get_note()).select_related('note').only(*fields)
+
+
+class NoteRevisionDetailAPIView(SparseFieldsMixin, NoteRevisionMixin, generics.RetrieveAPIView):
+    serializer_class = NoteRevisionDetailSerializer
+
+    def get_object(self):
+        note = self.get_note()
+        try:
+            revision = NoteRevision.objects.get_with_content(note, self.kwargs['number'])
+        except NoteRevision.DoesNotExist:
+            raise exceptions.NotFound("Revision not found")
+        revision.note = note
+        return revision
 
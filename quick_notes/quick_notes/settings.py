@@ -151,6 +151,27 @@ GPM_CONFIG = {
     
 }
 
+NOTES_CONFIG = {
+    "REVISION_SNAPSHOT_INTERVAL": 20,
+    "CONTENT_MAX_BYTES": 5 * 1024 * 1024,
+    "CONTENT_MAX_ITEMS": 10000,
+    "CONTENT_MAX_DEPTH": 8,
+    # "notes.search.IndexSearchBackend" searches through the ORM, on any database
+    "SEARCH_BACKEND": "notes.search.FTS5SearchBackend",
+    "FUZZY_MAX_EXPANSIONS": 50,
+    # Set to True to index saved notes with `python manage.py run_index_worker` instead of while they are saved
+    "INDEX_IN_BACKGROUND": False,
+    "INDEX_QUEUE_MAX_LAG": 300,
+    "INDEX_JOB_MAX_ATTEMPTS": 5,
+    "INDEX_JOB_LEASE": 60,
+    # Set "SEARCH_CACHE_MAX_IDS" to 0 to disable the search result cache
+    "SEARCH_CACHE_MAX_IDS": 1_000_000,
+    "SEARCH_CACHE_MAX_RESULTS": 10_000,
+}
+
+# Lowest trigram similarity, from 0 to 1, of the words matched by fuzzy searches
+TRIGRAM_SIMILARITY_THRESHOLD = 0.3
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "rest_framework.authentication.SessionAuthentication",
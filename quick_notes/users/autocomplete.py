@@ -0,0 +1,47 @@
+import unicodedata
+from typing import Dict, Iterable
+
+
+MAX_KEY_LENGTH = 200
+# Highest code point, which sorts after any character that may follow a prefix
+MAX_CHARACTER = '\U0010ffff'
+
+
+def normalize_name(text: str) -> str:
+    '''Lowercases `text`, strips its accents and collapses its whitespace, so that "  José" and "jose" match'''
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(character for character in decomposed if not unicodedata.combining(character))
+    return ' '.join(stripped.casefold().split())
+
+
+def get_prefix_range(prefix: str) -> tuple:
+    '''Returns the bounds of the keys starting with `prefix`, the lower one inclusive and the upper one exclusive'''
+    return prefix, prefix + MAX_CHARACTER
+
+
+def get_name_keys(names: Iterable[str]) -> Dict[str, int]:
+    '''
+    Returns the keys a user is suggested by, with their rank, lower being better.
+
+    `names` are the user's names, most important first. Each name is a key, as are its words after the first,
+    so that "Mary Ann" is suggested for "mary" and "ann". A name ranks before the later words of any name,
+    and ranks by its place in `names`, so ranks are lower than twice the number of names.
+    A key is kept at its best rank.
+    '''
+    names = list(names)
+    keys = {}
+
+    def add(key: str, rank: int):
+        key = key[:MAX_KEY_LENGTH]
+        keys[key] = min(rank, keys.get(key, rank))
+
+    for position, name in enumerate(names):
+        name = normalize_name(name or '')
+        if not name:
+            continue
+        add(name, position)
+
+        words = name.split(' ')
+        for index in range(1, len(words)):
+            add(' '.join(words[index:]), len(names) + position)
+    return keys
@@ -0,0 +1,108 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from users.autocomplete import get_name_keys
+from users.models import UserNameKey
+
+
+def build_name(rng: random.Random) -> str:
+    '''Builds a made up, capitalized name'''
+    syllables = [consonant + vowel for consonant in 'bdfgklmnprstvz' for vowel in 'aeiou']
+    return ''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))).capitalize()
+
+
+def percentile(timings: list, fraction: float) -> float:
+    return sorted(timings)[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+class Command(BaseCommand):
+    help = "Runs benchmarks of the users app and prints their timings"
+    scenarios = ['autocomplete']
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f"Benchmarks to run, out of {', '.join(self.scenarios)}. Runs all by default")
+        parser.add_argument('--users', type=int, default=1_000_000, help="Number of users searched")
+        parser.add_argument('--queries', type=int, default=500, help="Number of timed queries per step")
+
+    def handle(self, *args, **options):
+        self.users_count = options['users']
+        self.queries = options['queries']
+        scenarios = options['scenarios'] or self.scenarios
+        for scenario in scenarios:
+            if scenario not in self.scenarios:
+                raise CommandError(f"Unknown benchmark: {scenario}")
+
+        for scenario in scenarios:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"Benchmark: {scenario}"))
+            getattr(self, f'benchmark_{scenario}')()
+
+    def time_queries(self, func, prefixes: list) -> list:
+        '''Returns the time, in milliseconds, of `func` for each of `prefixes`'''
+        timings = []
+        for prefix in prefixes:
+            start = time.perf_counter()
+            func(prefix)
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def benchmark_autocomplete(self):
+        '''
+        Latency of account autocompletion through the prefix index against the `icontains` search, as users grow to `--users`.
+
+        The users are created in a transaction that is rolled back at the end.
+        '''
+        self.stdout.write(
+            f"{'users':>9} {'index rows':>11} {'suggest p50':>12} {'suggest p99':>12} {'icontains p50':>14} {'icontains p99':>14}"
+        )
+        User = get_user_model()
+        rng = random.Random(0)
+        steps = [count for count in (10_000, 100_000) if count < self.users_count] + [self.users_count]
+        batch_size = 10_000
+
+        with transaction.atomic():
+            created = 0
+            for count in steps:
+                while created < count:
+                    users = []
+                    for index in range(created, min(count, created + batch_size)):
+                        firstname, lastname = build_name(rng), build_name(rng)
+                        users.append(User(
+                            username=f'{firstname.lower()}{index}', firstname=firstname, lastname=lastname,
+                            other_name='', email='', password='!',
+                        ))
+                    # Bulk creation skips `CustomUser.save`, so the users are indexed here
+                    users = User.objects.bulk_create(users)
+                    UserNameKey.objects.bulk_create([
+                        UserNameKey(user=user, key=key, rank=rank)
+                        for user in users
+                        for key, rank in get_name_keys(getattr(user, name) for name in User.search_name_fields).items()
+                    ], batch_size=batch_size)
+                    created += len(users)
+
+                # Prefixes as typed, one to four letters of existing names
+                names = list(User.objects.order_by('?').values_list('lastname', flat=True)[:self.queries])
+                prefixes = [name[:rng.randint(1, 4)] for name in names]
+
+                def suggest_users(prefix):
+                    return User.objects.autocomplete(prefix, 10)
+
+                def search_users(prefix):
+                    # The count and first page read by `accounts/find/`
+                    qs = User.objects.search(prefix)
+                    return qs.count(), list(qs[:10])
+
+                self.time_queries(suggest_users, prefixes[:20])
+                suggest = self.time_queries(suggest_users, prefixes)
+                # The search scans every user, so it is timed on fewer queries
+                search = self.time_queries(search_users, prefixes[:20])
+                self.stdout.write(
+                    f"{count:>9} {UserNameKey.objects.count():>11} {statistics.median(suggest):>12.3f} {percentile(suggest, 0.99):>12.3f} "
+                    f"{statistics.median(search):>14.3f} {percentile(search, 0.99):>14.3f}"
+                )
+
+            transaction.set_rollback(True)
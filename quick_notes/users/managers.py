@@ -1,5 +1,11 @@
+from collections import defaultdict
+from django.apps import apps
 from django.contrib.auth.models import BaseUserManager
 from django.db import models
+from django.db.models.functions import Coalesce
+
+from api.trigrams import find_similar, get_similarity_threshold, get_trigrams, split_words
+from .autocomplete import get_name_keys, get_prefix_range, normalize_name
 
 
 
@@ -64,6 +70,24 @@ class AbstractBaseUserManager(BaseUserManager):
     def search(self, query):
         return self.get_queryset().search(query=query)
 
+    def fuzzy_search(self, query, threshold: float = None):
+        return self.get_queryset().fuzzy_search(query=query, threshold=threshold)
+
+    def with_note_stats(self, *names):
+        return self.get_queryset().with_note_stats(*names)
+
+    def autocomplete(self, prefix: str, limit: int = 10) -> list:
+        '''
+        Returns up to `limit` users with a name starting with `prefix`, best first.
+
+        Users are ranked by the name that matched, in the order of `search_name_fields`, names matching ahead of
+        later words of names. Matches are looked up in the prefix index held by the `UserNameKey` model.
+        '''
+        UserNameKey = apps.get_model(self.model._meta.app_label, 'UserNameKey')
+        pks = UserNameKey.objects.db_manager(self.db).suggest(prefix, limit, ranks_count=2 * len(self.model.search_name_fields))
+        users = self.get_queryset().in_bulk(pks)
+        return [users[pk] for pk in pks if pk in users]
+
 
 class UserQuerySet(models.QuerySet):
     '''Custom `User` model custom queryset'''
@@ -71,4 +95,134 @@ class UserQuerySet(models.QuerySet):
     def search(self, query):
         lookup = models.Q(username__icontains=query) | models.Q(firstname__icontains=query) | models.Q(lastname__icontains=query) | models.Q(other_name__icontains=query)
         qs = self.filter(lookup)
-        return qs
\ No newline at end of file
+        return qs
+
+    def fuzzy_search(self, query, threshold: float = None):
+        '''
+        Returns the users whose names are similar to `query`, most similar first.
+
+        Each word of `query` is matched to the most similar word of a user's username, first name, last name
+        and other name, by trigram similarity. Words less similar than `threshold` do not match.
+        The threshold defaults to `settings.TRIGRAM_SIMILARITY_THRESHOLD`.
+        '''
+        threshold = get_similarity_threshold(threshold)
+        words = list(dict.fromkeys(split_words(query)))
+        if not words:
+            return self.none()
+
+        postings = apps.get_model(self.model._meta.app_label, 'UserTrigram').objects.all()
+        ranks = defaultdict(float)
+        for word in words:
+            best = {}
+            for match in find_similar(postings, word, threshold, ['user', 'word']):
+                best[match['user']] = max(best.get(match['user'], 0), match['similarity'])
+            for user_pk, word_similarity in best.items():
+                ranks[user_pk] += word_similarity / len(words)
+
+        if not ranks:
+            return self.none()
+        rank = models.Case(*[models.When(pk=pk, then=models.Value(value)) for pk, value in ranks.items()], output_field=models.FloatField())
+        return self.filter(pk__in=ranks).annotate(search_rank=rank).order_by('-search_rank', 'username')
+
+    def with_note_stats(self, *names):
+        '''
+        Annotates users with the statistics of their notes read by `UserSerializer`, or with the statistics in `names`.
+
+        - `notes_count` and `starred_notes_count`
+        - `last_created_note_slug` and `last_edited_note_slug`, None for users without notes
+
+        Each is a correlated subquery, so the users and their statistics are read in a single statement.
+        '''
+        Note = self.model._meta.get_field('notes').related_model
+        notes = Note.objects.filter(owner=models.OuterRef('pk')).order_by()
+
+        def count(qs):
+            counts = qs.values('owner').annotate(count=models.Count('pk')).values('count')
+            return Coalesce(models.Subquery(counts, output_field=models.IntegerField()), 0)
+
+        annotations = {
+            'notes_count': count(notes),
+            'starred_notes_count': count(notes.filter(starred=True)),
+            'last_created_note_slug': models.Subquery(notes.order_by('-date_created', '-pk').values('slug')[:1]),
+            'last_edited_note_slug': models.Subquery(notes.order_by('-last_edited', '-pk').values('slug')[:1]),
+        }
+        for name in names:
+            if name not in annotations:
+                raise ValueError(f"Unknown note statistic: {name}")
+        return self.annotate(**{name: annotations[name] for name in names or annotations})
+
+
+class UserTrigramManager(models.Manager):
+    '''UserTrigram model custom objects manager'''
+
+    def index(self, user):
+        '''Brings the trigram index entries of `user` up to date with the user's names'''
+        words = set()
+        for name in user.search_name_fields:
+            words.update(split_words(getattr(user, name, None) or ''))
+
+        existing = set(self.filter(user=user).order_by().values_list('word', flat=True).distinct())
+        stale = existing - words
+        if stale:
+            self.filter(user=user, word__in=stale).delete()
+
+        entries = []
+        for word in words - existing:
+            trigrams = get_trigrams(word)
+            entries.extend(self.model(user=user, word=word, trigram=trigram, trigrams_count=len(trigrams)) for trigram in trigrams)
+        if entries:
+            self.bulk_create(entries)
+
+
+class UserNameKeyManager(models.Manager):
+    '''UserNameKey model custom objects manager'''
+
+    def index(self, user):
+        '''Brings the prefix index entries of `user` up to date with the user's names'''
+        keys = get_name_keys(getattr(user, name, None) for name in user.search_name_fields)
+        existing = {entry.key: entry for entry in self.filter(user=user).only('pk', 'key', 'rank')}
+
+        new_entries = []
+        changed_entries = []
+        for key, rank in keys.items():
+            entry = existing.pop(key, None)
+            if entry is None:
+                new_entries.append(self.model(user=user, key=key, rank=rank))
+            elif entry.rank != rank:
+                entry.rank = rank
+                changed_entries.append(entry)
+
+        if existing:
+            self.filter(pk__in=[entry.pk for entry in existing.values()]).delete()
+        if changed_entries:
+            self.bulk_update(changed_entries, ['rank'])
+        if new_entries:
+            self.bulk_create(new_entries)
+
+    def suggest(self, prefix: str, limit: int, ranks_count: int) -> list:
+        '''
+        Returns the pks of up to `limit` users with a key starting with `prefix`, by rank and then key.
+
+        Keys are read rank by rank, as ranges of the (rank, key) index, so no more entries than needed are read.
+        '''
+        prefix = normalize_name(prefix)
+        if not prefix or limit < 1:
+            return []
+
+        lowest, highest = get_prefix_range(prefix)
+        found = {}
+        for rank in range(ranks_count):
+            entries = self.filter(rank=rank, key__gte=lowest, key__lt=highest).order_by('key', 'user_id').values_list('user_id', flat=True)
+            offset = 0
+            while len(found) < limit:
+                page = list(entries[offset:offset + limit])
+                for user_pk in page:
+                    found.setdefault(user_pk, None)
+                    if len(found) == limit:
+                        break
+                if len(page) < limit:
+                    break
+                offset += limit
+            if len(found) == limit:
+                break
+        return list(found)
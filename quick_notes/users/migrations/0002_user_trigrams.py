@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:02
+
+import api.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from api.trigrams import get_trigrams, split_words
+
+
+def index_users(apps, schema_editor):
+    '''Fills the trigram index of the names of existing users'''
+    User = apps.get_model('users', 'CustomUser')
+    UserTrigram = apps.get_model('users', 'UserTrigram')
+    names = User.objects.values_list('pk', 'username', 'firstname', 'lastname', 'other_name')
+
+    entries = []
+    for pk, *fields in names.iterator():
+        words = {word for field in fields for word in split_words(field or '')}
+        for word in words:
+            trigrams = get_trigrams(word)
+            entries.extend(UserTrigram(user_id=pk, word=word, trigram=trigram, trigrams_count=len(trigrams)) for trigram in trigrams)
+    UserTrigram.objects.bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='firstname',
+            field=models.CharField(max_length=200, null=True, validators=[api.validators.required_field], verbose_name='First name'),
+        ),
+        migrations.AlterField(
+            model_name='customuser',
+            name='lastname',
+            field=models.CharField(max_length=200, null=True, validators=[api.validators.required_field], verbose_name='Last name'),
+        ),
+        migrations.CreateModel(
+            name='UserTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('word', models.CharField(max_length=200)),
+                ('trigram', models.CharField(max_length=3)),
+                ('trigrams_count', models.PositiveSmallIntegerField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='name_trigrams', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['trigram', 'trigrams_count'], name='users_trigram_idx')],
+                'unique_together': {('user', 'word', 'trigram')},
+            },
+        ),
+        migrations.RunPython(index_users, migrations.RunPython.noop),
+    ]
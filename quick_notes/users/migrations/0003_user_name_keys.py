@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:40
+
+import unicodedata
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Kept in step with `CustomUser.search_name_fields`
+NAME_FIELDS = ('username', 'firstname', 'lastname', 'other_name')
+# As in `users.autocomplete`, at the time of this migration
+MAX_KEY_LENGTH = 200
+
+
+def normalize_name(text: str) -> str:
+    '''Lowercases `text`, strips its accents and collapses its whitespace'''
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(character for character in decomposed if not unicodedata.combining(character))
+    return ' '.join(stripped.casefold().split())
+
+
+def get_name_keys(names: list) -> dict:
+    '''Returns the keys a user is suggested by, each name and its words after the first, with their best rank'''
+    keys = {}
+
+    def add(key: str, rank: int):
+        key = key[:MAX_KEY_LENGTH]
+        keys[key] = min(rank, keys.get(key, rank))
+
+    for position, name in enumerate(names):
+        name = normalize_name(name or '')
+        if not name:
+            continue
+        add(name, position)
+
+        words = name.split(' ')
+        for index in range(1, len(words)):
+            add(' '.join(words[index:]), len(names) + position)
+    return keys
+
+
+def index_users(apps, schema_editor):
+    '''Fills the prefix index of the names of existing users'''
+    User = apps.get_model('users', 'CustomUser')
+    UserNameKey = apps.get_model('users', 'UserNameKey')
+    names = User.objects.values_list('pk', *NAME_FIELDS)
+
+    entries = []
+    for pk, *fields in names.iterator():
+        entries.extend(UserNameKey(user_id=pk, key=key, rank=rank) for key, rank in get_name_keys(fields).items())
+    UserNameKey.objects.bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_trigrams'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserNameKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=200)),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='name_keys', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['rank', 'key'], name='users_name_key_idx')],
+                'unique_together': {('user', 'key')},
+            },
+        ),
+        migrations.RunPython(index_users, migrations.RunPython.noop),
+    ]
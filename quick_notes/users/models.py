@@ -2,7 +2,7 @@ from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
 
 
-from .managers import AbstractBaseUserManager
+from .managers import AbstractBaseUserManager, UserTrigramManager, UserNameKeyManager
 from .gpm import GroupPermissionManager
 from api.validators import required_field
 
@@ -29,6 +29,9 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
 
     objects = AbstractBaseUserManager()
 
+    # Fields matched by fuzzy searches and autocompletion, most important first
+    search_name_fields = ('username', 'firstname', 'lastname', 'other_name')
+
 
     def __str__(self):
         return self.username
@@ -44,6 +47,10 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     def save(self, *args, **kwargs):
         self.is_staff = any((self.is_admin, self.is_superuser))
         super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields', None)
+        if update_fields is None or not set(self.search_name_fields).isdisjoint(update_fields):
+            UserTrigram.objects.index(self)
+            UserNameKey.objects.index(self)
         admin_perm_manager = GroupPermissionManager('Admin')
         admin_perm_manager.ActiveUserModel = self.__class__
 
@@ -54,5 +61,50 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
 
 
 
+class UserTrigram(models.Model):
+    '''
+    An entry of the trigram index of users' names, used by fuzzy searches.
+
+    Holds one trigram of a word of a user's names, along with the number of trigrams of the word.
+    '''
+
+    user = models.ForeignKey(CustomUser, related_name='name_trigrams', on_delete=models.CASCADE)
+    word = models.CharField(max_length=200)
+    trigram = models.CharField(max_length=3)
+    trigrams_count = models.PositiveSmallIntegerField()
+
+    objects = UserTrigramManager()
+
+    class Meta:
+        unique_together = ('user', 'word', 'trigram')
+        indexes = [
+            models.Index(fields=['trigram', 'trigrams_count'], name='users_trigram_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.trigram!r} of {self.word}"
+
+
+
+class UserNameKey(models.Model):
+    '''
+    An entry of the prefix index of users' names, used to autocomplete them.
+
+    Holds a normalized name of a user, or the words of a name after its first, along with its rank.
+    Entries are indexed by rank and key, so the users with a name starting with a prefix are read as a range.
+    '''
 
+    user = models.ForeignKey(CustomUser, related_name='name_keys', on_delete=models.CASCADE)
+    key = models.CharField(max_length=200)
+    rank = models.PositiveSmallIntegerField()
 
+    objects = UserNameKeyManager()
+
+    class Meta:
+        unique_together = ('user', 'key')
+        indexes = [
+            models.Index(fields=['rank', 'key'], name='users_name_key_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} of {self.user}"
@@ -5,11 +5,20 @@ from django.contrib.auth.password_validation import validate_password
 
 
 from .models import CustomUser
+from api.fields import TemplatedHyperlinkedIdentityField, reverse_templated
+from api.serializers import SparseFieldsetMixin
 
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     '''User model serializer'''
+    # Fields read from the annotations of `UserQuerySet.with_note_stats`
+    note_stats_annotations = {
+        'number_of_notes': 'notes_count',
+        'number_of_starred_notes': 'starred_notes_count',
+        'last_created_note': 'last_created_note_slug',
+        'last_edited_note': 'last_edited_note_slug',
+    }
     username = serializers.CharField(required=True)
     firstname = serializers.CharField(required=True)
     lastname = serializers.CharField(required=True)
@@ -18,8 +27,8 @@ class UserSerializer(serializers.ModelSerializer):
     number_of_starred_notes = serializers.SerializerMethodField(read_only=True)
     last_created_note = serializers.SerializerMethodField(read_only=True)
     last_edited_note = serializers.SerializerMethodField(read_only=True)
-    url = serializers.HyperlinkedIdentityField(view_name='account-detail', read_only=True, lookup_field='username')
-    edit_url = serializers.HyperlinkedIdentityField(view_name='account-update', read_only=True, lookup_field='username')
+    url = TemplatedHyperlinkedIdentityField(view_name='account-detail', read_only=True, lookup_field='username')
+    edit_url = TemplatedHyperlinkedIdentityField(view_name='account-update', read_only=True, lookup_field='username')
     password = serializers.CharField(write_only=True)
     confirm_password = serializers.CharField(write_only=True, label="Confirm password")
 
@@ -69,10 +78,17 @@ class UserSerializer(serializers.ModelSerializer):
         validated_data['other_name'] = validated_data.get('other_name', '').strip()
         return validated_data
 
+    # The `get_*` methods of the notes statistics read the annotations of `UserQuerySet.with_note_stats`,
+    # and query them for users that were not annotated
+
     def get_number_of_notes(self, user):
+        if hasattr(user, 'notes_count'):
+            return user.notes_count
         return user.notes.count()
 
     def get_number_of_starred_notes(self, user):
+        if hasattr(user, 'starred_notes_count'):
+            return user.starred_notes_count
         return user.notes.filter(starred=True).count()
 
 
@@ -81,21 +97,25 @@ class UserSerializer(serializers.ModelSerializer):
 
 
     def get_last_created_note(self, user):
-        note = user.notes.order_by('-date_created').first()
-        request = self.context.get('request')
-
-        if note:
-            return reverse(viewname='note-detail', kwargs={'slug': note.slug}, request=request)
-        return None
+        if hasattr(user, 'last_created_note_slug'):
+            slug = user.last_created_note_slug
+        else:
+            slug = user.notes.order_by('-date_created', '-pk').values_list('slug', flat=True).first()
+        return self.get_note_url(slug)
 
 
     def get_last_edited_note(self, user):
-        note = user.notes.order_by('-date_created').first()
-        request = self.context.get('request')
+        if hasattr(user, 'last_edited_note_slug'):
+            slug = user.last_edited_note_slug
+        else:
+            slug = user.notes.order_by('-last_edited', '-pk').values_list('slug', flat=True).first()
+        return self.get_note_url(slug)
 
-        if note:
-            return reverse(viewname='note-detail', kwargs={'slug': note.slug}, request=request)
-        return None
+
+    def get_note_url(self, slug):
+        if slug is None:
+            return None
+        return reverse_templated('note-detail', 'slug', slug, self.context.get('request'))
 
 
 class StrippedUserSerializer(UserSerializer):
@@ -120,8 +140,21 @@ class StrippedUserSerializer(UserSerializer):
         return f"{user.last_login.date()} at {user.last_login.time()}"
 
 
+class UserSuggestionSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    '''Serializes the users suggested by account autocompletion'''
+    url = TemplatedHyperlinkedIdentityField(view_name='account-detail', read_only=True, lookup_field='username')
+
+    class Meta:
+        model = CustomUser
+        fields = [
+            'username',
+            'fullname',
+            'url',
+        ]
+
+
 class UserChangeSerializer(UserSerializer):
-    new_detail_url = serializers.HyperlinkedIdentityField(view_name='account-detail', read_only=True, lookup_field='username')
+    new_detail_url = TemplatedHyperlinkedIdentityField(view_name='account-detail', read_only=True, lookup_field='username')
     class Meta(UserSerializer.Meta):
         fields = [
             'username',
@@ -1,3 +1,147 @@
-from django.test import TestCase
+import datetime
+import importlib
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from notes.models import Note
+
+from .autocomplete import get_name_keys
+
+User = get_user_model()
+
+
+def create_user(username: str, **other_fields):
+    return User.objects.create_user(
+        username=username, firstname=username.capitalize(), lastname='Tester',
+        email=f'{username}@example.com', password='a-long-password', **other_fields
+    )
+
+
+@override_settings(NOTES_CONFIG={"INDEX_IN_BACKGROUND": False})
+class UserNoteStatsTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin', is_admin=True, is_staff=True)
+        cls.users = [create_user(f'user{index}') for index in range(12)]
+        for index, user in enumerate(cls.users):
+            for number in range(index % 4):
+                Note.objects.create(title=f'Note {number}', owner=user, starred=number == 0, note_content=[])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_list_query_count_does_not_grow_with_page_size(self):
+        url = reverse('account-list')
+        # The count of users and the page of users with their statistics
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'limit': 2})
+        self.assertEqual(len(response.data['results']), 2)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'limit': 50})
+        self.assertEqual(len(response.data['results']), len(self.users) + 1)
+
+    def test_search_query_count_does_not_grow_with_page_size(self):
+        url = reverse('account-find')
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'q': 'user', 'limit': 2, 'fuzzy': 'false'})
+        self.assertEqual(len(response.data['results']), 2)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'q': 'user', 'limit': 50, 'fuzzy': 'false'})
+        self.assertEqual(len(response.data['results']), len(self.users))
+
+    def test_annotations_match_queries(self):
+        user = self.users[3]
+        first, second = Note.objects.filter(owner=user).order_by('date_created', 'pk')[:2]
+        # Edited after it was created, so the last edited note is not the last created one
+        Note.objects.filter(pk=first.pk).update(last_edited=timezone.now() + datetime.timedelta(minutes=1))
+
+        annotated = User.objects.with_note_stats().get(pk=user.pk)
+        self.assertEqual(annotated.notes_count, 3)
+        self.assertEqual(annotated.starred_notes_count, 1)
+        self.assertEqual(annotated.last_created_note_slug, Note.objects.filter(owner=user).order_by('-date_created', '-pk')[0].slug)
+        self.assertEqual(annotated.last_edited_note_slug, first.slug)
+
+        without_notes = User.objects.with_note_stats().get(pk=self.users[0].pk)
+        self.assertEqual((without_notes.notes_count, without_notes.starred_notes_count), (0, 0))
+        self.assertIsNone(without_notes.last_created_note_slug)
+
+        self.client.force_authenticate(user)
+        response = self.client.get(reverse('account-detail', kwargs={'username': user.username}))
+        self.assertEqual(response.data['number_of_notes'], 3)
+        self.assertEqual(response.data['number_of_starred_notes'], 1)
+        self.assertTrue(response.data['last_edited_note'].endswith(f'/{first.slug}/'))
+
+    def test_unrequested_statistics_are_not_queried(self):
+        url = reverse('account-detail', kwargs={'username': self.admin.username})
+        with self.assertNumQueries(1) as context:
+            response = self.client.get(url, {'fields': 'username,number_of_notes'})
+        self.assertEqual(response.data, {'username': 'admin', 'number_of_notes': 0})
+        # The statistics are subqueries of the query of the user
+        self.assertEqual(context.captured_queries[-1]['sql'].count('SELECT'), 2)
+
+        response = self.client.get(url, {'fields': 'username,unknown'})
+        self.assertEqual(response.status_code, 400)
+
+
+class UserAutocompleteTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin', is_admin=True, is_staff=True)
+        cls.member = create_user('member')
+        # Matches of "da" by username, first name, last name and a later word of the other name
+        for username, name, value in (
+            ('dave', None, None), ('danielle', None, None), ('zed', 'firstname', 'Daniel'),
+            ('carl', 'lastname', 'Dancer'), ('bob', 'other_name', 'Mary Dan'),
+        ):
+            user = create_user(username)
+            if name is not None:
+                setattr(user, name, value)
+                user.save()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.url = reverse('account-autocomplete')
+
+    def get_usernames(self, **params) -> list:
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [suggestion['username'] for suggestion in response.data]
+
+    def test_suggestions_are_ranked_by_the_name_that_matched(self):
+        self.assertEqual(self.get_usernames(q='Da'), ['danielle', 'dave', 'zed', 'carl', 'bob'])
+        self.assertEqual(self.get_usernames(q='dan'), ['danielle', 'zed', 'carl', 'bob'])
+        self.assertEqual(self.get_usernames(q='mary d'), ['bob'])
+        self.assertEqual(self.get_usernames(q=''), [])
+
+    def test_limit(self):
+        self.assertEqual(self.get_usernames(q='da', limit=2), ['danielle', 'dave'])
+        self.assertEqual(self.get_usernames(q='da', limit=1), ['danielle'])
+        self.assertEqual(len(self.get_usernames(q='da', limit=50)), 5)
+
+        for limit in (0, -1, 51, 'ten'):
+            with self.subTest(limit=limit):
+                response = self.client.get(self.url, {'q': 'da', 'limit': limit})
+                self.assertEqual(response.status_code, 400)
+
+    def test_only_admins_get_suggestions(self):
+        self.client.force_authenticate(self.member)
+        self.assertEqual(self.client.get(self.url, {'q': 'da'}).status_code, 403)
+
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(self.url, {'q': 'da'}).status_code, 403)
+
+    def test_migration_finds_keys_as_users_do(self):
+        migration = importlib.import_module('users.migrations.0003_user_name_keys')
+        for names in (['Tolu', 'José', '  Mary   Ann ', None], ['dan', 'Dan', 'x' * 250], []):
+            with self.subTest(names=names):
+                self.assertEqual(migration.get_name_keys(names), get_name_keys(names))
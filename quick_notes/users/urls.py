@@ -9,6 +9,7 @@ urlpatterns = [
     path('create/', views.UserCreateAPIView.as_view(), name="account-create"),
     path('authenticate/', obtain_auth_token, name="account-authenticate"),
     path('find/', views.UserSearchAPIView.as_view(), name="account-find"),
+    path('autocomplete/', views.UserAutocompleteAPIView.as_view(), name="account-autocomplete"),
     path('<str:username>/', views.UserDetailAPIView.as_view(), name="account-detail"),
     path('<str:username>/update/', views.UserUpdateAPIView.as_view(), name="account-update"),
     path('<str:username>/change-password/', views.PasswordChangeAPIView.as_view(), name="account-change-password"),
@@ -3,33 +3,50 @@ from django.contrib.auth import get_user_model
 from rest_framework import generics, exceptions
 
 
-from .serializers import UserSerializer, StrippedUserSerializer, UserChangeSerializer, PasswordChangeSerializer
+from .serializers import UserSerializer, StrippedUserSerializer, UserChangeSerializer, PasswordChangeSerializer, UserSuggestionSerializer
 from api.permissions import IsAdministratorOrSuperuser
-from api.mixins import UsernameLookupMixin, AllowUserOrSuperuserMixin, AllowUserOnlyMixin
+from api.mixins import UsernameLookupMixin, AllowUserOrSuperuserMixin, AllowUserOnlyMixin, FuzzySearchMixin, SparseFieldsMixin
 User = get_user_model()
 
 global_queryset = User.objects.all()
 
 
 
-class UserListAPIView(UsernameLookupMixin, generics.ListAPIView):
+class NoteStatsMixin(SparseFieldsMixin):
+    '''
+    Annotates users with the statistics of their notes that are serialized, see `UserQuerySet.with_note_stats`.
+
+    Statistics of fields the serializer does not have, or that are left out by `?fields=` and `?exclude=`, are not queried.
+    '''
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        names = [
+            annotation for field, annotation in getattr(serializer_class, 'note_stats_annotations', {}).items()
+            if field in serializer_class.Meta.fields and self.is_field_requested(field)
+        ]
+        return qs.with_note_stats(*names) if names else qs
+
+
+class UserListAPIView(NoteStatsMixin, UsernameLookupMixin, generics.ListAPIView):
     serializer_class = StrippedUserSerializer
     queryset = global_queryset
     permission_classes = [IsAdministratorOrSuperuser]
 
 
-class UserCreateAPIView(UsernameLookupMixin, generics.CreateAPIView):
+class UserCreateAPIView(SparseFieldsMixin, UsernameLookupMixin, generics.CreateAPIView):
     serializer_class = UserSerializer
     queryset = global_queryset
     permission_classes = []
 
 
-class UserDetailAPIView(AllowUserOrSuperuserMixin, UsernameLookupMixin, generics.RetrieveAPIView):
+class UserDetailAPIView(NoteStatsMixin, AllowUserOrSuperuserMixin, UsernameLookupMixin, generics.RetrieveAPIView):
     serializer_class = UserSerializer
     queryset = global_queryset
 
 
-class UserUpdateAPIView(AllowUserOrSuperuserMixin, UsernameLookupMixin, generics.UpdateAPIView):
+class UserUpdateAPIView(SparseFieldsMixin, AllowUserOrSuperuserMixin, UsernameLookupMixin, generics.UpdateAPIView):
     serializer_class = UserChangeSerializer
     queryset = global_queryset
 
@@ -62,7 +79,7 @@ class UserDeleteAPIView(AllowUserOrSuperuserMixin, UsernameLookupMixin, generics
 
 
 
-class PasswordChangeAPIView(AllowUserOnlyMixin, UsernameLookupMixin, generics.UpdateAPIView):
+class PasswordChangeAPIView(SparseFieldsMixin, AllowUserOnlyMixin, UsernameLookupMixin, generics.UpdateAPIView):
     serializer_class = PasswordChangeSerializer
     queryset = global_queryset
     http_method_names = ['patch']
@@ -79,7 +96,7 @@ class PasswordChangeAPIView(AllowUserOnlyMixin, UsernameLookupMixin, generics.Up
         raise exceptions.ValidationError('Username does not match this account')
 
 
-class UserSearchAPIView(UserListAPIView):
+class UserSearchAPIView(FuzzySearchMixin, UserListAPIView):
     permission_classes = [IsAdministratorOrSuperuser]
 
     def get_queryset(self):
@@ -88,8 +105,32 @@ class UserSearchAPIView(UserListAPIView):
         if not query:
             return User.objects.none()
             
-        qs = super().get_queryset().search(query)
+        qs = self.search(super().get_queryset(), query)
         return qs
 
-    
 
+class UserAutocompleteAPIView(UserListAPIView):
+    '''
+    Suggests the users with a name starting with `?q=`, best first.
+
+    `?limit=` takes the number of suggestions, from 1 to `max_limit`. Suggestions are not paginated.
+    '''
+    serializer_class = UserSuggestionSerializer
+    pagination_class = None
+    default_limit = 10
+    max_limit = 50
+
+    def get_queryset(self):
+        query = self.request.GET.get('q')
+        limit = self.request.GET.get('limit', self.default_limit)
+
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise exceptions.ValidationError(f"Invalid `limit` value: {limit}")
+        if not 1 <= limit <= self.max_limit:
+            raise exceptions.ValidationError(f"`limit` should be from 1 to {self.max_limit}")
+
+        if not query:
+            return []
+        return User.objects.autocomplete(query, limit)